@@ -1,6 +1,7 @@
 import os
 
 from evaluate_corefud import call_scorer
+from scorer.base.reader import Reader
 
 
 def evaluate(data_ground_truth_path, data_submission_path):
@@ -9,5 +10,5 @@ def evaluate(data_ground_truth_path, data_submission_path):
 		metrics = call_scorer(os.path.join(".", data_ground_truth_path, "coref149.conllu"),
 							  os.path.join(".", data_submission_path, "submission.conllu"))
 		return metrics
-	except Exception as e:
+	except (Exception, Reader.DataAlignError, Reader.CorefFormatError) as e:
 		raise Exception(f'Exception in metric calculation: {e}')
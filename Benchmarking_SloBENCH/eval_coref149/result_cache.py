@@ -0,0 +1,194 @@
+"""On-disk cache of the scores, so that a submission scored before is not scored again.
+
+An entry is stored under the hash of everything the scores depend on: the content of the ground truth
+and the prediction files, the scorer arguments and the version of the scorer (scorer_version.txt). A
+byte-identical resubmission is thus found in the cache, whatever the name of the files.
+
+The counts of the metrics of single documents are cached the same way by DocumentCountCache, under the hash
+of the clusters of the document. When a few documents of a submission change, only these are evaluated again.
+
+Entries are written to a temporary file first and then renamed, so that an incomplete entry is never read,
+and many processes can use the same cache directory. When the cache grows over its size limit, the least
+recently used entries are removed (an entry is marked as used by the modification time of its file).
+"""
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+try:
+	import fcntl
+except ImportError:
+	# no locking of the eviction (e.g. on Windows), concurrent evictions only remove more entries than needed
+	fcntl = None
+
+from scorer.corefud.bundle import file_hash
+
+CACHE_VERSION = 1
+
+# the scorer arguments that do not change the scores
+_IGNORED_ARGS = {"key_file", "sys_file", "jobs", "streaming", "key_bundle_dir", "count_cache_dir"}
+
+
+def read_scorer_version():
+	path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scorer_version.txt")
+	if not os.path.exists(path):
+		return ""
+	with open(path, encoding="utf-8") as f:
+		return f.read().strip()
+
+
+SCORER_VERSION = read_scorer_version()
+
+
+def normalize_args(args):
+	"""Returns the scorer arguments (processed by ua-scorer) that the scores depend on, as JSON-serializable values."""
+	normalized = {}
+	for name, value in args.items():
+		if name in _IGNORED_ARGS:
+			continue
+		if name == "metrics":
+			# (name, metric function) tuples after process_arguments
+			value = [metric if isinstance(metric, str) else metric[0] for metric in value]
+		normalized[name] = value
+	return normalized
+
+
+class ResultCache:
+	SUFFIX = ".json"
+
+	def __init__(self, cache_dir, max_size=64 << 20):
+		self.cache_dir = cache_dir
+		# the size limit of all the entries, in bytes
+		self.max_size = max_size
+
+	def get_key(self, args):
+		data = {
+			"cache_version": CACHE_VERSION,
+			"scorer_version": SCORER_VERSION,
+			"key_hash": file_hash(args["key_file"]),
+			"sys_hash": file_hash(args["sys_file"]),
+			"args": normalize_args(args)
+		}
+		return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+	def _get_path(self, key):
+		return os.path.join(self.cache_dir, key + self.SUFFIX)
+
+	def _load(self, path):
+		with open(path, encoding="utf-8") as f:
+			return json.load(f)
+
+	def _dump(self, value, fd):
+		with os.fdopen(fd, "w", encoding="utf-8") as f:
+			json.dump(value, f)
+
+	def get(self, key):
+		"""Returns the cached metrics, or None if they are not in the cache."""
+		path = self._get_path(key)
+		try:
+			value = self._load(path)
+			os.utime(path)
+		except (OSError, ValueError, EOFError, pickle.UnpicklingError):
+			# missing, just evicted by another process or unreadable
+			return None
+		return value
+
+	def write(self, key, value):
+		os.makedirs(self.cache_dir, exist_ok=True)
+		fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+		try:
+			self._dump(value, fd)
+			os.replace(tmp_path, self._get_path(key))
+		except BaseException:
+			os.remove(tmp_path)
+			raise
+
+	def put(self, key, metrics):
+		self.write(key, metrics)
+		self.evict()
+
+	def evict(self):
+		"""Removes the least recently used entries until the cache fits into max_size."""
+		with open(os.path.join(self.cache_dir, ".lock"), "w") as lock:
+			if fcntl is not None:
+				fcntl.flock(lock, fcntl.LOCK_EX)
+			entries = []
+			total_size = 0
+			with os.scandir(self.cache_dir) as it:
+				for entry in it:
+					if not entry.name.endswith(self.SUFFIX):
+						continue
+					try:
+						stat = entry.stat()
+					except FileNotFoundError:
+						continue
+					entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+					total_size += stat.st_size
+			if total_size <= self.max_size:
+				return
+			entries.sort()
+			for _, size, path in entries:
+				try:
+					os.remove(path)
+				except FileNotFoundError:
+					pass
+				total_size -= size
+				if total_size <= self.max_size:
+					break
+
+	def score(self, score_function, args, **kwargs):
+		"""Returns the cached metrics of the args, or calls score_function(args, **kwargs) and caches them."""
+		key = self.get_key(args)
+		metrics = self.get(key)
+		if metrics is None:
+			# plain floats, the same as read from the cache
+			metrics = {name: float(value) for name, value in score_function(args, **kwargs).items()}
+			try:
+				self.put(key, metrics)
+			except OSError:
+				# the scores are still returned when the cache directory is not writable
+				pass
+		return metrics
+
+
+class DocumentCountCache(ResultCache):
+	"""The counts of the metrics of single documents (see scorer.eval.evaluator.get_document_counts), stored under
+	the hash of the key and sys clusters of the document and the scorer arguments. It is passed as count_cache to
+	scorer.eval.evaluator.evaluate_streamed_metrics.
+
+	The eviction runs only when evict() is called, e.g. once the whole submission is scored, not after every document.
+	"""
+	SUFFIX = ".pkl"
+
+	def __init__(self, cache_dir, args, max_size=256 << 20):
+		super().__init__(cache_dir, max_size=max_size)
+		data = {
+			"cache_version": CACHE_VERSION,
+			"scorer_version": SCORER_VERSION,
+			"args": normalize_args(args)
+		}
+		self.settings_hash = hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+	def get_key(self, coref_info):
+		key_clusters, sys_clusters = coref_info[0], coref_info[1]
+		clusters = ([[m.fingerprint() for m in cluster] for cluster in key_clusters],
+					[[m.fingerprint() for m in cluster] for cluster in sys_clusters])
+		return hashlib.sha256((self.settings_hash + repr(clusters)).encode("utf-8")).hexdigest()
+
+	def _load(self, path):
+		with open(path, "rb") as f:
+			return pickle.load(f)
+
+	def _dump(self, value, fd):
+		# pickled to keep the exact types of the counts, so that their sums are the same as without the cache
+		with os.fdopen(fd, "wb") as f:
+			pickle.dump(value, f)
+
+	def put(self, key, doc_counts):
+		try:
+			self.write(key, doc_counts)
+		except OSError:
+			# the document is evaluated again next time
+			pass
@@ -0,0 +1,95 @@
+"""Maximum score assignment for sparse score matrices.
+
+The matrices aligned by the scorer (mention match scores, CEAF similarities, mention
+overlaps and split-antecedent F-scores) are mostly zeros. Rows and columns that are not
+connected by a nonzero score cannot affect each other's assignment, so the matrix is split
+into the connected components of its nonzero scores and every block is solved separately.
+Blocks with a single row or column are resolved directly, without calling the solver.
+
+Which of several equally good assignments linear_sum_assignment returns depends on the whole
+matrix, so if any block has more than one optimal assignment, the whole matrix is solved at
+once as before, to keep the tie-breaking unchanged. Checking a block for ties solves it again
+once per assigned pair, so the whole matrix is also solved at once if a block has more than
+MAX_CHECKED_PAIRS pairs.
+"""
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+# the largest number of assigned pairs of a block checked for other optimal assignments
+MAX_CHECKED_PAIRS = 64
+
+
+def _is_tie(value, other_value):
+    return other_value >= value - 1e-9 * max(1.0, abs(value))
+
+
+def _solve_block(block):
+    """Optimal assignment of a block, or None if it is not the only optimal one (or too large to check)."""
+    if block.shape[0] == 1 or block.shape[1] == 1:
+        values = block.ravel()
+        best = int(np.argmax(values))
+        if np.count_nonzero([_is_tie(values[best], v) for v in values]) > 1:
+            return None
+        row, col = np.unravel_index(best, block.shape)
+        return np.array([row]), np.array([col])
+    if min(block.shape) > MAX_CHECKED_PAIRS:
+        return None
+
+    row_ind, col_ind = linear_sum_assignment(block, maximize=True)
+    value = block[row_ind, col_ind].sum()
+    # any other optimal assignment leaves out (at least) one of the assigned pairs
+    for r, c in zip(row_ind, col_ind):
+        score = block[r, c]
+        if score > 0:
+            block[r, c] = 0
+            other_row_ind, other_col_ind = linear_sum_assignment(block, maximize=True)
+            other_value = block[other_row_ind, other_col_ind].sum()
+            block[r, c] = score
+            if _is_tie(value, other_value):
+                return None
+    return row_ind, col_ind
+
+
+def max_score_assignment(scores):
+    """Assignment of rows to columns with the maximal total score.
+
+    `scores` is a dense or sparse matrix of non-negative scores. Returns the same
+    as `linear_sum_assignment(scores, maximize=True)` for all the nonzero scores, i.e. the row
+    indices (in increasing order) and the assigned column indices of min(n_rows, n_cols) pairs.
+    Rows and columns left without a nonzero score are paired up in their order.
+    """
+    scores = coo_matrix(scores)
+    scores.eliminate_zeros()
+    n_rows, n_cols = scores.shape
+    assigned_rows, assigned_cols = [], []
+
+    if scores.nnz:
+        graph = coo_matrix((np.ones(scores.nnz), (scores.row, scores.col + n_rows)),
+                           shape=(n_rows + n_cols, n_rows + n_cols))
+        _, labels = connected_components(graph, directed=False)
+        # nonzero entries grouped by their component
+        order = np.argsort(labels[scores.row], kind='stable')
+        entry_rows, entry_cols, entry_scores = scores.row[order], scores.col[order], scores.data[order]
+        bounds = np.flatnonzero(np.diff(labels[entry_rows])) + 1
+        for rows, cols, values in zip(np.split(entry_rows, bounds), np.split(entry_cols, bounds),
+                                      np.split(entry_scores, bounds)):
+            block_rows, row_ind = np.unique(rows, return_inverse=True)
+            block_cols, col_ind = np.unique(cols, return_inverse=True)
+            block = np.zeros((len(block_rows), len(block_cols)))
+            block[row_ind, col_ind] = values
+            assignment = _solve_block(block)
+            if assignment is None:
+                return linear_sum_assignment(scores.toarray(), maximize=True)
+            assigned_rows.extend(block_rows[assignment[0]])
+            assigned_cols.extend(block_cols[assignment[1]])
+
+    # pair up the remaining rows and columns, their scores are all zero
+    free_rows = np.setdiff1d(np.arange(n_rows), assigned_rows)
+    free_cols = np.setdiff1d(np.arange(n_cols), assigned_cols)
+    n_free = min(len(free_rows), len(free_cols))
+    row_ind = np.concatenate((np.asarray(assigned_rows, dtype=np.intp), free_rows[:n_free]))
+    col_ind = np.concatenate((np.asarray(assigned_cols, dtype=np.intp), free_cols[:n_free]))
+    order = np.argsort(row_ind, kind='stable')
+    return row_ind[order], col_ind[order]
@@ -1,6 +1,7 @@
 import logging
+from itertools import zip_longest
 from scorer.conll import mention as mention
-from scorer.base.reader import Reader
+from scorer.base.reader import CorefInfo, Reader
 
 
 class CoNLLReader(Reader):
@@ -318,6 +319,37 @@ class CoNLLReader(Reader):
 
         return doc_lines
 
+    def iter_doc_lines(self, file_name):
+        """Yields the (doc_name, doc_lines) of the documents one by one, as they are read by get_doc_lines,
+        except that the parts of a document are not joined if its name is repeated.
+        """
+        doc_name = None
+        doc_lines = None
+
+        with open(file_name) as f:
+            new_sentence = True
+            for line in f:
+                if line.startswith("#begin document"):
+                    doc_name = line[len("#begin document "):]
+                    doc_lines = []
+                elif line.startswith("#end document"):
+                    if doc_name and doc_lines:
+                        yield doc_name, doc_lines
+                    doc_name = None
+
+                elif doc_name:
+                    if (not line.strip()
+                        and not new_sentence) or not doc_lines:
+                        doc_lines.append([])
+
+                    if line.strip():
+                        new_sentence = False
+                        doc_lines[-1].append(line)
+                    else:
+                        new_sentence = True
+        if doc_name and doc_lines:
+            yield doc_name, doc_lines
+
     def remove_nested_coref_mentions(self, clusters):
         to_be_removed_mentions = {}
         to_be_removed_clusters = []
@@ -362,11 +394,7 @@ class CoNLLReader(Reader):
 
         return all_removed_mentions, all_removed_clusters
 
-    def get_coref_infos(self, key_file, sys_file):
-
-        key_doc_lines = self.get_doc_lines(key_file)
-        sys_doc_lines = self.get_doc_lines(sys_file)
-
+    def get_docs(self, key_file, sys_file):
         key_nested_coref_num = 0
         sys_nested_coref_num = 0
         key_removed_nested_clusters = 0
@@ -374,21 +402,21 @@ class CoNLLReader(Reader):
         key_singletons_num = 0
         sys_singletons_num = 0
 
-        for doc in key_doc_lines:
+        for doc, key_doc_lines, sys_doc_lines in self.get_aligned_docs(key_file, sys_file):
 
-            key_clusters, singletons_num = self.get_doc_mentions(key_doc_lines[doc])
+            key_clusters, singletons_num = self.get_doc_mentions(key_doc_lines)
             key_singletons_num += singletons_num
 
             if self.np_only or self.matching != "exact":
                 key_clusters = self.set_annotated_parse_trees(key_clusters,
-                                                              key_doc_lines[doc])
+                                                              key_doc_lines)
 
-            sys_clusters, singletons_num = self.get_doc_mentions(sys_doc_lines[doc])
+            sys_clusters, singletons_num = self.get_doc_mentions(sys_doc_lines)
             sys_singletons_num += singletons_num
 
             if self.np_only or self.matching != "exact":
                 sys_clusters = self.set_annotated_parse_trees(sys_clusters,
-                                                              key_doc_lines[doc])
+                                                              key_doc_lines)
 
             if self.remove_nested_mentions:
                 nested_mentions, removed_clusters = self.remove_nested_coref_mentions(
@@ -400,14 +428,7 @@ class CoNLLReader(Reader):
                 sys_nested_coref_num += nested_mentions
                 sys_removed_nested_clusters += removed_clusters
 
-            sys_mention_key_cluster, key_mention_sys_cluster, partial_match_dict, mention_aligns = self.get_mention_assignments(
-                key_clusters, sys_clusters)
-
-            # store the mention alignments so that it can be used for analysis
-            self._doc_mention_aligns[doc] = mention_aligns
-
-            self._doc_coref_infos[doc] = (key_clusters, sys_clusters,
-                                          key_mention_sys_cluster, sys_mention_key_cluster, partial_match_dict)
+            yield doc, key_clusters, sys_clusters, None
 
         if self.remove_nested_mentions:
             logging.warning('Number of removed nested coreferring mentions in the key '
@@ -420,3 +441,31 @@ class CoNLLReader(Reader):
         if not self.keep_singletons:
             logging.warning('%d and %d singletons are removed from the key and system '
                             'files, respectively' % (key_singletons_num, sys_singletons_num))
+
+    def set_doc_infos(self, doc, key_clusters, sys_clusters, assignments, doc_data):
+        sys_mention_key_cluster, key_mention_sys_cluster, partial_match_dict, mention_aligns = assignments
+
+        # store the mention alignments so that it can be used for analysis
+        self._doc_mention_aligns[doc] = mention_aligns
+
+        # the conll format has no split antecedents
+        self._doc_coref_infos[doc] = CorefInfo(key_clusters, sys_clusters, key_mention_sys_cluster,
+                                               sys_mention_key_cluster, partial_match_dict, has_split_antecedents=False)
+
+    def get_aligned_docs(self, key_file, sys_file):
+        """Yields (doc_name, key_doc_lines, sys_doc_lines) of the documents in the order of the key file.
+        In the streaming mode, the documents must come in the same order in both files.
+        """
+        if not self.streaming:
+            key_doc_lines = self.get_doc_lines(key_file)
+            sys_doc_lines = self.get_doc_lines(sys_file)
+            for doc in key_doc_lines:
+                yield doc, key_doc_lines[doc], sys_doc_lines[doc]
+            return
+
+        for key_doc, sys_doc in zip_longest(self.iter_doc_lines(key_file), self.iter_doc_lines(sys_file)):
+            key_doc_name = key_doc[0] if key_doc else None
+            sys_doc_name = sys_doc[0] if sys_doc else None
+            if key_doc_name is None or key_doc_name != sys_doc_name:
+                raise self.DataAlignError(key_doc_name, sys_doc_name, "Documents", "doc in key", "doc in sys")
+            yield key_doc_name, key_doc[1], sys_doc[1]
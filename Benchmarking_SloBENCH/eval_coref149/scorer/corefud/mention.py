@@ -18,59 +18,67 @@ class CorefUDMention(Mention):
     class WordOrd:
         """Representation of a mention word for evaluation purposes.
         A word is defined only by its position within the document, i.e. ordinal number of the word within a sentence and the
-        sentence within the document. For this reason, comaprison operators are defined for the class.
+        sentence within the document. The position is packed into a single int, so that words can be compared, hashed and
+        stored as plain ints: position = sentence ord * SENT_SCALE + word ord * ORD_SCALE, where the word ord is scaled to
+        keep the decimals of empty nodes (e.g. 3.1). The order of the ints is the order of the words, and the positions of
+        the (non-empty) words are multiples of ORD_SCALE.
         """
+        ORD_SCALE = 100
+        SENT_SCALE = ORD_SCALE << 32
 
-        def __init__(self, node):
-            self._sentord = node.root.bundle.number
-            self._wordord = node.ord
+        @staticmethod
+        def position(node):
+            return node.root.bundle.number * CorefUDMention.WordOrd.SENT_SCALE \
+                + round(node.ord * CorefUDMention.WordOrd.ORD_SCALE)
 
-        def __lt__(self, other):
-            if isinstance(other, self.__class__):
-                if self._sentord == other._sentord:
-                    return self._wordord < other._wordord
-                else:
-                    return self._sentord < other._sentord
-            return NotImplemented
-
-        def __eq__(self, other):
-            if isinstance(other, self.__class__):
-                if self._sentord == other._sentord \
-                    and self._wordord == other._wordord:
-                    return True
-                else:
-                    return False
-            return NotImplemented
-
-        def __ne__(self, other):
-            return not self.__eq__(other)
-
-        def __le__(self, other):
-            return self.__lt__(other) or self.__eq__(other)
-
-        def __str__(self):
-            return f"{self._sentord}-{self._wordord}"
+        @staticmethod
+        def sentord(position):
+            return position // CorefUDMention.WordOrd.SENT_SCALE
 
-        def __repr__(self):
-            return str(self)
+        @staticmethod
+        def to_str(position):
+            sentord, wordord = divmod(position, CorefUDMention.WordOrd.SENT_SCALE)
+            wordord, decimals = divmod(wordord, CorefUDMention.WordOrd.ORD_SCALE)
+            if decimals:
+                return f"{sentord}-{wordord}.{decimals:02d}".rstrip("0")
+            return f"{sentord}-{wordord}"
 
-        def __hash__(self):
-            return hash((self._sentord, self._wordord))
+    __slots__ = ('_head_deps',)
+    WORD_STEP = WordOrd.ORD_SCALE
 
     def __init__(self, nodes, head, matching="head"):
         super().__init__(matching=matching)
-        self._words = [CorefUDMention.WordOrd(n) for n in nodes]
-        self._words.sort()
-        self._wordsset = set(self._words)
+        self._words = tuple(sorted(CorefUDMention.WordOrd.position(n) for n in nodes))
+        self._wordsset = frozenset(self._words)
         if head:
-            self._minset.add(CorefUDMention.WordOrd(head))
+            self._minset.add(CorefUDMention.WordOrd.position(head))
             self._is_zero = head.is_empty()
-            # head deps stored as a list of (parent WordOrd, deprel string) tuples
+            # head deps stored as a tuple of (parent word position, deprel string) tuples
             # TODO: storing head deps separately from the minset is not ideal
-            self._head_deps = [(CorefUDMention.WordOrd(dep["parent"]), dep["deprel"]) for dep in head.deps]
+            self._head_deps = tuple((CorefUDMention.WordOrd.position(dep["parent"]), dep["deprel"]) for dep in head.deps)
         else:
             self._is_zero = nodes[0].is_empty()
-            self._head_deps = [(CorefUDMention.WordOrd(dep["parent"]), dep["deprel"]) for dep in nodes[0].deps]
+            self._head_deps = tuple((CorefUDMention.WordOrd.position(dep["parent"]), dep["deprel"]) for dep in nodes[0].deps)
+
+    @classmethod
+    def from_positions(cls, words, head, head_deps, matching="head"):
+        """Creates the mention from the word positions (see WordOrd) instead of udapi nodes.
+        head_deps are (parent position, deprel) tuples of the DEPS column of the head.
+        """
+        mention = cls.__new__(cls)
+        Mention.__init__(mention, matching=matching)
+        mention._words = tuple(sorted(words))
+        mention._wordsset = frozenset(mention._words)
+        mention._minset.add(head)
+        mention._is_zero = head % CorefUDMention.WordOrd.ORD_SCALE != 0
+        mention._head_deps = head_deps
+        return mention
+
+    def _word_str(self, w):
+        return CorefUDMention.WordOrd.to_str(w)
+
+    def fingerprint(self):
+        return super().fingerprint() + (self._head_deps,)
 
     # head matching as defined in CRAC 2023 shared task
     # if there are multiple candidates sharing the same head
@@ -85,9 +93,20 @@ class CorefUDMention(Mention):
         # the head is guaranteed to be a single one
         assert len(self._minset) == 1
         if self._minset == other._minset:
-            return len(self._wordsset & other._wordsset) * 1.0 / len(self._wordsset)
+            return self.intersection_size(other) * 1.0 / len(self._wordsset)
         return 0.0
     
+    # zeros can only be matched within the same sentence
+    def match_index_keys(self, matching):
+        if matching == "zero-dependent" and self._minset:
+            return [CorefUDMention.WordOrd.sentord(next(iter(self._minset)))]
+        return super().match_index_keys(matching)
+
+    def match_lookup_keys(self, matching):
+        if matching == "zero-dependent" and self._minset:
+            return [CorefUDMention.WordOrd.sentord(next(iter(self._minset)))]
+        return super().match_lookup_keys(matching)
+
     def _f_score(self, set1, set2):
         common = set1 & set2
         p = len(common) / len(set1)
@@ -99,7 +118,7 @@ class CorefUDMention(Mention):
     def zero_dependent_match_score(self, other):
         self_head = list(self._minset).pop()
         other_head = list(other._minset).pop()
-        if self_head._sentord != other_head._sentord:
+        if CorefUDMention.WordOrd.sentord(self_head) != CorefUDMention.WordOrd.sentord(other_head):
             return 0.0
         score = 0.0
         # the f-score of predicting both parent and deprel of deps: weigh it by the factor 10
@@ -0,0 +1,93 @@
+"""Bootstrap confidence intervals of the metrics, computed from the counts of every document.
+
+The documents are resampled with replacement many times, and the metrics are computed on every sample.
+Instead of evaluating every sample again, the counts of the documents (see scorer.eval.doc_counts) are
+summed up: the samples are drawn as a matrix of document indices, turned into the number of times every
+document is drawn in every sample, and multiplied with the counts of the documents. The metrics of all the
+samples are then computed at once from the summed counts.
+"""
+import numpy as np
+
+from scorer.eval.doc_counts import CONLL_METRICS, PD, PN, RD, RN, get_metric_groups
+
+# the largest number of (sample, document) pairs drawn at once
+CHUNK_SIZE = 1 << 22
+
+
+def resample_counts(counts, n_samples, rng):
+    """The counts (pn, pd, rn, rd) of the metrics summed up over the documents of every sample,
+    an array of the shape (n_samples, metrics, 4) for the counts of the shape (documents, metrics, 4).
+    """
+    n_docs = counts.shape[0]
+    flat_counts = counts.reshape(n_docs, -1)
+    sums = np.empty((n_samples, flat_counts.shape[1]))
+    chunk = max(1, CHUNK_SIZE // max(n_docs, 1))
+    for start in range(0, n_samples, chunk):
+        size = min(chunk, n_samples - start)
+        indices = rng.integers(0, n_docs, size=(size, n_docs))
+        # the number of times every document is drawn in every sample
+        offsets = np.arange(size)[:, None] * n_docs
+        weights = np.bincount((indices + offsets).ravel(), minlength=size * n_docs).reshape(size, n_docs)
+        sums[start:start + size] = weights @ flat_counts
+    return sums.reshape(n_samples, *counts.shape[1:])
+
+
+def _get_prf(counts, beta=1):
+    # as Evaluator.get_prf, for an array of counts
+    pn, pd, rn, rd = counts[..., PN], counts[..., PD], counts[..., RN], counts[..., RD]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = np.where(pn == 0, 0.0, pn / pd)
+        r = np.where(rn == 0, 0.0, rn / rd)
+        f = np.where(p + r == 0, 0.0, (1 + beta * beta) * p * r / (beta * beta * p + r))
+    return p, r, f
+
+
+def get_sample_scores(metric_names, counts, beta=1):
+    """The metrics (named as by call_scorer) of every sample given by its summed counts (samples, metrics, 4).
+    As in scorer.eval.evaluator.get_scores, a metric with several evaluators (blanc) averages the scores of
+    the evaluators that count something.
+    """
+    scores = {}
+    for name, columns in get_metric_groups(metric_names).items():
+        if len(columns) == 1:
+            p, r, f = _get_prf(counts[:, columns[0]], beta)
+        else:
+            prfs = np.array([_get_prf(counts[:, column], beta) for column in columns])
+            counted = np.array([(counts[:, column, PD] != 0) | (counts[:, column, RD] != 0) for column in columns])
+            n_counted = counted.sum(axis=0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                p, r, f = (np.where(n_counted == 0, 0.0, (prfs[:, i] * counted).sum(axis=0) / n_counted)
+                           for i in range(3))
+        scores[f"Precision({name})"] = p
+        scores[f"Recall({name})"] = r
+        scores[f"F1({name})"] = f
+    if all(f"F1({name})" in scores for name in CONLL_METRICS):
+        scores["conll"] = sum(scores[f"F1({name})"] for name in CONLL_METRICS) / 3
+    return scores
+
+
+def bootstrap_intervals(doc_counts, n_samples=1000, confidence=0.95, seed=None, beta=1):
+    """Percentile bootstrap intervals of the metrics over n_samples resamples of the documents.
+
+    doc_counts is scorer.eval.doc_counts.DocumentCounts. Returns (lower, upper) by the name of the metric,
+    as named by call_scorer.
+    """
+    if not doc_counts.docnames:
+        raise ValueError("No documents to resample")
+    rng = np.random.default_rng(seed)
+    sample_scores = get_sample_scores(doc_counts.metric_names, resample_counts(doc_counts.counts, n_samples, rng),
+                                      beta=beta)
+    alpha = (1 - confidence) / 2
+    intervals = {}
+    for name, values in sample_scores.items():
+        lower, upper = np.quantile(values, [alpha, 1 - alpha])
+        intervals[name] = (float(lower), float(upper))
+    return intervals
+
+
+def format_intervals(metrics, intervals, confidence=0.95):
+    lines = ['{:g}% bootstrap confidence intervals:'.format(confidence * 100)]
+    for name, (lower, upper) in intervals.items():
+        value = '' if name not in metrics else '{:.2f} '.format(metrics[name] * 100)
+        lines.append('{:s}: {:s}[{:.2f}, {:.2f}]'.format(name, value, lower * 100, upper * 100))
+    return '\n'.join(lines)
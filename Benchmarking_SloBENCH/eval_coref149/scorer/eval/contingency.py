@@ -0,0 +1,176 @@
+"""Per-document contingency tables for the link-based metrics.
+
+MUC, B-cubed, LEA and BLANC only depend on how the mentions of each cluster are
+distributed over the clusters of the other side. A ContingencyTable resolves every
+mention once (through the non-exact mention alignment and the mention to cluster map)
+and keeps the result as a sparse clusters x other-side-clusters count matrix, so that
+the metrics can be computed as row/column reductions instead of mention pair loops.
+The CEAF similarity matrices are built the same way, as a product of the sparse
+mention incidence matrices of both sides (see `overlap_matrix`).
+"""
+import numpy as np
+from scipy.sparse import csr_matrix
+
+# column markers of mentions that are not counted in the table
+UNMAPPED = -1
+SPLIT_ANTECEDENT = -2
+
+
+def row_sums(matrix):
+    return np.asarray(matrix.sum(axis=1)).ravel()
+
+
+def col_sums(matrix):
+    return np.asarray(matrix.sum(axis=0)).ravel()
+
+
+def ordered_sum(values):
+    # accumulate from left to right, so that the result is identical to a
+    # plain `total += value` loop over the clusters
+    if len(values) == 0:
+        return 0
+    return float(np.add.accumulate(values)[-1])
+
+
+class ContingencyTable:
+    """Overlap counts between `clusters` and the clusters indexed by `mention_to_cluster`.
+
+    Row i, column j holds the number of mentions of clusters[i] which (after being mapped
+    through `mention_alignment_dict`) belong to the cluster j of the other side. Mentions
+    that are not found in `mention_to_cluster` are only counted per row in `unmapped`.
+    Split antecedents are kept aside in `split_antecedents`, since their contribution
+    depends on the split-antecedent alignment passed to each metric.
+    """
+
+    def __init__(self, clusters, mention_to_cluster, mention_alignment_dict):
+        self.mention_to_cluster = mention_to_cluster
+        self.sizes = cluster_sizes(clusters)
+        self.offsets = np.concatenate(([0], np.cumsum(self.sizes)))
+        # (row, mention index, aligned mention) for every split antecedent
+        self.split_antecedents = []
+
+        cols = np.full(int(self.offsets[-1]), UNMAPPED, dtype=np.int64)
+        i = 0
+        for row, cluster in enumerate(clusters):
+            for m in cluster:
+                m = mention_alignment_dict.get(m, m)
+                if m.is_split_antecedent:
+                    cols[i] = SPLIT_ANTECEDENT
+                    self.split_antecedents.append((row, i, m))
+                else:
+                    cid = mention_to_cluster.get(m)
+                    if cid is not None:
+                        cols[i] = cid
+                i += 1
+        self.mention_cols = cols
+        self.mention_rows = np.repeat(np.arange(len(clusters)), self.sizes)
+        self.unmapped = np.bincount(self.mention_rows[cols == UNMAPPED], minlength=len(clusters))
+
+        self.shape = (len(clusters), max(mention_to_cluster.values(), default=-1) + 1)
+        mapped = cols >= 0
+        self.counts = self._matrix(self.mention_rows[mapped], cols[mapped], np.ones(np.count_nonzero(mapped), dtype=np.int64))
+        self._direct_cols = None
+
+    def check_sizes(self):
+        """Raises ZeroDivisionError for an empty cluster (e.g. a cluster of zeros that were removed), which cannot
+        be divided by its size, instead of letting NaN into the sums."""
+        if not self.sizes.all():
+            raise ZeroDivisionError("Empty cluster in the contingency table")
+
+    def _matrix(self, rows, cols, data):
+        matrix = csr_matrix((data, (rows, cols)), shape=self.shape)
+        matrix.sum_duplicates()
+        return matrix
+
+    @property
+    def split_antecedent_rows(self):
+        return {row for row, _, _ in self.split_antecedents}
+
+    def row_nnz(self):
+        return np.diff(self.counts.indptr)
+
+    def direct_cols(self):
+        """Column of every mention, with split antecedents looked up as they are."""
+        if self._direct_cols is None:
+            self._direct_cols = self.mention_cols.copy()
+            for _, i, m in self.split_antecedents:
+                self._direct_cols[i] = self.mention_to_cluster.get(m, UNMAPPED)
+        return self._direct_cols
+
+    def first_cols(self, rows):
+        return self.direct_cols()[self.offsets[:-1][rows]]
+
+    def split_antecedent_links(self, split_antecedent_to_cluster, keep_unaligned=False):
+        """Resolve the split antecedents into (row, column, weight) triples.
+
+        A split antecedent aligned in `split_antecedent_to_cluster` is counted in the cluster
+        of its counterpart, weighted by the alignment score. The unaligned ones are skipped,
+        or looked up directly with a full weight if `keep_unaligned` is set.
+        """
+        links = []
+        for row, _, m in self.split_antecedents:
+            weight = 1
+            if m in split_antecedent_to_cluster:
+                m, weight = split_antecedent_to_cluster[m]
+            elif not keep_unaligned:
+                continue
+            cid = self.mention_to_cluster.get(m)
+            if cid is not None:
+                links.append((row, cid, weight))
+        return links
+
+    def link_matrices(self, split_antecedent_to_cluster, keep_unaligned=False):
+        """Counts with the split antecedent weights added.
+
+        Returns the summed weights and the summed squared weights of every cell,
+        which are the same matrix if there are no (resolved) split antecedents.
+        """
+        links = self.split_antecedent_links(split_antecedent_to_cluster, keep_unaligned)
+        if not links:
+            return self.counts, self.counts
+        mapped = self.mention_cols >= 0
+        rows = np.concatenate((self.mention_rows[mapped], [row for row, _, _ in links]))
+        cols = np.concatenate((self.mention_cols[mapped], [cid for _, cid, _ in links]))
+        weights = np.concatenate((np.ones(np.count_nonzero(mapped)), [w for _, _, w in links]))
+        return self._matrix(rows, cols, weights), self._matrix(rows, cols, weights * weights)
+
+
+def overlap_matrix(clusters, other_clusters, mention_alignment_dict, split_antecedent_to_other={}):
+    """phi3 of all the cluster pairs as a sparse len(clusters) x len(other_clusters) matrix.
+
+    The (weighted) incidence matrix of the clusters and their mentions, resolved through
+    `mention_alignment_dict` and `split_antecedent_to_other`, is multiplied with the incidence
+    matrix of the mentions and the other clusters. Unaligned split antecedents are not counted.
+    """
+    mention_ids = {}
+    other_rows, other_cols = [], []
+    for cid, cluster in enumerate(other_clusters):
+        for m in cluster:
+            other_rows.append(mention_ids.setdefault(m, len(mention_ids)))
+            other_cols.append(cid)
+    other_incidence = csr_matrix((np.ones(len(other_rows)), (other_rows, other_cols)),
+                                 shape=(len(mention_ids), len(other_clusters)))
+    # a mention is counted once per cluster, even if it occurs in the cluster repeatedly
+    other_incidence.sum_duplicates()
+    other_incidence.data[:] = 1
+
+    rows, cols, weights = [], [], []
+    for row, cluster in enumerate(clusters):
+        for m in cluster:
+            m = mention_alignment_dict.get(m, m)
+            weight = 1
+            if m.is_split_antecedent:
+                if m not in split_antecedent_to_other:
+                    continue
+                m, weight = split_antecedent_to_other[m]
+            i = mention_ids.get(m)
+            if i is not None:
+                rows.append(row)
+                cols.append(i)
+                weights.append(weight)
+    incidence = csr_matrix((np.array(weights, dtype=float), (rows, cols)), shape=(len(clusters), len(mention_ids)))
+    return (incidence @ other_incidence).tocsr()
+
+
+def cluster_sizes(clusters):
+    return np.fromiter((len(c) for c in clusters), dtype=np.int64, count=len(clusters))
@@ -0,0 +1,98 @@
+"""Counts of the metrics on every single document, e.g. to find the documents a system fails on.
+
+The counts are collected while the documents are evaluated (see the doc_counts argument of
+scorer.eval.evaluator.update_metrics_evaluators), so no extra pass over the documents is needed.
+"""
+import numpy as np
+
+# the indices of the counts in the last dimension of DocumentCounts.counts
+PN, PD, RN, RD = range(4)
+
+CONLL_METRICS = ('muc', 'bcub', 'ceafe')
+
+# the columns of the metrics evaluated by several evaluators (see get_metric_names)
+SUB_METRICS = {'blancc': 'blanc', 'blancn': 'blanc'}
+
+
+def get_metric_names(metrics):
+    """The names of the columns of the metrics: a metric with several evaluators (blanc) has a column for each
+    of them, named after the function of the evaluator (blancc, blancn)."""
+    names = []
+    for name, metric in metrics:
+        if isinstance(metric, list):
+            names.extend(sub_metric.__name__ for sub_metric in metric)
+        else:
+            names.append(name)
+    return names
+
+
+def get_metric_groups(metric_names):
+    """The columns of every metric by its name, i.e. the columns of all its evaluators."""
+    groups = {}
+    for column, name in enumerate(metric_names):
+        groups.setdefault(SUB_METRICS.get(name, name), []).append(column)
+    return groups
+
+
+class DocumentCounts:
+    """The counts (pn, pd, rn, rd) of the metrics on every document, as an array `counts` of the shape
+    (documents, metrics, 4). The documents are named by `docnames` and the metrics by `metric_names`.
+    """
+
+    def __init__(self, docnames, metric_names, counts):
+        self.docnames = docnames
+        self.metric_names = metric_names
+        self.counts = counts
+
+    @classmethod
+    def from_doc_counts(cls, metrics, doc_counts):
+        """doc_counts: (docname, counts of the document as given by get_document_counts) for every document."""
+        metric_names = get_metric_names(metrics)
+        counts = np.zeros((len(doc_counts), len(metric_names), 4))
+        for i, (_, counts_by_metric) in enumerate(doc_counts):
+            counts[i] = [evaluator_counts for name, _ in metrics for evaluator_counts, _ in counts_by_metric[name]]
+        return cls([docname for docname, _ in doc_counts], metric_names, counts)
+
+    def get_prf(self, metric_name, beta=1):
+        """Precision, recall and F1 of the metric on every document, as arrays."""
+        counts = self.counts[:, self.metric_names.index(metric_name)]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            p = np.where(counts[:, PD] > 0, counts[:, PN] / counts[:, PD], 0.0)
+            r = np.where(counts[:, RD] > 0, counts[:, RN] / counts[:, RD], 0.0)
+            f = np.where(p + r > 0, (1 + beta * beta) * p * r / (beta * beta * p + r), 0.0)
+        return p, r, f
+
+    def get_default_metric_names(self):
+        if all(name in self.metric_names for name in CONLL_METRICS):
+            return list(CONLL_METRICS)
+        return self.metric_names[:1]
+
+    def worst_documents(self, k=10, metric_names=None):
+        """The k documents with the lowest F1 (averaged over metric_names, by default the CoNLL score metrics),
+        as (docname, F1, F1 of the single metrics) tuples. The documents where the metrics count nothing
+        (nor in the key, nor in the sys) are left out.
+        """
+        metric_names = metric_names or self.get_default_metric_names()
+        f1s = np.array([self.get_prf(name)[2] for name in metric_names])
+        columns = [self.metric_names.index(name) for name in metric_names]
+        counted = (self.counts[:, columns][:, :, [PD, RD]] > 0).any(axis=(1, 2))
+        mean_f1 = f1s.mean(axis=0)
+        order = [i for i in np.argsort(mean_f1, kind='stable') if counted[i]][:k]
+        return [(self.docnames[i], float(mean_f1[i]), dict(zip(metric_names, f1s[:, i].tolist()))) for i in order]
+
+    def format_worst_documents(self, k=10, metric_names=None):
+        metric_names = metric_names or self.get_default_metric_names()
+        lines = ['Worst documents by F1 ({:s}):'.format(', '.join(metric_names))]
+        for rank, (docname, f1, f1s) in enumerate(self.worst_documents(k, metric_names), start=1):
+            details = ', '.join('{:s} {:.2f}'.format(name, f1s[name] * 100) for name in metric_names)
+            lines.append('{:d}. {:s}  F1: {:.2f}  ({:s})'.format(rank, str(docname), f1 * 100, details))
+        return '\n'.join(lines)
+
+    def save(self, path):
+        np.savez(path, docnames=np.array([str(docname) for docname in self.docnames]),
+                 metric_names=np.array(self.metric_names), counts=self.counts)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['docnames'].tolist(), data['metric_names'].tolist(), data['counts'])
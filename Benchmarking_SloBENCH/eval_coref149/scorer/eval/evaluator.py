@@ -2,9 +2,14 @@
 https://github.com/clarkkev/deep-coref/blob/master/evaluation.py
 """
 from collections import defaultdict
+from functools import partial
 import numpy as np
 from scipy.optimize import linear_sum_assignment
+from scorer.base.assignment import max_score_assignment
+from scorer.base.parallel import map_documents
 from scorer.ua.mention import UAMention
+from scorer.eval.contingency import (ContingencyTable, UNMAPPED, cluster_sizes, col_sums, ordered_sum, overlap_matrix,
+                                     row_sums)
 
 
 
@@ -16,6 +21,11 @@ def f1(p_num, p_den, r_num, r_den, beta=1):
 
 
 def evaluate_bridgings(doc_bridging_infos):
+    return get_bridging_scores(get_bridging_counts(doc_bridging_infos))
+
+
+def get_bridging_counts(doc_bridging_infos):
+    """(tp, fp, fn) of the anaphora recognition and of the full bridging at the mention and entity level."""
     tp_ar, fp_ar, fn_ar = 0, 0, 0  # anaphora recognation
     tp_fbm, fp_fbm, fn_fbm = 0, 0, 0  # full bridging at mention level
     tp_fbe, fp_fbe, fn_fbe = 0, 0, 0  # full bridging at entity level
@@ -58,6 +68,11 @@ def evaluate_bridgings(doc_bridging_infos):
                     if s_ant not in mention_to_gold or k_ant not in mention_to_gold or not mention_to_gold[s_ant] == \
                                                                                            mention_to_gold[k_ant]:
                         fp_fbe += 1
+    return (tp_ar, fp_ar, fn_ar), (tp_fbm, fp_fbm, fn_fbm), (tp_fbe, fp_fbe, fn_fbe)
+
+
+def get_bridging_scores(bridging_counts):
+    (tp_ar, fp_ar, fn_ar), (tp_fbm, fp_fbm, fn_fbm), (tp_fbe, fp_fbe, fn_fbe) = bridging_counts
     recall_ar = tp_ar / float(tp_ar + fn_ar) if (tp_ar + fn_ar) > 0 else 0
     precision_ar = tp_ar / float(tp_ar + fp_ar) if (tp_ar + fp_ar) > 0 else 0
     f1_ar = (2 * recall_ar * precision_ar / (recall_ar + precision_ar)
@@ -76,6 +91,10 @@ def evaluate_bridgings(doc_bridging_infos):
 
 
 def evaluate_non_referrings(doc_non_referring_infos):
+    return get_non_referring_scores(get_non_referring_counts(doc_non_referring_infos))
+
+
+def get_non_referring_counts(doc_non_referring_infos):
     tp, _tn, fp, fn = 0, 0, 0, 0
 
     for doc_id in doc_non_referring_infos:
@@ -89,7 +108,11 @@ def evaluate_non_referrings(doc_non_referring_infos):
         for m in sys_non_referrings:
             if m not in key_non_referrings:
                 fp += 1
+    return tp, fp, fn
+
 
+def get_non_referring_scores(non_referring_counts):
+    tp, fp, fn = non_referring_counts
     recall = tp / float(tp + fn) if (tp + fn) > 0 else 0
     precision = tp / float(tp + fp) if (tp + fp) > 0 else 0
     f1 = (2 * recall * precision / (recall + precision)
@@ -98,6 +121,84 @@ def evaluate_non_referrings(doc_non_referring_infos):
     return recall, precision, f1
 
 
+# stands in for the split antecedents of the key or sys clusters without any, to compute the correct
+# split-antecedent only score
+DUMMY_SPLIT_ANTECEDENT = UAMention([], [], None, 'referring', is_split_antecedent=True, split_antecedent_sets=set())
+
+
+class DocumentCorefInfo:
+    """Coref info of a document together with the structures derived from it.
+
+    The structures are built lazily and shared by all the metrics evaluated on the document.
+    """
+
+    def __init__(self, coref_info):
+        self.coref_info = coref_info
+        (self.key_clusters, self.sys_clusters, self.key_mention_sys_cluster,
+         self.sys_mention_key_cluster, self.mention_alignment_dict) = coref_info
+        self._key_table = None
+        self._sys_table = None
+        self._overlap = None
+        # recorded by the reader (see scorer.base.reader.CorefInfo), None if unknown
+        self._has_split_antecedents = getattr(coref_info, 'has_split_antecedents', None)
+        self._split_antecedents = ([], []) if self._has_split_antecedents is False else None
+        self._split_antecedent_pairs = None
+
+    @property
+    def key_table(self):
+        if self._key_table is None:
+            self._key_table = ContingencyTable(self.key_clusters, self.key_mention_sys_cluster,
+                                               self.mention_alignment_dict)
+        return self._key_table
+
+    @property
+    def sys_table(self):
+        if self._sys_table is None:
+            self._sys_table = ContingencyTable(self.sys_clusters, self.sys_mention_key_cluster,
+                                               self.mention_alignment_dict)
+        return self._sys_table
+
+    @property
+    def split_antecedents(self):
+        # the split antecedents of the key and sys clusters
+        if self._split_antecedents is None:
+            self._split_antecedents = ([m for cl in self.key_clusters for m in cl if m.is_split_antecedent],
+                                       [m for cl in self.sys_clusters for m in cl if m.is_split_antecedent])
+        return self._split_antecedents
+
+    @property
+    def split_antecedent_pairs(self):
+        """The split antecedents of the key and sys clusters, each side with a dummy one if it has none,
+        and the clusters and the cluster maps of their split antecedent sets, to align the split antecedents
+        by any metric. None if there are no split antecedents.
+        """
+        if self._split_antecedent_pairs is None:
+            key_split_antecedents, sys_split_antecedents = [list(ms) for ms in self.split_antecedents]
+            if not key_split_antecedents and not sys_split_antecedents:
+                self._split_antecedent_pairs = ()
+            else:
+                key_split_antecedents = key_split_antecedents or [DUMMY_SPLIT_ANTECEDENT]
+                sys_split_antecedents = sys_split_antecedents or [DUMMY_SPLIT_ANTECEDENT]
+                key_clusters = [list(s_ant.split_antecedent_sets) for s_ant in key_split_antecedents]
+                sys_clusters = [list(s_ant.split_antecedent_sets) for s_ant in sys_split_antecedents]
+                sys_mention_key_clusters = [{m: cid for cid, cl in enumerate(clusters) for m in cl}
+                                            for clusters in key_clusters]
+                key_mention_sys_clusters = [{m: cid for cid, cl in enumerate(clusters) for m in cl}
+                                            for clusters in sys_clusters]
+                self._split_antecedent_pairs = (key_split_antecedents, sys_split_antecedents, key_clusters,
+                                                sys_clusters, sys_mention_key_clusters, key_mention_sys_clusters)
+        return self._split_antecedent_pairs or None
+
+    def overlap(self, key_split_antecedent_sys_f):
+        # the overlaps only depend on the metric through the split-antecedent alignment
+        if key_split_antecedent_sys_f:
+            return overlap_matrix(self.key_clusters, self.sys_clusters, self.mention_alignment_dict,
+                                  key_split_antecedent_sys_f)
+        if self._overlap is None:
+            self._overlap = overlap_matrix(self.key_clusters, self.sys_clusters, self.mention_alignment_dict)
+        return self._overlap
+
+
 class Evaluator:
     def __init__(self, metric, beta=1, keep_aggregated_values=False, lea_split_antecedent_importance=1):
         self.p_num = 0
@@ -109,7 +210,6 @@ class Evaluator:
         self.keep_aggregated_values = keep_aggregated_values
         self.lea_split_antecedent_importance = lea_split_antecedent_importance
         self.split_antecedent_counter = [0, 0, 0, 0]  # pn, pd, rn, rd
-        self.dummy_split_antecedent = UAMention([], [],None,'referring',is_split_antecedent=True,split_antecedent_sets=set())
 
         if keep_aggregated_values:
             self.aggregated_p_num = []
@@ -117,26 +217,16 @@ class Evaluator:
             self.aggregated_r_num = []
             self.aggregated_r_den = []
 
-    def align_split_antecedents(self, key_clusters, sys_clusters, mention_alignment_dict):
-        key_split_antecedents = [m for cl in key_clusters for m in cl if m.is_split_antecedent]
-        sys_split_antecedents = [m for cl in sys_clusters for m in cl if m.is_split_antecedent]
-
-        if len(key_split_antecedents) == 0 and len(sys_split_antecedents) == 0:
+    def align_split_antecedents(self, key_clusters, sys_clusters, mention_alignment_dict, doc_info=None):
+        if doc_info is None:
+            doc_info = DocumentCorefInfo((key_clusters, sys_clusters, None, None, mention_alignment_dict))
+        # the documents without split antecedents (e.g. all the documents of the corefud format) skip the alignment,
+        # the others share the split antecedent clusters by all the metrics
+        split_antecedent_pairs = doc_info.split_antecedent_pairs
+        if split_antecedent_pairs is None:
             return {}, {}, {}
-
-        # for compute the correct split-antecedent only score.
-        if len(key_split_antecedents) == 0:
-            key_split_antecedents.append(self.dummy_split_antecedent)
-
-        if len(sys_split_antecedents) == 0:
-            sys_split_antecedents.append(self.dummy_split_antecedent)
-
-        key_clusters = [list(s_ant.split_antecedent_sets) for s_ant in key_split_antecedents]
-        sys_clusters = [list(s_ant.split_antecedent_sets) for s_ant in sys_split_antecedents]
-        sys_mention_key_clusters = [{m: cid for cid, cl in enumerate(clusters) for m in cl} for clusters in
-                                    key_clusters]
-        key_mention_sys_clusters = [{m: cid for cid, cl in enumerate(clusters) for m in cl} for clusters in
-                                    sys_clusters]
+        (key_split_antecedents, sys_split_antecedents, key_clusters, sys_clusters,
+         sys_mention_key_clusters, key_mention_sys_clusters) = split_antecedent_pairs
 
         f_scores = np.zeros((len(key_split_antecedents), len(sys_split_antecedents)))
         recalls = np.zeros((len(key_split_antecedents), len(sys_split_antecedents)))
@@ -155,7 +245,7 @@ class Evaluator:
                 precisions[i, j] = 0 if pn == 0 else pn / float(pd)
                 recalls[i, j] = 0 if rn == 0 else rn / float(rd)
                 f_scores[i, j] = f1(pn, pd, rn, rd)
-        row_ind, col_ind = linear_sum_assignment(-f_scores)
+        row_ind, col_ind = max_score_assignment(f_scores)
 
         # pn,pd,rn,rd
         self.split_antecedent_counter[0] += raw_numbers[row_ind, col_ind, np.zeros_like(col_ind)].sum()
@@ -175,30 +265,44 @@ class Evaluator:
     def __update__(self, key_clusters, sys_clusters,
                    key_mention_sys_cluster, sys_mention_key_cluster,
                    key_split_antecedent_sys_r={}, sys_split_antecedent_key_p={},
-                   key_split_antecedent_sys_f={}, is_split_alignment=False, mention_alignment_dict={}):
+                   key_split_antecedent_sys_f={}, is_split_alignment=False, mention_alignment_dict={}, doc_info=None):
+        # the structures memoized in doc_info are only passed on if the metric is computed for the whole document
+        key_table = sys_table = overlap = None
+        if doc_info is not None:
+            if self.metric in (ceafe, ceafm):
+                overlap = doc_info.overlap(key_split_antecedent_sys_f)
+            elif self.metric in (b_cubed, muc, lea, blancc, blancn):
+                key_table, sys_table = doc_info.key_table, doc_info.sys_table
+
         if self.metric == ceafe or self.metric == ceafm:  
-            pn, pd, rn, rd = self.metric(sys_clusters, key_clusters, mention_alignment_dict, key_split_antecedent_sys_f)
+            pn, pd, rn, rd = self.metric(sys_clusters, key_clusters, mention_alignment_dict, key_split_antecedent_sys_f,
+                                         overlap=overlap)
         elif self.metric == blancc or self.metric == blancn:
             pn, pd, rn, rd = self.metric(sys_clusters, key_clusters, key_mention_sys_cluster, mention_alignment_dict,
-                                         key_split_antecedent_sys_f)
+                                         key_split_antecedent_sys_f, table=key_table)
         elif self.metric == lea:
             pn, pd = self.metric(sys_clusters, key_clusters,
                                  sys_mention_key_cluster, mention_alignment_dict, sys_split_antecedent_key_p,
-                                 self.lea_split_antecedent_importance)
+                                 self.lea_split_antecedent_importance, table=sys_table)
             rn, rd = self.metric(key_clusters, sys_clusters,
                                  key_mention_sys_cluster, mention_alignment_dict, key_split_antecedent_sys_r,
-                                 self.lea_split_antecedent_importance)
+                                 self.lea_split_antecedent_importance, table=key_table)
         elif self.metric == muc:
             pn, pd = self.metric(sys_clusters, key_clusters, sys_mention_key_cluster, mention_alignment_dict,
-                                 sys_split_antecedent_key_p, is_split_alignment)
+                                 sys_split_antecedent_key_p, is_split_alignment, table=sys_table)
             rn, rd = self.metric(key_clusters, sys_clusters, key_mention_sys_cluster, mention_alignment_dict,
-                                 key_split_antecedent_sys_r, is_split_alignment)
+                                 key_split_antecedent_sys_r, is_split_alignment, table=key_table)
         elif self.metric == mention_overlap:
             pn, pd, rn, rd = self.metric(key_clusters, sys_clusters)
         #elif self.metric == mention_overlap_new:
         #    pn, pd, rn, rd = self.metric(key_clusters, sys_clusters, mention_alignment_dict)
         elif self.metric == als_zeros:
             pn, pd, rn, rd = self.metric(key_clusters, sys_clusters, key_mention_sys_cluster, mention_alignment_dict)
+        elif self.metric == b_cubed:
+            pn, pd = self.metric(sys_clusters, sys_mention_key_cluster, mention_alignment_dict, sys_split_antecedent_key_p,
+                                 table=sys_table)
+            rn, rd = self.metric(key_clusters, key_mention_sys_cluster, mention_alignment_dict, key_split_antecedent_sys_r,
+                                 table=key_table)
         else:
             pn, pd = self.metric(sys_clusters, sys_mention_key_cluster, mention_alignment_dict, sys_split_antecedent_key_p)
             rn, rd = self.metric(key_clusters, key_mention_sys_cluster, mention_alignment_dict, key_split_antecedent_sys_r)
@@ -206,11 +310,12 @@ class Evaluator:
         return pn, pd, rn, rd
 
     def update(self, coref_info):
+        doc_info = coref_info if isinstance(coref_info, DocumentCorefInfo) else DocumentCorefInfo(coref_info)
         (key_clusters, sys_clusters, key_mention_sys_cluster,
-         sys_mention_key_cluster, mention_alignment_dict) = coref_info
+         sys_mention_key_cluster, mention_alignment_dict) = doc_info.coref_info
 
         key_split_antecedent_sys_r, sys_split_antecedent_key_p, key_split_antecedent_sys_f \
-            = self.align_split_antecedents(key_clusters, sys_clusters, mention_alignment_dict)
+            = self.align_split_antecedents(key_clusters, sys_clusters, mention_alignment_dict, doc_info)
 
         pn, pd, rn, rd = self.__update__(key_clusters, sys_clusters,
                                          key_mention_sys_cluster,
@@ -218,11 +323,18 @@ class Evaluator:
                                          key_split_antecedent_sys_r,
                                          sys_split_antecedent_key_p,
                                          key_split_antecedent_sys_f,
-                                         mention_alignment_dict=mention_alignment_dict)
+                                         mention_alignment_dict=mention_alignment_dict,
+                                         doc_info=doc_info)
+        self.add_counts(pn, pd, rn, rd)
+
+    def add_counts(self, pn, pd, rn, rd, split_antecedent_counts=None):
         self.p_num += pn
         self.p_den += pd
         self.r_num += rn
         self.r_den += rd
+        if split_antecedent_counts is not None:
+            for i, count in enumerate(split_antecedent_counts):
+                self.split_antecedent_counter[i] += count
 
         if self.keep_aggregated_values:
             self.aggregated_p_num.append(pn)
@@ -260,14 +372,16 @@ class Evaluator:
                 self.aggregated_r_num, self.aggregated_r_den)
 
 
-def evaluate_documents(doc_coref_infos, metric, beta=1, lea_split_antecedent_importance=1, only_split_antecedent=False):
-    if isinstance(metric, list):
+def get_evaluators(metric, beta=1, lea_split_antecedent_importance=1):
+    # blanc is given as a list of its sub-metrics, one evaluator is used for each of them
+    metrics = metric if isinstance(metric, list) else [metric]
+    return [Evaluator(sub_metric, beta=beta, lea_split_antecedent_importance=lea_split_antecedent_importance)
+            for sub_metric in metrics]
+
+
+def get_scores(evaluators, only_split_antecedent=False):
+    if len(evaluators) > 1:
         # for blanc
-        evaluators = [Evaluator(sub_metric, beta=beta, lea_split_antecedent_importance=lea_split_antecedent_importance)
-                      for sub_metric in metric]
-        for doc_id in doc_coref_infos:
-            for evaluator in evaluators:
-                evaluator.update(doc_coref_infos[doc_id])
         p, r, f, cnt = 0, 0, 0, 0
         for evaluator in evaluators:
             pn, pd, rn, rd = evaluator.get_counts()
@@ -284,10 +398,7 @@ def evaluate_documents(doc_coref_infos, metric, beta=1, lea_split_antecedent_imp
         else:
             return (r / cnt, p / cnt, f / cnt)
     else:
-        evaluator = Evaluator(metric, beta=beta, lea_split_antecedent_importance=lea_split_antecedent_importance)
-        for doc_id in doc_coref_infos:
-            # print(doc_id)
-            evaluator.update(doc_coref_infos[doc_id])
+        evaluator = evaluators[0]
         if only_split_antecedent:
             p, r, f = evaluator.get_split_antecedent_prf()
             return r, p, f
@@ -296,6 +407,109 @@ def evaluate_documents(doc_coref_infos, metric, beta=1, lea_split_antecedent_imp
                     evaluator.get_f1())
 
 
+def evaluate_documents(doc_coref_infos, metric, beta=1, lea_split_antecedent_importance=1, only_split_antecedent=False):
+    evaluators = get_evaluators(metric, beta=beta, lea_split_antecedent_importance=lea_split_antecedent_importance)
+    for doc_id in doc_coref_infos:
+        # print(doc_id)
+        for evaluator in evaluators:
+            evaluator.update(doc_coref_infos[doc_id])
+    return get_scores(evaluators, only_split_antecedent)
+
+
+def evaluate_documents_metrics(doc_coref_infos, metrics, beta=1, lea_split_antecedent_importance=1,
+                               only_split_antecedent=False, jobs=1):
+    """Evaluates all the (name, metric) pairs in `metrics` in a single pass over the documents.
+
+    The structures derived from a document are computed once and shared by the metrics.
+    With jobs > 1, the documents are evaluated by a pool of processes and their counts are
+    summed up in the order of the documents, which gives the same scores as a serial run.
+    Returns a dictionary of (recall, precision, f1) by the metric name, the evaluators
+    with the counts of each metric are available in the second returned dictionary.
+    """
+    return evaluate_streamed_metrics([doc_coref_infos], metrics, beta=beta,
+                                     lea_split_antecedent_importance=lea_split_antecedent_importance,
+                                     only_split_antecedent=only_split_antecedent, jobs=jobs)
+
+
+def evaluate_streamed_metrics(doc_coref_infos_batches, metrics, beta=1, lea_split_antecedent_importance=1,
+                              only_split_antecedent=False, jobs=1, count_cache=None, doc_counts=None):
+    """evaluate_documents_metrics for the documents coming in batches, e.g. from Reader.iter_coref_infos.
+
+    Every batch is a dictionary of the coref infos by the document name. Only the counts of a batch
+    are kept, so the batch can be dropped once it has been evaluated. See update_metrics_evaluators
+    for count_cache and doc_counts.
+    """
+    evaluators = get_metrics_evaluators(metrics, beta=beta,
+                                        lea_split_antecedent_importance=lea_split_antecedent_importance)
+    for doc_coref_infos in doc_coref_infos_batches:
+        update_metrics_evaluators(evaluators, metrics, doc_coref_infos, beta=beta,
+                                  lea_split_antecedent_importance=lea_split_antecedent_importance, jobs=jobs,
+                                  count_cache=count_cache, doc_counts=doc_counts)
+    scores = {name: get_scores(evaluators[name], only_split_antecedent) for name in evaluators}
+    return scores, evaluators
+
+
+def get_metrics_evaluators(metrics, beta=1, lea_split_antecedent_importance=1):
+    return {name: get_evaluators(metric, beta=beta, lea_split_antecedent_importance=lea_split_antecedent_importance)
+            for name, metric in metrics}
+
+
+def update_metrics_evaluators(evaluators, metrics, doc_coref_infos, beta=1, lea_split_antecedent_importance=1,
+                              jobs=1, count_cache=None, doc_counts=None):
+    """Adds the counts of the documents to the evaluators of the metrics (see get_metrics_evaluators).
+
+    count_cache keeps the counts of the documents evaluated before, it provides get_key(coref_info),
+    get(key) (None if the counts are not known) and put(key, doc_counts). Only the documents missing
+    in it are evaluated. The key must identify the clusters of the document as well as the settings
+    of the evaluation, as the counts are reused for any document with the same key.
+    If doc_counts is a list, (document name, counts of the document) are appended to it.
+    """
+    if count_cache is None and doc_counts is None and not (jobs and jobs > 1):
+        for doc_id in doc_coref_infos:
+            doc_info = DocumentCorefInfo(doc_coref_infos[doc_id])
+            for name in evaluators:
+                for evaluator in evaluators[name]:
+                    evaluator.update(doc_info)
+        return
+
+    get_counts = partial(get_document_counts, metrics, beta=beta,
+                         lea_split_antecedent_importance=lea_split_antecedent_importance)
+    coref_infos = list(doc_coref_infos.values())
+    if count_cache is not None:
+        keys = [count_cache.get_key(coref_info) for coref_info in coref_infos]
+        docs_counts = [count_cache.get(key) for key in keys]
+        missing = [i for i, counts in enumerate(docs_counts) if counts is None]
+        for i, counts in zip(missing, map_documents(get_counts, [coref_infos[i] for i in missing], jobs)):
+            count_cache.put(keys[i], counts)
+            docs_counts[i] = counts
+    else:
+        docs_counts = map_documents(get_counts, coref_infos, jobs)
+    # the counts are summed up in the order of the documents, as if they were evaluated one by one
+    for doc_id, counts in zip(doc_coref_infos, docs_counts):
+        add_document_counts(evaluators, counts)
+        if doc_counts is not None:
+            doc_counts.append((doc_id, counts))
+
+
+def add_document_counts(evaluators, doc_counts):
+    """Adds the counts of a document (see get_document_counts) to the evaluators of the metrics."""
+    for name in evaluators:
+        for evaluator, (counts, split_antecedent_counts) in zip(evaluators[name], doc_counts[name]):
+            evaluator.add_counts(*counts, split_antecedent_counts=split_antecedent_counts)
+
+
+def get_document_counts(metrics, coref_info, beta=1, lea_split_antecedent_importance=1):
+    """Counts (pn, pd, rn, rd) and split-antecedent counts of all the metrics on a single document."""
+    doc_info = DocumentCorefInfo(coref_info)
+    doc_counts = {}
+    for name, metric in metrics:
+        doc_counts[name] = []
+        for evaluator in get_evaluators(metric, beta=beta, lea_split_antecedent_importance=lea_split_antecedent_importance):
+            evaluator.update(doc_info)
+            doc_counts[name].append((evaluator.get_counts(), evaluator.split_antecedent_counter))
+    return doc_counts
+
+
 # this method is not used, and it is not up to date
 # def get_document_evaluations(doc_coref_infos, metric, beta=1):
 #   evaluator = Evaluator(metric, beta=beta, keep_aggregated_values=True)
@@ -315,62 +529,81 @@ def mentions(clusters, mention_to_gold, split_antecedent_to_gold={}):
 # this policy may pair mentions that wouldn't be paired using the other matching methods
 # for the same reason the MOR scores do not change with the change of the matching method
 def mention_overlap(key_clusters, sys_clusters):
-    key_sys_mentions = [(m, True) for c in key_clusters for m in c] + [(m, False) for c in sys_clusters for m in c]
-    key_sys_mentions.sort(key=lambda x: x[0])
-    key_to_process = []
-    sys_to_process = []
-    rbound = None
+    key_mentions = [m for c in key_clusters for m in c]
+    sys_mentions = [m for c in sys_clusters for m in c]
+    # every mention adds its words to the denominators, whether it is assigned or not (a pair without overlap
+    # adds the same as its two mentions left alone), the numerators are the overlaps of the assigned pairs
     # all_counts vector: pn, pd, rn, rd
-    all_counts = np.zeros(4)
-    while key_sys_mentions:
-        if rbound is None or key_sys_mentions[0][0].start <= rbound:
-            m = key_sys_mentions.pop(0)
-            rbound = max(rbound, m[0].end) if rbound is not None else m[0].end
-            #print(m)
-            #print(rbound)
-            (key_to_process if m[1] else sys_to_process).append(m[0])
-        else:
-            #print(f"KEY TO PROCESS: {key_to_process}")
-            #print(f"SYS TO PROCESS: {sys_to_process}")
-            counts = _get_mention_overlap_counts(key_to_process, sys_to_process)
-            #print(f"COUNTS: {counts}")
-            all_counts += counts
-            #print(f"ALL COUNTS: {all_counts}")
-            key_to_process = []
-            sys_to_process = []
-            rbound = None
-    #print(f"KEY TO PROCESS: {key_to_process}")
-    #print(f"SYS TO PROCESS: {sys_to_process}")
-    counts = _get_mention_overlap_counts(key_to_process, sys_to_process)
-    #print(f"COUNTS: {counts}")
-    all_counts += counts
-    #print(f"ALL COUNTS: {all_counts}")
-    #print(f"FINAL ALL COUNTS: {all_counts}")
-    return all_counts.tolist()
+    overlap = _get_max_mention_overlap(key_mentions, sys_mentions) if key_mentions and sys_mentions else 0
+    key_words = sum(len(m) for m in key_mentions)
+    sys_words = sum(len(m) for m in sys_mentions)
+    return [float(overlap), float(sys_words), float(overlap), float(key_words)]
+
+def _get_mention_bounds(mentions):
+    starts = [m.word_position(m.start) for m in mentions]
+    ends = [m.word_position(m.end) for m in mentions]
+    if mentions[0].WORD_STEP is None:
+        # the words are not numbers, only their order matters
+        rank = {w: i for i, w in enumerate(sorted(set(starts) | set(ends)))}
+        starts = [rank[w] for w in starts]
+        ends = [rank[w] for w in ends]
+    return np.array(starts), np.array(ends)
+
+def _get_mention_overlaps(key_mentions, sys_mentions, key_starts, key_ends, sys_starts, sys_ends):
+    if all(m.is_contiguous for m in key_mentions) and all(m.is_contiguous for m in sys_mentions):
+        # as Mention.intersection_size
+        gaps = np.minimum.outer(key_ends, sys_ends) - np.maximum.outer(key_starts, sys_starts)
+        return np.where(gaps >= 0, gaps // key_mentions[0].WORD_STEP + 1, 0)
+    return np.array([[km.intersection_size(sm) for sm in sys_mentions] for km in key_mentions])
+
+# The mentions sorted by their start form groups of overlapping mentions: a group ends before a mention
+# that starts after all the mentions before it end. Only the key and sys mentions of the same group
+# can overlap, so the total overlap of the maximal assignment is summed up group by group.
+# The counts are whole numbers, so the sums do not depend on the order of the groups or of the pairs.
+def _get_max_mention_overlap(key_mentions, sys_mentions):
+    mentions = key_mentions + sys_mentions
+    starts, ends = _get_mention_bounds(mentions)
+    lengths = np.fromiter(map(len, mentions), dtype=np.intp, count=len(mentions))
+    # ordered by the start, the end and the number of words, as Mention.__lt__
+    order = np.lexsort((lengths, ends, starts))
+    first = np.empty(len(order), dtype=bool)
+    first[0] = True
+    first[1:] = starts[order[1:]] > np.maximum.accumulate(ends[order])[:-1]
+    groups = np.cumsum(first) - 1
+    is_key = order < len(key_mentions)
+    n_keys = np.bincount(groups, weights=is_key)
+    n_syss = np.bincount(groups) - n_keys
 
-def _get_mention_overlap_counts(key_mentions, sys_mentions):
-    # counts vector: pn, pd, rn, rd
-    counts = np.zeros(4)
-
-    overlap_matrix = np.zeros((len(key_mentions), len(sys_mentions)))
-    #print(overlap_matrix)
-    for i in range(len(key_mentions)):
-        for j in range(len(sys_mentions)):
-            overlap_matrix[i, j] = len(key_mentions[i].intersection(sys_mentions[j]))
-    row_ind, col_ind = linear_sum_assignment(overlap_matrix, True)
-
-    for r,c in zip(row_ind, col_ind):
-        counts += np.array([
-            overlap_matrix[r,c],
-            len(sys_mentions[c]),
-            overlap_matrix[r,c],
-            len(key_mentions[r])
-        ])
-    for r in set(range(len(key_mentions))).difference(row_ind):
-        counts += np.array([0, 0, 0, len(key_mentions[r])])
-    for c in set(range(len(sys_mentions))).difference(col_ind):
-        counts += np.array([0, len(sys_mentions[c]), 0, 0])
-    return counts
+    overlap = 0
+    # most of the groups are a key and a sys mention
+    pairs = (n_keys == 1) & (n_syss == 1)
+    in_pairs = pairs[groups]
+    pair_keys = order[in_pairs & is_key]
+    pair_syss = order[in_pairs & ~is_key]
+    contiguous = np.fromiter((mentions[i].is_contiguous and mentions[j].is_contiguous
+                              for i, j in zip(pair_keys, pair_syss)), dtype=bool, count=len(pair_keys))
+    if contiguous.any():
+        k, s = pair_keys[contiguous], pair_syss[contiguous]
+        gaps = np.minimum(ends[k], ends[s]) - np.maximum(starts[k], starts[s])
+        overlap += int(np.sum(gaps // mentions[0].WORD_STEP + 1))
+    for i, j in zip(pair_keys[~contiguous], pair_syss[~contiguous]):
+        overlap += mentions[i].intersection_size(mentions[j])
+
+    # the larger groups, with both key and sys mentions
+    bounds = np.flatnonzero(first).tolist() + [len(order)]
+    for group in np.flatnonzero((n_keys > 0) & (n_syss > 0) & ~pairs):
+        members = order[bounds[group]:bounds[group + 1]]
+        key_ind = members[members < len(key_mentions)]
+        sys_ind = members[members >= len(key_mentions)]
+        overlaps = _get_mention_overlaps([mentions[i] for i in key_ind], [mentions[j] for j in sys_ind],
+                                         starts[key_ind], ends[key_ind], starts[sys_ind], ends[sys_ind])
+        if overlaps.shape[0] == 1 or overlaps.shape[1] == 1:
+            overlap += overlaps.max()
+        else:
+            # the total overlap of the maximal assignment is the same for any of the tied assignments
+            row_ind, col_ind = linear_sum_assignment(overlaps, maximize=True)
+            overlap += overlaps[row_ind, col_ind].sum()
+    return overlap
 
 # since we've already done the alignment before, it would be nice if we could use the same alignment to compute the mention overlap
 # I also removed the split-antecedent here so that other format can be benifit from this method as well
@@ -390,7 +623,7 @@ def mention_overlap_new(key_clusters, sys_clusters, mention_alignment_dict):
 
     for km in partial_key_mentions:
         sm = mention_alignment_dict[km]
-        ol = len(km.intersection(sm))
+        ol = km.intersection_size(sm)
         all_counts += np.array([ol, len(sm), ol, len(km)])
     for km in fn_mentions:
         all_counts += np.array([0, 0, 0, len(km)])
@@ -407,17 +640,16 @@ def als_zeros(key_clusters, sys_clusters, sys_mention_to_cluster, mention_alignm
 def anaphor_level_score(key_clusters, sys_clusters, sys_mention_to_cluster, mention_alignment_dict, anaphor_filter):
     tp, fp, fn, wl = (0, 0, 0, 0)
 
-    # get the list of first mentions in sys clusters
-    sys_first_mentions = []
-    for sys_cluster in sys_clusters:
-        sys_cluster.sort()
-        sys_first_mentions.append(sys_cluster[0])
+    # the clusters are shared with the other metrics (and sent to the worker processes), so they are
+    # not sorted in place; the first mention of a cluster is its minimum, the same as after sorting
+    # get the set of first mentions in sys clusters
+    sys_first_mentions = {min(sys_cluster) for sys_cluster in sys_clusters}
 
     # process all key mentions, both aligned and unaligned with sys mentions
     sys_covered_anaphs = set()
     for key_cluster in key_clusters:
         # enforce linear ordering of mentions
-        key_cluster.sort()
+        key_cluster = sorted(key_cluster)
         sys_prev_cids = set()
         for i, key_anaph in enumerate(key_cluster):
             # get the sys counterpart and its cluster id
@@ -466,62 +698,45 @@ def anaphor_level_score(key_clusters, sys_clusters, sys_mention_to_cluster, ment
     return (tp, tp + fp + wl, tp, tp + fn + wl)
 
 
-def b_cubed(clusters, mention_to_gold, mention_alignment_dict, split_antecedent_to_gold={}):
-    num, den = 0, 0
-
-    for c in clusters:
-        gold_counts = defaultdict(float)
-        correct = 0
-        for m in c:
-            m = mention_alignment_dict.get(m, m)
-            if m.is_split_antecedent:
-                if m in split_antecedent_to_gold:
-                    gold_split_antecedent, matching_score = split_antecedent_to_gold[m]
-                    gold_counts[mention_to_gold[gold_split_antecedent]] += matching_score
-            elif m in mention_to_gold:
-                gold_counts[mention_to_gold[m]] += 1
-        for c2 in gold_counts:
-            correct += gold_counts[c2] * gold_counts[c2]
-
-        num += correct / float(len(c))
-        den += len(c)
+def b_cubed(clusters, mention_to_gold, mention_alignment_dict, split_antecedent_to_gold={}, table=None):
+    if table is None:
+        table = ContingencyTable(clusters, mention_to_gold, mention_alignment_dict)
+    table.check_sizes()
+    weights, _ = table.link_matrices(split_antecedent_to_gold)
+    correct = row_sums(weights.multiply(weights))
 
+    num = ordered_sum(correct / table.sizes)
+    den = int(table.sizes.sum())
     return num, den
 
 
 def muc(clusters, out_clusters, mention_to_gold, mention_alignment_dict, split_antecedent_to_gold={},
-        count_singletons=False):
-    tp, p = 0, 0
-    for c in clusters:
-        if len(c) == 1 and count_singletons:
-            p += 1
-            m = mention_alignment_dict.get(c[0], c[0])
-            if m in mention_to_gold and len(out_clusters[mention_to_gold[m]]) == 1:
-                tp += 1
+        count_singletons=False, table=None):
+    if table is None:
+        table = ContingencyTable(clusters, mention_to_gold, mention_alignment_dict)
+    sizes = table.sizes
+    singletons = sizes == 1 if count_singletons else np.zeros(len(sizes), dtype=bool)
+    linked = ~singletons
+
+    p = int((sizes[linked] - 1).sum()) + int(np.count_nonzero(singletons))
+    tp = int((sizes - table.unmapped - table.row_nnz())[linked].sum())
+    if singletons.any():
+        cols = table.first_cols(singletons)
+        out_sizes = np.array([len(c) for c in out_clusters])
+        tp += int(np.count_nonzero(out_sizes[cols[cols >= 0]] == 1))
+
+    # only the last split antecedent of a cluster is taken into account
+    split_antecedents = {row: m for row, _, m in table.split_antecedents if linked[row]}
+    for row, split_antecedent in split_antecedents.items():
+        if split_antecedent in split_antecedent_to_gold:
+            gold_split_antecedent, matching_score = split_antecedent_to_gold[split_antecedent]
+            gold_split_antecedent_cluster = mention_to_gold[gold_split_antecedent]
+            if table.counts[row, gold_split_antecedent_cluster] > 0:
+                tp -= 1 - matching_score
+            else:
+                tp -= 1
         else:
-            p += len(c) - 1
-            tp += len(c)
-            linked = set()
-            split_antecedent = None
-            for m in c:
-                m = mention_alignment_dict.get(m, m)
-                if m.is_split_antecedent:
-                    split_antecedent = m
-                elif m in mention_to_gold:
-                    linked.add(mention_to_gold[m])
-                else:
-                    tp -= 1
-            if split_antecedent is not None:
-                if split_antecedent in split_antecedent_to_gold:
-                    gold_split_antecedent, matching_score = split_antecedent_to_gold[split_antecedent]
-                    gold_split_antecedent_cluster = mention_to_gold[gold_split_antecedent]
-                    if gold_split_antecedent_cluster in linked:
-                        tp -= 1 - matching_score
-                    else:
-                        tp -= 1
-                else:
-                    tp -= 1
-            tp -= len(linked)
+            tp -= 1
     return tp, p
 
 
@@ -543,25 +758,26 @@ def phi3(c1, c2, mention_alignment_dict, split_antecedent_to_sys):
     return overlap
 
 
-def ceafe(clusters, gold_clusters, mention_alignment_dict, key_split_antecedent_sys_f={}):
+def ceafe(clusters, gold_clusters, mention_alignment_dict, key_split_antecedent_sys_f={}, overlap=None):
     clusters = [c for c in clusters]
-    scores = np.zeros((len(gold_clusters), len(clusters)))
-    for i in range(len(gold_clusters)):
-        for j in range(len(clusters)):
-            scores[i, j] = phi4(gold_clusters[i], clusters[j], mention_alignment_dict, key_split_antecedent_sys_f)
-    row_ind, col_ind = linear_sum_assignment(-scores)
+    if overlap is None:
+        overlap = overlap_matrix(gold_clusters, clusters, mention_alignment_dict, key_split_antecedent_sys_f)
+    overlap = overlap.tocoo()
+    # phi4 of the overlapping pairs, all the other pairs are 0
+    overlap.data = 2 * overlap.data / (cluster_sizes(gold_clusters)[overlap.row] + cluster_sizes(clusters)[overlap.col])
+    scores = overlap.tocsr()
+    row_ind, col_ind = max_score_assignment(scores)
     # print(scores,row_ind,col_ind)
     similarity = scores[row_ind, col_ind].sum()
     return similarity, len(clusters), similarity, len(gold_clusters)
 
 
-def ceafm(clusters, gold_clusters, mention_alignment_dict, key_split_antecedent_sys_f={}):
+def ceafm(clusters, gold_clusters, mention_alignment_dict, key_split_antecedent_sys_f={}, overlap=None):
     clusters = [c for c in clusters]
-    scores = np.zeros((len(gold_clusters), len(clusters)))
-    for i in range(len(gold_clusters)):
-        for j in range(len(clusters)):
-            scores[i, j] = phi3(gold_clusters[i], clusters[j], mention_alignment_dict, key_split_antecedent_sys_f)
-    row_ind, col_ind = linear_sum_assignment(-scores)
+    scores = overlap
+    if scores is None:
+        scores = overlap_matrix(gold_clusters, clusters, mention_alignment_dict, key_split_antecedent_sys_f)
+    row_ind, col_ind = max_score_assignment(scores)
     similarity = scores[row_ind, col_ind].sum()
 
     # corrected by juntao for ceafm the denominator is the number of mentions
@@ -570,93 +786,84 @@ def ceafm(clusters, gold_clusters, mention_alignment_dict, key_split_antecedent_
 
 
 def lea(input_clusters, output_clusters, mention_to_gold, mention_alignment_dict, split_antecedent_to_gold={},
-        split_antecedent_importance=1):
-    num, den = 0, 0
-    for c in input_clusters:
-        has_split_antecedent = False
-        if len(c) == 1:
-            all_links = 1
-            m = mention_alignment_dict.get(c[0], c[0])
-            if m in mention_to_gold and len(
-                output_clusters[mention_to_gold[m]]) == 1:
-                common_links = 1
-            else:
-                common_links = 0
-        else:
-            common_links = 0
-            all_links = len(c) * (len(c) - 1) / 2.0
-            for i, m in enumerate(c):
-                m = mention_alignment_dict.get(m, m)
-                if m.is_split_antecedent:
-                    has_split_antecedent = True
-                link_score = 1
-                if m.is_split_antecedent and m in split_antecedent_to_gold:
-                    m, link_score = split_antecedent_to_gold[m]
-                if m in mention_to_gold:
-                    for m2 in c[i + 1:]:
-                        link_score2 = 1.0
-                        m2 = mention_alignment_dict.get(m2, m2)
-                        if m2.is_split_antecedent and m2 in split_antecedent_to_gold:
-                            m2, link_score2 = split_antecedent_to_gold[m2]
-                        if m2 in mention_to_gold and mention_to_gold[
-                            m] == mention_to_gold[m2]:
-                            common_links += link_score * link_score2
-                        # else:
-                        #  print('!! ', m2, '--', m2.get_span(), ' ',
-                        #       m2.min_spans, ' ', mention_to_gold[m], ' ',
-                        #       mention_to_gold[m2], ' ' ,
-                        #       [str(s) for s in output_clusters[
-                        #         mention_to_gold[m]]], ' -- ',
-                        #       [str(s) for s in output_clusters[
-                        #         mention_to_gold[m2]]])
-
-        cluster_importance = (split_antecedent_importance if has_split_antecedent else 1)
-        num += cluster_importance * len(c) * common_links / float(all_links)
-        den += cluster_importance * len(c)
+        split_antecedent_importance=1, table=None):
+    if table is None:
+        table = ContingencyTable(input_clusters, mention_to_gold, mention_alignment_dict)
+    table.check_sizes()
+    sizes = table.sizes
+    weights, squares = table.link_matrices(split_antecedent_to_gold, keep_unaligned=True)
+    common_links = (row_sums(weights.multiply(weights)) - row_sums(squares)) / 2
+    all_links = sizes * (sizes - 1) / 2.0
+
+    singletons = sizes == 1
+    if singletons.any():
+        cols = table.first_cols(singletons)
+        out_sizes = np.array([len(c) for c in output_clusters])
+        mapped = cols >= 0
+        common_links[np.flatnonzero(singletons)[mapped]] = out_sizes[cols[mapped]] == 1
+        common_links[np.flatnonzero(singletons)[~mapped]] = 0
+        all_links[singletons] = 1
+
+    has_split_antecedent = np.zeros(len(sizes), dtype=bool)
+    has_split_antecedent[list(table.split_antecedent_rows)] = True
+    cluster_importance = np.where(has_split_antecedent & ~singletons, split_antecedent_importance, 1)
+
+    num = ordered_sum(cluster_importance * sizes * common_links / all_links)
+    den = (cluster_importance * sizes).sum().item()
     return num, den
 
 
-def blancc(sys_clusters, key_clusters, mention_to_sys, mention_alignment_dict, split_antecedent_to_sys_f={}):
-    num, pd, rd = 0, 0, 0
-    for c in key_clusters:
-        common_links = 0
-        for i, m in enumerate(c):
-            m = mention_alignment_dict.get(m, m)
-            link_score = 1
-            if m.is_split_antecedent and m in split_antecedent_to_sys_f:
-                m, link_score = split_antecedent_to_sys_f[m]
-            if m in mention_to_sys:
-                for m2 in c[i + 1:]:
-                    m2 = mention_alignment_dict.get(m2, m2)
-                    if m2 in mention_to_sys and mention_to_sys[m] == mention_to_sys[m2]:
-                        common_links += link_score
-
-        num += common_links
+def blancc(sys_clusters, key_clusters, mention_to_sys, mention_alignment_dict, split_antecedent_to_sys_f={},
+           table=None):
+    if table is None:
+        table = ContingencyTable(key_clusters, mention_to_sys, mention_alignment_dict)
+    counts = table.counts
+    common_links = (row_sums(counts.multiply(counts)) - row_sums(counts)) // 2
+
+    # a split antecedent is weighted only when it is the first mention of a pair,
+    # the clusters containing one are thus counted pair by pair
+    split_rows = table.split_antecedent_rows
+    common_links[list(split_rows)] = 0
+    num = int(common_links.sum())
+    for row in sorted(split_rows):
+        num += _blancc_split_antecedent_links(table, row, split_antecedent_to_sys_f)
+
     rd = sum([len(c) * (len(c) - 1) / 2 for c in key_clusters])
     pd = sum([len(c) * (len(c) - 1) / 2 for c in sys_clusters])
     return num, pd, num, rd
 
 
-def blancn(sys_clusters, key_clusters, mention_to_sys, mention_alignment_dict, split_antecedent_to_sys_f={}):
-    num, pd, rd = 0, 0, 0
-    for cid, c in enumerate(key_clusters):
-        common_links = 0
-        for i, m in enumerate(c):
-            m = mention_alignment_dict.get(m, m)
-            link_score = 1
-            if m.is_split_antecedent and m in split_antecedent_to_sys_f:
-                m, link_score = split_antecedent_to_sys_f[m]
-            if m in mention_to_sys:
-                for c2 in key_clusters[cid + 1:]:
-                    for m2 in c2:
-                        m2 = mention_alignment_dict.get(m2, m2)
-                        link_score2 = 1
-                        if m2.is_split_antecedent and m2 in split_antecedent_to_sys_f:
-                            m2, link_score2 = split_antecedent_to_sys_f[m2]
-                        if m2 in mention_to_sys and not mention_to_sys[m] == mention_to_sys[m2]:
-                            common_links += link_score * link_score2
-
-        num += common_links
+def _blancc_split_antecedent_links(table, row, split_antecedent_to_sys_f):
+    start, end = table.offsets[row], table.offsets[row + 1]
+    second_cols = table.direct_cols()[start:end]
+    first_cols = table.mention_cols[start:end].tolist()
+    link_scores = [1] * len(first_cols)
+    for r, i, m in table.split_antecedents:
+        if r == row:
+            if m in split_antecedent_to_sys_f:
+                m, link_scores[i - start] = split_antecedent_to_sys_f[m]
+            first_cols[i - start] = table.mention_to_cluster.get(m, UNMAPPED)
+
+    common_links = 0
+    following = defaultdict(int)
+    for i in range(len(first_cols) - 1, -1, -1):
+        if first_cols[i] != UNMAPPED:
+            common_links += link_scores[i] * following[first_cols[i]]
+        if second_cols[i] != UNMAPPED:
+            following[second_cols[i]] += 1
+    return common_links
+
+
+def blancn(sys_clusters, key_clusters, mention_to_sys, mention_alignment_dict, split_antecedent_to_sys_f={},
+           table=None):
+    if table is None:
+        table = ContingencyTable(key_clusters, mention_to_sys, mention_alignment_dict)
+    weights, _ = table.link_matrices(split_antecedent_to_sys_f, keep_unaligned=True)
+    # weighted pairs of mentions that are neither in the same key cluster nor in the same sys cluster
+    num = (weights.sum() ** 2 - (row_sums(weights) ** 2).sum() - (col_sums(weights) ** 2).sum()
+           + weights.multiply(weights).sum())
+    num = num.item() // 2 if np.issubdtype(weights.dtype, np.integer) else num.item() / 2
+
     num_key_mentions = sum([len(c) for c in key_clusters])
     num_sys_mentions = sum([len(c) for c in sys_clusters])
     rd = num_key_mentions * (num_key_mentions - 1) / 2 - sum([len(c) * (len(c) - 1) / 2 for c in key_clusters])
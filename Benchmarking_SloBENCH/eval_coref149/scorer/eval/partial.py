@@ -0,0 +1,141 @@
+"""Counts of the metrics on a part of the documents, to be merged with the counts of the other parts.
+
+Very large corpora can be split into shards (see the shard argument of the readers), which are scored
+separately, e.g. on different machines. The partial results of the shards are merged into the scores
+of all the documents.
+
+A partial result keeps the counts (pn, pd, rn, rd) and the split-antecedent counts of every metric, and
+optionally the counts of every document with its position in the files. With the documents, the merged
+counts are summed up document by document in the order of the files, which gives exactly the scores
+of a single run over all the documents. Without them, the totals of the parts are summed up, which
+may differ from a single run by rounding.
+"""
+import json
+
+from scorer.eval.evaluator import Evaluator, add_document_counts, get_scores
+
+
+def _to_number(value):
+    # numpy scalars are converted to the same python values, to be stored as JSON
+    return value.item() if hasattr(value, 'item') else value
+
+
+def _to_numbers(values):
+    return [_to_number(value) for value in values]
+
+
+class PartialResult:
+    def __init__(self, counts, split_antecedent_counts, beta=1, doc_rows=None, settings=None, shards=()):
+        # the counts of the evaluators of every metric by its name (blanc has two evaluators)
+        self.counts = counts
+        self.split_antecedent_counts = split_antecedent_counts
+        self.beta = beta
+        # (doc number, doc name, counts of the document as given by get_document_counts), by the doc number
+        self.doc_rows = doc_rows
+        # whatever the scores depend on, only the results with the same settings can be merged
+        self.settings = settings
+        # the shards (index, count) the result is made of
+        self.shards = list(shards)
+
+    @classmethod
+    def from_evaluators(cls, evaluators, beta=1, doc_rows=None, settings=None, shards=()):
+        counts = {name: [_to_numbers(evaluator.get_counts()) for evaluator in evaluators[name]]
+                  for name in evaluators}
+        split_antecedent_counts = {name: [_to_numbers(evaluator.split_antecedent_counter)
+                                          for evaluator in evaluators[name]]
+                                   for name in evaluators}
+        if doc_rows is not None:
+            doc_rows = sorted(doc_rows, key=lambda row: row[0])
+        return cls(counts, split_antecedent_counts, beta=beta, doc_rows=doc_rows, settings=settings, shards=shards)
+
+    def get_evaluators(self):
+        """Evaluators of the metrics holding the counts, see scorer.eval.evaluator.get_metrics_evaluators."""
+        evaluators = {name: [Evaluator(None, beta=self.beta) for _ in self.counts[name]] for name in self.counts}
+        if self.doc_rows is not None:
+            for _, _, doc_counts in self.doc_rows:
+                add_document_counts(evaluators, doc_counts)
+        else:
+            for name in evaluators:
+                for evaluator, counts, split_antecedent_counts in zip(evaluators[name], self.counts[name],
+                                                                      self.split_antecedent_counts[name]):
+                    evaluator.add_counts(*counts, split_antecedent_counts=split_antecedent_counts)
+        return evaluators
+
+    def get_scores(self, only_split_antecedent=False):
+        """(recall, precision, f1) by the metric name, as returned by evaluate_streamed_metrics."""
+        evaluators = self.get_evaluators()
+        return {name: get_scores(evaluators[name], only_split_antecedent) for name in evaluators}
+
+    def merge(self, other):
+        """Returns the partial result of the documents of both results."""
+        if self.settings != other.settings or self.beta != other.beta:
+            raise ValueError("Partial results with different settings cannot be merged")
+        if list(self.counts) != list(other.counts) or \
+                any(len(self.counts[name]) != len(other.counts[name]) for name in self.counts):
+            raise ValueError("Partial results of different metrics cannot be merged")
+        if set(self.shards) & set(other.shards):
+            raise ValueError(f"The shards {sorted(set(self.shards) & set(other.shards))} are in both partial results")
+        shards = sorted(self.shards + other.shards)
+
+        if self.doc_rows is not None and other.doc_rows is not None:
+            doc_rows = sorted(self.doc_rows + other.doc_rows, key=lambda row: row[0])
+            for previous, row in zip(doc_rows, doc_rows[1:]):
+                if previous[0] == row[0]:
+                    raise ValueError(f"The document {row[1]} is in both partial results")
+            merged = PartialResult(self.counts, self.split_antecedent_counts, beta=self.beta, doc_rows=doc_rows,
+                                   settings=self.settings, shards=shards)
+            # the totals are summed up again in the order of the documents
+            return PartialResult.from_evaluators(merged.get_evaluators(), beta=self.beta, doc_rows=doc_rows,
+                                                 settings=self.settings, shards=shards)
+
+        counts = {name: [[a + b for a, b in zip(self_counts, other_counts)]
+                         for self_counts, other_counts in zip(self.counts[name], other.counts[name])]
+                  for name in self.counts}
+        split_antecedent_counts = {name: [[a + b for a, b in zip(self_counts, other_counts)]
+                                          for self_counts, other_counts in zip(self.split_antecedent_counts[name],
+                                                                               other.split_antecedent_counts[name])]
+                                   for name in self.split_antecedent_counts}
+        return PartialResult(counts, split_antecedent_counts, beta=self.beta, settings=self.settings, shards=shards)
+
+    def to_dict(self):
+        doc_rows = None
+        if self.doc_rows is not None:
+            doc_rows = [[doc_number, docname, {name: [[_to_numbers(counts), _to_numbers(split_antecedent_counts)]
+                                                      for counts, split_antecedent_counts in doc_counts[name]]
+                                               for name in doc_counts}]
+                        for doc_number, docname, doc_counts in self.doc_rows]
+        return {
+            "counts": self.counts,
+            "split_antecedent_counts": self.split_antecedent_counts,
+            "beta": self.beta,
+            "doc_rows": doc_rows,
+            "settings": self.settings,
+            "shards": [list(shard) for shard in self.shards]
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        doc_rows = data.get("doc_rows")
+        if doc_rows is not None:
+            doc_rows = [(doc_number, docname, doc_counts) for doc_number, docname, doc_counts in doc_rows]
+        return cls(data["counts"], data["split_antecedent_counts"], beta=data.get("beta", 1), doc_rows=doc_rows,
+                   settings=data.get("settings"), shards=[tuple(shard) for shard in data.get("shards", [])])
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+def merge_partial_results(partial_results):
+    partial_results = list(partial_results)
+    if not partial_results:
+        raise ValueError("No partial results to merge")
+    merged = partial_results[0]
+    for partial_result in partial_results[1:]:
+        merged = merged.merge(partial_result)
+    return merged
@@ -0,0 +1,106 @@
+"""Paired significance tests of the difference between the metrics of two systems on the same documents.
+
+Both tests work on the counts of every document of both systems (see scorer.eval.doc_counts), so the
+documents are evaluated only once; the metrics of all the samples are computed at once from the summed
+counts (see scorer.eval.bootstrap).
+
+- approximate randomization: the outputs of the systems are swapped on random documents; the p-value is
+  the share of the samples with at least as large a difference as the observed one.
+- paired bootstrap: the documents are resampled with replacement; the p-value is the share of the samples
+  whose difference deviates from the observed one at least by the observed difference (i.e. the bootstrap
+  distribution shifted to the null hypothesis of no difference).
+
+Both p-values are two-sided and smoothed as (count + 1) / (samples + 1).
+"""
+import numpy as np
+
+from scorer.eval.bootstrap import CHUNK_SIZE, get_sample_scores, resample_counts
+
+# differences smaller than this are rounding errors, e.g. a swap of identical documents
+TOLERANCE = 1e-12
+
+
+def _check_paired(doc_counts_a, doc_counts_b):
+    if doc_counts_a.metric_names != doc_counts_b.metric_names:
+        raise ValueError("The systems are evaluated with different metrics")
+    if list(doc_counts_a.docnames) != list(doc_counts_b.docnames):
+        raise ValueError("The systems are evaluated on different documents")
+    if not doc_counts_a.docnames:
+        raise ValueError("No documents to compare")
+
+
+def get_differences(metric_names, counts_a, counts_b, beta=1):
+    """The differences of the metrics (a - b) of the samples given by the summed counts of both systems."""
+    scores_a = get_sample_scores(metric_names, counts_a, beta=beta)
+    scores_b = get_sample_scores(metric_names, counts_b, beta=beta)
+    return {name: scores_a[name] - scores_b[name] for name in scores_a}
+
+
+def get_observed_differences(doc_counts_a, doc_counts_b, beta=1):
+    differences = get_differences(doc_counts_a.metric_names, doc_counts_a.counts.sum(axis=0)[None],
+                                  doc_counts_b.counts.sum(axis=0)[None], beta=beta)
+    return {name: float(difference[0]) for name, difference in differences.items()}
+
+
+def _count_extreme(differences, observed):
+    return int(np.count_nonzero(np.abs(differences) >= abs(observed) - TOLERANCE))
+
+
+def approximate_randomization_test(doc_counts_a, doc_counts_b, n_samples=10000, seed=None, beta=1):
+    """p-values of the differences of the metrics by the paired approximate randomization test.
+    doc_counts_a and doc_counts_b are scorer.eval.doc_counts.DocumentCounts of the same documents.
+    """
+    _check_paired(doc_counts_a, doc_counts_b)
+    observed = get_observed_differences(doc_counts_a, doc_counts_b, beta=beta)
+    counts_a, counts_b = doc_counts_a.counts, doc_counts_b.counts
+    n_docs = counts_a.shape[0]
+    total_a, total_b = counts_a.sum(axis=0), counts_b.sum(axis=0)
+    # the counts moved from a to b if the outputs of a document are swapped
+    flat_moves = (counts_a - counts_b).reshape(n_docs, -1)
+
+    rng = np.random.default_rng(seed)
+    extreme = dict.fromkeys(observed, 0)
+    chunk = max(1, CHUNK_SIZE // n_docs)
+    for start in range(0, n_samples, chunk):
+        size = min(chunk, n_samples - start)
+        swaps = rng.integers(0, 2, size=(size, n_docs)).astype(float)
+        moved = (swaps @ flat_moves).reshape(size, *total_a.shape)
+        differences = get_differences(doc_counts_a.metric_names, total_a - moved, total_b + moved, beta=beta)
+        for name in observed:
+            extreme[name] += _count_extreme(differences[name], observed[name])
+    return {name: (extreme[name] + 1) / (n_samples + 1) for name in observed}
+
+
+def paired_bootstrap_test(doc_counts_a, doc_counts_b, n_samples=10000, seed=None, beta=1):
+    """p-values of the differences of the metrics by the paired bootstrap test.
+    doc_counts_a and doc_counts_b are scorer.eval.doc_counts.DocumentCounts of the same documents.
+    """
+    _check_paired(doc_counts_a, doc_counts_b)
+    observed = get_observed_differences(doc_counts_a, doc_counts_b, beta=beta)
+    n_metrics = len(doc_counts_a.metric_names)
+
+    # both systems are resampled with the same documents
+    rng = np.random.default_rng(seed)
+    sums = resample_counts(np.concatenate([doc_counts_a.counts, doc_counts_b.counts], axis=1), n_samples, rng)
+    differences = get_differences(doc_counts_a.metric_names, sums[:, :n_metrics], sums[:, n_metrics:], beta=beta)
+    return {name: (_count_extreme(differences[name] - observed[name], observed[name]) + 1) / (n_samples + 1)
+            for name in observed}
+
+
+def significance_tests(doc_counts_a, doc_counts_b, n_samples=10000, seed=None, beta=1):
+    """The observed difference (a - b) and the p-values of both tests by the name of the metric,
+    as named by call_scorer (including conll)."""
+    observed = get_observed_differences(doc_counts_a, doc_counts_b, beta=beta)
+    randomization = approximate_randomization_test(doc_counts_a, doc_counts_b, n_samples, seed=seed, beta=beta)
+    bootstrap = paired_bootstrap_test(doc_counts_a, doc_counts_b, n_samples, seed=seed, beta=beta)
+    return {name: {"difference": observed[name], "p_randomization": randomization[name],
+                   "p_bootstrap": bootstrap[name]}
+            for name in observed}
+
+
+def format_significance_tests(results):
+    lines = ['{:<18s} {:>10s} {:>15s} {:>12s}'.format('metric', 'difference', 'p randomization', 'p bootstrap')]
+    for name, result in results.items():
+        lines.append('{:<18s} {:>10.2f} {:>15.4f} {:>12.4f}'.format(
+            name, result["difference"] * 100, result["p_randomization"], result["p_bootstrap"]))
+    return '\n'.join(lines)
@@ -1,10 +1,37 @@
 import logging
-from scorer.base.reader import Reader
+import re
+from scorer.base.reader import CorefInfo, Reader
 from scorer.ua.mention import UAMention
 from collections import deque
+from itertools import zip_longest
+from operator import itemgetter
 
 __author__ = 'ns-moosavi; juntaoy'
 
+# the attributes of a markable or a bridging annotation, e.g. MarkableID=markable_1|EntityID=set_1|Min=2,3
+# (the value is everything after the first '=')
+ATTRIBUTE_PATTERN = re.compile(r'([^|=]*)=([^|]*)')
+
+
+def parse_attributes(annotation):
+    return dict(ATTRIBUTE_PATTERN.findall(annotation))
+
+
+class UADocument:
+    """The columns of the lines of a document used by the reader, split only once for both the alignment check
+    and the markables. Only the columns are kept, not the split lines.
+    """
+    __slots__ = ('lines', 'is_zero', 'words', 'markables', 'bridgings')
+
+    def __init__(self, lines, word_column=1, markable_column=10, bridging_column=None):
+        self.lines = lines
+        rows = [line.split() for line in lines]
+        # zeros have decimal ids, e.g. 5.1
+        self.is_zero = ['.' in columns[0] for columns in rows]
+        self.words = list(map(itemgetter(word_column), rows))
+        self.markables = list(map(itemgetter(markable_column), rows))
+        self.bridgings = list(map(itemgetter(bridging_column), rows)) if bridging_column is not None else None
+
 
 class UAReader(Reader):
     @property
@@ -19,7 +46,7 @@ class UAReader(Reader):
     def doc_discourse_deixis_infos(self):
         return self._doc_discourse_deixis_infos
 
-    def get_doc_markables(self, doc_name, doc_lines, word_column=1, markable_column=10, bridging_column=11):
+    def get_doc_markables(self, doc_name, doc):
         use_CRAFT_MIN = self.matching == 'partial-craft'
 
         markables_cluster = {}
@@ -30,20 +57,17 @@ class UAReader(Reader):
         markables_split = {}  # set_id: [markable_id_1, markable_id_2 ...]
         markables_is_zero={}
         bridging_antecedents = {}
-        all_words = []
         stack = []
 
 
         word_index = 0
         # zero_index is used for distinguish multiple zeros in the same location
-        # zero is index with decimals in string e.g. '5.0', '5.1'
+        # zero is indexed by the (word_index, zero_index) pair, e.g. (5, 0), (5, 1) for 5.0, 5.1
         zero_index = 0
-        for line in doc_lines:
-            columns = line.split()
-            is_zero = '.' in columns[0]
-
-            if columns[markable_column] != '_':
-                markable_annotations = columns[markable_column].split("(")
+        bridgings = doc.bridgings if doc.bridgings is not None else [None] * len(doc.lines)
+        for line, markable, bridging, is_zero in zip(doc.lines, doc.markables, bridgings, doc.is_zero):
+            if markable != '_':
+                markable_annotations = markable.split("(")
                 if markable_annotations[0]:
                     # the close bracket
                     if is_zero:
@@ -66,7 +90,7 @@ class UAReader(Reader):
                             raise self.CorefFormatError(
                                 'Zeros should not be used as start/end of the standard mentions. {}'.format(line))
                         single_word = False
-                    markable_info = {p[:p.find('=')]: p[p.find('=') + 1:] for p in markable_annotation.split('|')}
+                    markable_info = parse_attributes(markable_annotation)
                     markable_id = markable_info['MarkableID']
                     cluster_id = markable_info['EntityID']
                     markables_cluster[markable_id] = cluster_id
@@ -76,8 +100,8 @@ class UAReader(Reader):
                         markables_is_zero[markable_id] = is_zero
 
                     if is_zero:
-                        markables_start[markable_id].append('{}.{}'.format(word_index,zero_index))
-                        markables_end[markable_id].append('{}.{}'.format(word_index,zero_index))
+                        markables_start[markable_id].append((word_index, zero_index))
+                        markables_end[markable_id].append((word_index, zero_index))
                     else:
                         markables_start[markable_id].append(word_index)
                         if single_word:
@@ -108,29 +132,32 @@ class UAReader(Reader):
                             if ele_of not in markables_split:
                                 markables_split[ele_of] = []
                             markables_split[ele_of].append(markable_id)
-            if self.keep_bridging and columns[bridging_column] != '_':
-                bridging_annotations = columns[bridging_column].split("(")
+            if self.keep_bridging and bridging != '_':
+                bridging_annotations = bridging.split("(")
                 for bridging_annotation in bridging_annotations[1:]:
                     if bridging_annotation.endswith(')'):
                         bridging_annotation = bridging_annotation[:-1]
-                    bridging_info = {p[:p.find('=')]: p[p.find('=') + 1:] for p in bridging_annotation.split('|')}
+                    bridging_info = parse_attributes(bridging_annotation)
                     bridging_antecedents[bridging_info['MarkableID']] = bridging_info['MentionAnchor']
 
             if is_zero:
                 zero_index+=1
             else:
-                all_words.append(columns[word_column])
                 zero_index=0
                 word_index+=1
 
         clusters = {}
         id2markable = {}
         for markable_id in markables_cluster:
+            MIN = markables_MIN[markable_id]
+            if use_CRAFT_MIN:
+                # the zeros are never matched partially (see UAMention.craft_partial_match_score), they have no MIN
+                MIN = None if markables_is_zero[markable_id] else \
+                    [markables_start[markable_id][0], markables_end[markable_id][0]]
             m = UAMention(
                 markables_start[markable_id],
                 markables_end[markable_id],
-                [markables_start[markable_id][0], markables_end[markable_id][0]] if use_CRAFT_MIN else markables_MIN[
-                    markable_id],
+                MIN,
                 markables_coref_tag[markable_id],
                 is_zero = markables_is_zero[markable_id]
             )
@@ -203,117 +230,184 @@ class UAReader(Reader):
 
         if self.keep_split_antecedents:
             # step 2 merge equivalent split-antecedents clusters
-            merged_clusters = []
-            for cl in processed_clusters:
-                existing = None
-                for m in cl:
-                    if m.is_split_antecedent:
-                        # only do this for split-antecedents
-                        for c2 in merged_clusters:
-                            if m in c2:
-                                existing = c2
-                                break
-                if existing:
-                    logging.warning('merge cluster ['+ ','.join([str(m) for m in cl])+ '] and ['+','.join([str(m) for m in existing])+']')
-                    existing.update(cl)
-                else:
-                    merged_clusters.append(set(cl))
-            merged_clusters = [list(cl) for cl in merged_clusters]
+            merged_clusters = self.merge_split_antecedent_clusters(processed_clusters)
         else:
             merged_clusters = processed_clusters
 
         return (merged_clusters, processed_non_referrings,
                 removed_non_referring, removed_singletons, removed_zeros)
 
-    def get_coref_infos(self, key_file, sys_file,unit_test=False):
-        key_docs = self.get_all_docs(key_file)
-        sys_docs = self.get_all_docs(sys_file)
-
-        self.check_data_alignment(key_docs,sys_docs,unit_test=unit_test)
-
-        for doc in key_docs:
-            markable_column = 12 if self.evaluate_discourse_deixis else 10
-            key_clusters, key_bridging_pairs = self.get_doc_markables(doc, key_docs[doc],
-                                                                      markable_column=markable_column)
-            sys_clusters, sys_bridging_pairs = self.get_doc_markables(doc, sys_docs[doc],
-                                                                      markable_column=markable_column)
+    @staticmethod
+    def merge_split_antecedent_clusters(clusters):
+        """Merges the clusters that share a split antecedent, by a union-find over the clusters merged so far
+        with an index of their split antecedents. A cluster sharing the split antecedents of several merged
+        clusters joins them all into the first one of them.
+        """
+        merged_clusters = []
+        # the merged cluster each one has been merged into, the clusters merged into no other one are their own
+        parents = []
+        # the (first) merged cluster of every split antecedent
+        split_antecedent_clusters = {}
+
+        def find(i):
+            root = i
+            while parents[root] != root:
+                root = parents[root]
+            while parents[i] != root:
+                parents[i], i = root, parents[i]
+            return root
+
+        for cl in clusters:
+            roots = []
+            for m in cl:
+                # only do this for split-antecedents
+                if m.is_split_antecedent and m in split_antecedent_clusters:
+                    root = find(split_antecedent_clusters[m])
+                    if root not in roots:
+                        roots.append(root)
+            if roots:
+                roots.sort()
+                existing = merged_clusters[roots[0]]
+                for root in roots[1:]:
+                    if logging.getLogger().isEnabledFor(logging.WARNING):
+                        logging.warning('merge cluster [%s] and [%s]', ','.join(str(m) for m in merged_clusters[root]),
+                                        ','.join(str(m) for m in existing))
+                    existing.update(merged_clusters[root])
+                    merged_clusters[root] = None
+                    parents[root] = roots[0]
+                if logging.getLogger().isEnabledFor(logging.WARNING):
+                    logging.warning('merge cluster [%s] and [%s]', ','.join(str(m) for m in cl),
+                                    ','.join(str(m) for m in existing))
+                existing.update(cl)
+                root = roots[0]
+            else:
+                root = len(merged_clusters)
+                merged_clusters.append(set(cl))
+                parents.append(root)
+            for m in cl:
+                if m.is_split_antecedent:
+                    split_antecedent_clusters.setdefault(m, root)
+        return [list(cl) for cl in merged_clusters if cl is not None]
+
+    def get_docs(self, key_file, sys_file, unit_test=False):
+        for doc, key_doc, sys_doc in self.get_aligned_docs(key_file, sys_file, unit_test=unit_test):
+            key_clusters, key_bridging_pairs = self.get_doc_markables(doc, key_doc)
+            sys_clusters, sys_bridging_pairs = self.get_doc_markables(doc, sys_doc)
 
             (key_clusters, key_non_referrings, key_removed_non_referring,
              key_removed_singletons,key_removed_zeros) = self.process_clusters(key_clusters)
             (sys_clusters, sys_non_referrings, sys_removed_non_referring,
              sys_removed_singletons,sys_removed_zeros) = self.process_clusters(sys_clusters)
 
-            logging.debug(doc)
-
-            sys_mention_key_cluster, key_mention_sys_cluster, partial_match_dict, mention_aligns = self.get_mention_assignments(
-                key_clusters, sys_clusters)
-
-            # store the mention alignments so that it can be used for analysis
-            self._doc_mention_aligns[doc] = mention_aligns
-
-            if self.evaluate_discourse_deixis:
-                self._doc_discourse_deixis_infos[doc] = (key_clusters, sys_clusters,
-                                         key_mention_sys_cluster, sys_mention_key_cluster, partial_match_dict)
-            else:
-                self._doc_coref_infos[doc] = (key_clusters, sys_clusters,
-                                         key_mention_sys_cluster, sys_mention_key_cluster, partial_match_dict)
-            self._doc_non_referring_infos[doc] = (key_non_referrings, sys_non_referrings)
-            self._doc_bridging_infos[doc] = (key_bridging_pairs, sys_bridging_pairs, sys_mention_key_cluster)
-
-            if not self.keep_non_referring:
-                logging.debug('%s and %s non-referring markables are removed from the '
-                              'evaluations of the key and system files, respectively.'
-                              % (key_removed_non_referring, sys_removed_non_referring))
-
-            if not self.keep_singletons:
-                logging.debug('%s and %s singletons are removed from the evaluations of '
-                              'the key and system files, respectively.'
-                              % (key_removed_singletons, sys_removed_singletons))
-
-            if not self.keep_zeros:
-                logging.debug('%s and %s zeros are removed from the evaluations of '
-                              'the key and system files, respectively.'
-                              % (key_removed_zeros, sys_removed_zeros))
+            yield doc, key_clusters, sys_clusters, (key_bridging_pairs, sys_bridging_pairs,
+                                                    key_non_referrings, sys_non_referrings,
+                                                    key_removed_non_referring, sys_removed_non_referring,
+                                                    key_removed_singletons, sys_removed_singletons,
+                                                    key_removed_zeros, sys_removed_zeros)
+
+    def set_doc_infos(self, doc, key_clusters, sys_clusters, assignments, doc_data):
+        (key_bridging_pairs, sys_bridging_pairs, key_non_referrings, sys_non_referrings,
+         key_removed_non_referring, sys_removed_non_referring, key_removed_singletons, sys_removed_singletons,
+         key_removed_zeros, sys_removed_zeros) = doc_data
+        sys_mention_key_cluster, key_mention_sys_cluster, partial_match_dict, mention_aligns = assignments
+
+        logging.debug(doc)
+
+        # store the mention alignments so that it can be used for analysis
+        self._doc_mention_aligns[doc] = mention_aligns
+
+        # split antecedents are only added to the clusters if they are kept
+        has_split_antecedents = self.keep_split_antecedents and \
+            any(m.is_split_antecedent for clusters in (key_clusters, sys_clusters) for cl in clusters for m in cl)
+        coref_info = CorefInfo(key_clusters, sys_clusters, key_mention_sys_cluster, sys_mention_key_cluster,
+                               partial_match_dict, has_split_antecedents=has_split_antecedents)
+        if self.evaluate_discourse_deixis:
+            self._doc_discourse_deixis_infos[doc] = coref_info
+        else:
+            self._doc_coref_infos[doc] = coref_info
+        self._doc_non_referring_infos[doc] = (key_non_referrings, sys_non_referrings)
+        self._doc_bridging_infos[doc] = (key_bridging_pairs, sys_bridging_pairs, sys_mention_key_cluster)
+
+        if not self.keep_non_referring:
+            logging.debug('%s and %s non-referring markables are removed from the '
+                          'evaluations of the key and system files, respectively.'
+                          % (key_removed_non_referring, sys_removed_non_referring))
+
+        if not self.keep_singletons:
+            logging.debug('%s and %s singletons are removed from the evaluations of '
+                          'the key and system files, respectively.'
+                          % (key_removed_singletons, sys_removed_singletons))
+
+        if not self.keep_zeros:
+            logging.debug('%s and %s zeros are removed from the evaluations of '
+                          'the key and system files, respectively.'
+                          % (key_removed_zeros, sys_removed_zeros))
+
+    def get_aligned_docs(self, key_file, sys_file, unit_test=False):
+        """Yields (doc_name, key_doc, sys_doc) of the documents (UADocument) in the order of the key file.
+        In the streaming mode, the documents must come in the same order in both files.
+        """
+        if not self.streaming:
+            key_docs = self.get_all_docs(key_file)
+            sys_docs = self.get_all_docs(sys_file)
+
+            self.check_data_alignment(key_docs,sys_docs,unit_test=unit_test)
+            for doc in key_docs:
+                yield doc, key_docs[doc], sys_docs[doc]
+            return
+
+        for key_doc, sys_doc in zip_longest(self.iter_docs(key_file), self.iter_docs(sys_file)):
+            key_doc_name = key_doc[0] if key_doc else None
+            sys_doc_name = sys_doc[0] if sys_doc else None
+            if key_doc_name is None or key_doc_name != sys_doc_name:
+                raise self.DataAlignError(key_doc_name, sys_doc_name, "Documents", "doc in key", "doc in sys")
+            self.check_doc_alignment(key_doc[1], sys_doc[1], unit_test=unit_test)
+            yield key_doc_name, key_doc[1], sys_doc[1]
 
     def get_all_docs(self, path):
-        all_docs = {}
+        return dict(self.iter_docs(path))
+
+    def iter_docs(self, path):
         doc_lines = []
         doc_name = None
-        for line in open(path):
-            line = line.strip()
-            if line.startswith('# newdoc'):
-                if doc_name and doc_lines:
-                    all_docs[doc_name] = doc_lines
-                    doc_lines = []
-                doc_name = line[len('# newdoc id = '):]
-            elif line.startswith('#') or len(line) == 0:
-                continue
-            else:
-                doc_lines.append(line)
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith('# newdoc'):
+                    if doc_name and doc_lines:
+                        yield doc_name, self.tokenize_doc(doc_lines)
+                        doc_lines = []
+                    doc_name = line[len('# newdoc id = '):]
+                elif line.startswith('#') or len(line) == 0:
+                    continue
+                else:
+                    doc_lines.append(line)
         if doc_name and doc_lines:
-            all_docs[doc_name] = doc_lines
-        return all_docs
-
-    def get_doc_tokens_without_zeros(self, doc,word_column=1):
-        tokens = []
-        for line in doc:
-            columns = line.split()
-            if '.' not in columns[0]:
-                tokens.append(columns[word_column])
-        return tokens
-
-    def check_data_alignment(self, key_docs, sys_docs, word_column=1,unit_test=False):
+            yield doc_name, self.tokenize_doc(doc_lines)
+
+    def tokenize_doc(self, doc_lines):
+        markable_column = 12 if self.evaluate_discourse_deixis else 10
+        return UADocument(doc_lines, markable_column=markable_column,
+                          bridging_column=11 if self.keep_bridging else None)
+
+    def get_doc_tokens_without_zeros(self, doc):
+        return [word for word, is_zero in zip(doc.words, doc.is_zero) if not is_zero]
+
+    def check_data_alignment(self, key_docs, sys_docs, unit_test=False):
         if len(key_docs.keys()) != len(sys_docs.keys()) or \
             len(key_docs.keys() - sys_docs.keys()) > 0 or \
             len(sys_docs.keys() - key_docs.keys()) > 0:
             raise self.DataAlignError(key_docs.keys() - sys_docs.keys(),sys_docs.keys() - key_docs.keys(),"Documents","doc missing in sys","doc inserting in sys")
 
         for doc in key_docs.keys():
-            key_tokens = self.get_doc_tokens_without_zeros(key_docs[doc],word_column)
-            sys_tokens = self.get_doc_tokens_without_zeros(sys_docs[doc],word_column)
-            if len(key_tokens) != len(sys_tokens):
-                raise self.DataAlignError(len(key_tokens),len(sys_tokens),"Number of tokens (excluding zeros)")
-            if not unit_test: #for unit_test we do not check the actual tokens, as they may not the same
-                for i, (kt, st) in enumerate(zip(key_tokens,sys_tokens)):
-                    if kt != st:
-                        raise self.DataAlignError(kt,st,"Word {:d}".format(i+1))
+            self.check_doc_alignment(key_docs[doc], sys_docs[doc], unit_test=unit_test)
+
+    def check_doc_alignment(self, key_doc, sys_doc, unit_test=False):
+        key_tokens = self.get_doc_tokens_without_zeros(key_doc)
+        sys_tokens = self.get_doc_tokens_without_zeros(sys_doc)
+        if len(key_tokens) != len(sys_tokens):
+            raise self.DataAlignError(len(key_tokens),len(sys_tokens),"Number of tokens (excluding zeros)")
+        if not unit_test: #for unit_test we do not check the actual tokens, as they may not the same
+            for i, (kt, st) in enumerate(zip(key_tokens,sys_tokens)):
+                if kt != st:
+                    raise self.DataAlignError(kt,st,"Word {:d}".format(i+1))
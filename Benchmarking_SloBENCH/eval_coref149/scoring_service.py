@@ -0,0 +1,220 @@
+"""Long-running scoring service that keeps the ground truth files parsed in memory.
+
+The service accepts requests as JSON lines over a local TCP port or a unix socket and answers every
+request with a JSON line, in the order of the requests of the connection:
+
+	{"ref_file": "/path/to/ground_truth.conllu", "pred_file": "/path/to/submission.conllu"}
+	{"ref_file": "/path/to/ground_truth.conllu", "pred_text": "<content of the submission>"}
+	-> {"metrics": {<the same dict as returned by call_scorer>}}, or {"error": "<message>"}
+
+The submissions are scored by a pool of worker processes, at most `jobs` at once, the other requests
+wait in a queue. Every worker keeps the ground truth documents it has read, so that a ground truth
+file is parsed only once per worker (as long as the file does not change).
+
+	python scoring_service.py --port 8765 -j 2
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import socket
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import evaluate_corefud
+from scorer.base.reader import Reader
+from result_cache import ResultCache
+from scorer.corefud.bundle import read_key_documents
+
+# the largest request accepted, the submission can be sent within the request
+MAX_REQUEST_SIZE = 1 << 30
+
+# per worker process: the parsed ground truth files and the scorer arguments
+_key_cache = OrderedDict()
+_key_cache_size = 4
+_key_bundle_dir = evaluate_corefud.KEY_BUNDLE_DIR
+_result_cache = None
+_count_cache_dir = None
+_args = None
+
+
+def _init_worker(key_cache_size, key_bundle_dir, result_cache_dir, count_cache_dir):
+	global _key_cache_size, _key_bundle_dir, _result_cache, _count_cache_dir
+	_key_cache_size = key_cache_size
+	_key_bundle_dir = key_bundle_dir
+	_result_cache = ResultCache(result_cache_dir) if result_cache_dir else None
+	_count_cache_dir = count_cache_dir
+
+
+def _get_args():
+	global _args
+	if _args is None:
+		# the arguments are the same for all the requests, the message about them is not printed
+		with contextlib.redirect_stdout(io.StringIO()):
+			_args = evaluate_corefud.get_scorer_args(None, None, key_bundle_dir=_key_bundle_dir,
+													 count_cache_dir=_count_cache_dir)
+	return _args
+
+
+def _get_key_documents(ref_file, matching):
+	stat = os.stat(ref_file)
+	cache_key = (os.path.realpath(ref_file), stat.st_mtime_ns, stat.st_size)
+	if cache_key in _key_cache:
+		_key_cache.move_to_end(cache_key)
+		return _key_cache[cache_key]
+	key_documents = list(read_key_documents(ref_file, matching=matching, bundle_dir=_key_bundle_dir))
+	_key_cache[cache_key] = key_documents
+	while len(_key_cache) > _key_cache_size:
+		_key_cache.popitem(last=False)
+	return key_documents
+
+
+def _score(args):
+	return evaluate_corefud.score(args, key_documents=_get_key_documents(args["key_file"], args["match"]))
+
+
+def score_request(ref_file, pred_file):
+	"""Scores a submission in a worker process, returns the response to the request."""
+	try:
+		args = dict(_get_args(), key_file=ref_file, sys_file=pred_file)
+		if _result_cache is not None:
+			return {"metrics": _result_cache.score(_score, args)}
+		return {"metrics": _score(args)}
+	except (Exception, Reader.DataAlignError, Reader.CorefFormatError) as e:
+		return {"error": str(e)}
+
+
+class ScoringService:
+	def __init__(self, jobs=1, key_cache_size=4, key_bundle_dir=evaluate_corefud.KEY_BUNDLE_DIR,
+				 result_cache_dir=None, count_cache_dir=None):
+		self.jobs = jobs
+		self.executor = ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+											initargs=(key_cache_size, key_bundle_dir, result_cache_dir, count_cache_dir))
+
+	async def score(self, request):
+		if not isinstance(request, dict):
+			return {"error": "Invalid request: expected a JSON object"}
+		ref_file = request.get("ref_file")
+		if not ref_file:
+			return {"error": "Missing ref_file"}
+		loop = asyncio.get_running_loop()
+		if "pred_text" not in request:
+			if not request.get("pred_file"):
+				return {"error": "Missing pred_file or pred_text"}
+			return await loop.run_in_executor(self.executor, score_request, ref_file, request["pred_file"])
+
+		# a submission sent as the content is scored from a temporary file
+		fd, pred_file = tempfile.mkstemp(suffix=".conllu")
+		try:
+			with os.fdopen(fd, "w", encoding="utf-8") as f:
+				f.write(request["pred_text"])
+			return await loop.run_in_executor(self.executor, score_request, ref_file, pred_file)
+		finally:
+			os.remove(pred_file)
+
+	async def handle_connection(self, reader, writer):
+		try:
+			while True:
+				line = await reader.readline()
+				if not line:
+					break
+				try:
+					response = await self.score(json.loads(line))
+				except ValueError as e:
+					response = {"error": "Invalid request: {}".format(e)}
+				except Exception as e:
+					# an error answers only the request, the connection stays open for the next ones
+					response = {"error": "{}: {}".format(type(e).__name__, e)}
+				writer.write(json.dumps(response).encode("utf-8") + b"\n")
+				await writer.drain()
+		finally:
+			writer.close()
+
+	async def serve(self, host="127.0.0.1", port=8765, unix_socket=None):
+		if unix_socket:
+			server = await asyncio.start_unix_server(self.handle_connection, path=unix_socket, limit=MAX_REQUEST_SIZE)
+		else:
+			server = await asyncio.start_server(self.handle_connection, host=host, port=port, limit=MAX_REQUEST_SIZE)
+		async with server:
+			await server.serve_forever()
+
+	def close(self):
+		self.executor.shutdown()
+
+
+class ScoringClient:
+	"""A simple blocking client of the scoring service, e.g. for tests."""
+
+	def __init__(self, host="127.0.0.1", port=8765, unix_socket=None, timeout=None):
+		if unix_socket:
+			self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			self.socket.settimeout(timeout)
+			self.socket.connect(unix_socket)
+		else:
+			self.socket = socket.create_connection((host, port), timeout=timeout)
+		self.file = self.socket.makefile("rwb")
+
+	def score(self, ref_file, pred_file=None, pred_text=None):
+		"""Returns the metrics of the submission given by its path or content, as returned by call_scorer.
+		Raises RuntimeError if the submission cannot be scored.
+		"""
+		request = {"ref_file": ref_file}
+		if pred_text is not None:
+			request["pred_text"] = pred_text
+		else:
+			request["pred_file"] = pred_file
+		self.file.write(json.dumps(request).encode("utf-8") + b"\n")
+		self.file.flush()
+		line = self.file.readline()
+		if not line:
+			raise RuntimeError("The scoring service closed the connection")
+		response = json.loads(line)
+		if "error" in response:
+			raise RuntimeError(response["error"])
+		return response["metrics"]
+
+	def close(self):
+		self.file.close()
+		self.socket.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+
+def main():
+	argparser = argparse.ArgumentParser(description="Scoring service keeping the ground truth files in memory")
+	argparser.add_argument('--host', type=str, default='127.0.0.1', help='host to listen on')
+	argparser.add_argument('--port', type=int, default=8765, help='port to listen on')
+	argparser.add_argument('--unix-socket', type=str, default=None,
+						   help='path of a unix socket to listen on instead of the port')
+	argparser.add_argument('-j', '--jobs', type=int, default=1,
+						   help='number of submissions scored at once (by separate processes)')
+	argparser.add_argument('--key-cache-size', type=int, default=4,
+						   help='number of ground truth files kept in memory by every process')
+	argparser.add_argument('--key-bundle-dir', type=str, default=evaluate_corefud.KEY_BUNDLE_DIR,
+						   help='directory of the precompiled ground truth files (see scorer.corefud.bundle)')
+	argparser.add_argument('--result-cache-dir', type=str, default=None,
+						   help='directory to cache the scores in (see result_cache); not cached if not given')
+	argparser.add_argument('--count-cache-dir', type=str, default=None,
+						   help='directory to cache the counts of single documents in (see result_cache); '
+								'not cached if not given')
+	args = argparser.parse_args()
+
+	service = ScoringService(jobs=args.jobs, key_cache_size=args.key_cache_size, key_bundle_dir=args.key_bundle_dir,
+							 result_cache_dir=args.result_cache_dir, count_cache_dir=args.count_cache_dir)
+	try:
+		asyncio.run(service.serve(host=args.host, port=args.port, unix_socket=args.unix_socket))
+	except KeyboardInterrupt:
+		pass
+	finally:
+		service.close()
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,91 @@
+"""Scoring of very large files split into shards of documents, e.g. on different machines.
+
+Every run scores only the documents of its shard (every count-th document of the files, starting with
+the index-th one) and writes the partial result (see scorer.eval.partial). The partial results of all
+the shards are then merged into exactly the metrics of call_scorer.
+
+	python sharded_scoring.py score ground_truth.conllu submission.conllu --shard 0/4 -o part0.json
+	...
+	python sharded_scoring.py score ground_truth.conllu submission.conllu --shard 3/4 -o part3.json
+	python sharded_scoring.py merge part0.json part1.json part2.json part3.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import sys
+
+import evaluate_corefud
+from scorer.eval.partial import PartialResult, merge_partial_results
+
+
+def parse_shard(value):
+	try:
+		index, count = (int(part) for part in value.split("/"))
+	except ValueError:
+		raise argparse.ArgumentTypeError(f"Invalid shard {value}, expected INDEX/COUNT, e.g. 0/4")
+	if count < 1 or not 0 <= index < count:
+		raise argparse.ArgumentTypeError(f"Invalid shard {value}, the index must be between 0 and COUNT-1")
+	return index, count
+
+
+def get_args(ref_file, pred_file, jobs=1):
+	# the message about the evaluated metrics is not printed, only the results are
+	with contextlib.redirect_stdout(io.StringIO()):
+		return evaluate_corefud.get_scorer_args(ref_file, pred_file, jobs=jobs)
+
+
+def merge(partial_results):
+	"""Merges the partial results of all the shards, returns the metrics as returned by call_scorer."""
+	merged = merge_partial_results(partial_results)
+	counts = {count for _, count in merged.shards}
+	if len(counts) > 1:
+		raise ValueError(f"The partial results come from different numbers of shards: {sorted(counts)}")
+	if counts:
+		missing = sorted(set(range(counts.pop())) - {index for index, _ in merged.shards})
+		if missing:
+			raise ValueError(f"Missing partial results of the shards {missing}")
+	return evaluate_corefud.get_partial_metrics(merged)
+
+
+def main():
+	argparser = argparse.ArgumentParser(description="Score a CorefUD submission in shards and merge the results")
+	subparsers = argparser.add_subparsers(dest="command", required=True)
+
+	score_parser = subparsers.add_parser("score", help="score the documents of one shard")
+	score_parser.add_argument('ref_file', type=str, help='path to the ground truth file')
+	score_parser.add_argument('pred_file', type=str, help='path to the prediction file')
+	score_parser.add_argument('--shard', type=parse_shard, default=None,
+							  help='INDEX/COUNT, the shard of the documents to score; all the documents if not given')
+	score_parser.add_argument('-o', '--output', type=str, required=True, help='path of the partial result')
+	score_parser.add_argument('-j', '--jobs', type=int, default=1, help='number of processes scoring the documents')
+	score_parser.add_argument('--no-doc-rows', action='store_true',
+							  help='do not keep the counts of every document; the partial result is smaller, but the '
+								   'merged scores may differ from a single run by rounding')
+
+	merge_parser = subparsers.add_parser("merge", help="merge the partial results of all the shards")
+	merge_parser.add_argument('partial_results', type=str, nargs='+', help='paths to the partial results')
+	merge_parser.add_argument('-o', '--output', type=str, default=None,
+							  help='path of the metrics (JSON); printed if not given')
+
+	args = argparser.parse_args()
+	if args.command == "score":
+		scorer_args = get_args(args.ref_file, args.pred_file, jobs=args.jobs)
+		partial_result = evaluate_corefud.score_partial(scorer_args, shard=args.shard,
+														keep_doc_rows=not args.no_doc_rows)
+		partial_result.save(args.output)
+	else:
+		try:
+			metrics = merge(PartialResult.load(path) for path in args.partial_results)
+		except ValueError as e:
+			sys.exit(f"Error: {e}")
+		if args.output:
+			with open(args.output, "w") as out:
+				json.dump(metrics, out, indent=2)
+		else:
+			json.dump(metrics, sys.stdout, indent=2)
+			sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,62 @@
+"""max_score_assignment (scorer.base.assignment) against a single linear_sum_assignment of the whole matrix."""
+import numpy as np
+import pytest
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse import block_diag, csr_matrix, random as sparse_random
+
+from scorer.base.assignment import MAX_CHECKED_PAIRS, max_score_assignment
+
+
+def check_assignment(scores):
+    dense = scores.toarray() if hasattr(scores, "toarray") else np.asarray(scores, dtype=float)
+    row_ind, col_ind = max_score_assignment(scores)
+    expected_rows, expected_cols = linear_sum_assignment(dense, maximize=True)
+
+    assert len(row_ind) == len(col_ind) == min(dense.shape)
+    assert list(row_ind) == sorted(row_ind)
+    assert len(set(col_ind)) == len(col_ind)
+    assert dense[row_ind, col_ind].sum() == pytest.approx(dense[expected_rows, expected_cols].sum())
+    # the pairs with a nonzero score are the same, the others are paired up in any order
+    assert ({(r, c) for r, c in zip(row_ind, col_ind) if dense[r, c] > 0} ==
+            {(r, c) for r, c in zip(expected_rows, expected_cols) if dense[r, c] > 0})
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("density", [0.02, 0.1, 0.5])
+def test_random_sparse_scores(seed, density):
+    rng = np.random.default_rng(seed)
+    n_rows, n_cols = rng.integers(1, 40, size=2)
+    check_assignment(sparse_random(n_rows, n_cols, density=density, random_state=seed, format="csr"))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_tied_scores(seed):
+    # small integer scores, e.g. the overlaps of CEAF-m, have many equally good assignments
+    rng = np.random.default_rng(seed)
+    scores = rng.integers(0, 3, size=rng.integers(1, 30, size=2))
+    scores = scores * (rng.random(scores.shape) < 0.2)
+    check_assignment(scores)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_block_diagonal_scores(seed):
+    rng = np.random.default_rng(seed)
+    blocks = [rng.random(rng.integers(1, 6, size=2)) for _ in range(30)]
+    check_assignment(block_diag(blocks, format="csr"))
+
+
+def test_block_larger_than_checked():
+    rng = np.random.default_rng(0)
+    size = MAX_CHECKED_PAIRS + 10
+    check_assignment(block_diag([rng.random((size, size)), rng.random((3, 2))], format="csr"))
+
+
+@pytest.mark.parametrize("shape", [(0, 0), (0, 3), (3, 0), (4, 6), (6, 4)])
+def test_zero_scores(shape):
+    check_assignment(csr_matrix(shape))
+
+
+def test_single_row_and_column():
+    check_assignment(np.array([[0.0, 0.5, 0.2]]))
+    check_assignment(np.array([[0.0], [0.5], [0.2]]))
+    check_assignment(np.array([[0.5, 0.5, 0.2]]))
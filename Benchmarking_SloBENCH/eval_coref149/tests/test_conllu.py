@@ -0,0 +1,112 @@
+"""The built-in CoNLL-U reader (scorer.corefud.conllu) against the udapi backend of CorefUDReader."""
+import pytest
+
+from scorer.base.reader import Reader
+from scorer.corefud.conllu import read_documents
+from scorer.corefud.mention import CorefUDMention
+from scorer.corefud.reader import CorefUDReader
+
+HEADER = "# newdoc id = d1\n# global.Entity = eid-etype-head-other\n# sent_id = s1\n"
+
+# a discontinuous mention (e2), empty nodes (e1), a head that is not the first word (e3)
+# and an entity mentioned in two documents (e4)
+DOCUMENTS = """# newdoc id = d1
+# global.Entity = eid-etype-head-other
+# sent_id = s1
+1	Janez	Janez	PROPN	_	_	2	nsubj	_	Entity=(e1-person-1)
+2	je	biti	AUX	_	_	0	root	_	_
+2.1	_	_	PRON	_	_	_	_	2:nsubj	Entity=(e1-person-1)
+3	rekel	reči	VERB	_	_	2	xcomp	_	Entity=(e2[1/2]-event-1)
+4	,	,	PUNCT	_	_	3	punct	_	_
+5	da	da	SCONJ	_	_	6	mark	_	Entity=(e2[2/2]-event-2
+6	pride	priti	VERB	_	_	3	ccomp	_	Entity=e2[2/2])
+
+# sent_id = s2
+1	Vsi	ves	DET	_	_	2	det	_	Entity=(e3-person-2
+2	ljudje	človek	NOUN	_	_	3	nsubj	_	Entity=e3)
+3	vedo	vedeti	VERB	_	_	0	root	_	Entity=(e4-event-1)
+3.1	_	_	PRON	_	_	_	_	3:obj	Entity=(e1-person-1)
+4	.	.	PUNCT	_	_	3	punct	_	_
+
+# newdoc id = d2
+# sent_id = s3
+1	On	on	PRON	_	_	2	nsubj	_	Entity=(e5-person-1)
+2	pride	priti	VERB	_	_	0	root	_	Entity=(e4-event-1)
+3	jutri	jutri	ADV	_	_	2	advmod	_	Entity=(e5-person-1)
+
+"""
+
+INVALID = {
+    "closing an unopened mention": HEADER + "1\ta\ta\tX\t_\t_\t0\troot\t_\tEntity=e1)\n\n",
+    "no global.Entity": "# newdoc id = d1\n# sent_id = s1\n1\ta\ta\tX\t_\t_\t0\troot\t_\tEntity=(e1-x-1)\n\n",
+    "non-integer head": HEADER + "1\ta\ta\tX\t_\t_\t0\troot\t_\tEntity=(e1-x-a)\n\n",
+    "non-first subspan": HEADER + "1\ta\ta\tX\t_\t_\t0\troot\t_\tEntity=(e1[2/2]-x-1)\n\n",
+    "unknown SplitAnte": HEADER + "1\ta\ta\tX\t_\t_\t0\troot\t_\tEntity=(e1-x-1)|SplitAnte=e2<e1\n\n",
+    "malformed SplitAnte": HEADER + "1\ta\ta\tX\t_\t_\t0\troot\t_\tEntity=(e1-x-1)|SplitAnte=e1e2\n\n",
+    "non-numeric word ID": HEADER + "x\ta\ta\tX\t_\t_\t0\troot\t_\tEntity=(e1-x-1)\n\n",
+    "invalid DEPS": HEADER + "1\ta\ta\tX\t_\t_\t0\troot\t_\t_\n1.1\t_\t_\t_\t_\t_\t_\t_\t1nsubj\tEntity=(e1-x-1)\n\n",
+}
+
+
+def fingerprints(clusters):
+    return [[mention.fingerprint() for mention in cluster] for cluster in clusters]
+
+
+def read_builtin(path, matching):
+    return {doc.docid: fingerprints(doc.clusters) for doc in read_documents(path, matching=matching)}
+
+
+def read_udapi(path, matching):
+    pytest.importorskip("udapi")
+    reader = CorefUDReader(match=matching, conllu_backend="udapi")
+    doc_clusters = reader.split_data_to_docs(reader.load_conllu(path))
+    return {docid: fingerprints(reader.transform_clusters_for_eval(clusters))
+            for docid, clusters in doc_clusters.items()}
+
+
+def words(mention):
+    return [CorefUDMention.WordOrd.to_str(w) for w in mention.words]
+
+
+@pytest.mark.parametrize("matching", ["head", "exact", "partial-corefud"])
+def test_sample_files_as_udapi(sample_files, matching):
+    for path in sample_files:
+        assert read_builtin(path, matching) == read_udapi(path, matching)
+
+
+@pytest.mark.parametrize("matching", ["head", "exact"])
+def test_documents_as_udapi(write_conllu, matching):
+    path = write_conllu(DOCUMENTS)
+    assert read_builtin(path, matching) == read_udapi(path, matching)
+
+
+def test_discontinuous_mentions_empty_nodes_and_heads(write_conllu):
+    d1, d2 = read_documents(write_conllu(DOCUMENTS))
+    assert (d1.docid, d2.docid) == ("d1", "d2")
+    zeros, event, people, seeing = d1.clusters
+    assert [words(m) for m in zeros] == [["1-1"], ["1-2.1"], ["2-3.1"]]
+    assert [m.is_zero for m in zeros] == [False, True, True]
+    assert [words(m) for m in event] == [["1-3", "1-5", "1-6"]]
+    assert [words(m) for m in people] == [["2-1", "2-2"]]
+    # the head is marked with *
+    assert str(people[0]) == "(2-1,2-2*)"
+    # the entity mentioned in both documents is split, the clusters keep the order of the entities in the file
+    assert [words(m) for m in seeing] == [["2-3"]]
+    assert [[words(m) for m in cluster] for cluster in d2.clusters] == [[["3-2"]], [["3-1"], ["3-3"]]]
+
+
+def test_both_backends_give_the_same_documents(sample_files):
+    pytest.importorskip("udapi")
+    docs = {}
+    for backend in ("builtin", "udapi"):
+        reader = CorefUDReader(match="head", conllu_backend=backend, keep_zeros=True)
+        docs[backend] = [(docname, fingerprints(key_clusters), fingerprints(sys_clusters))
+                         for docname, key_clusters, sys_clusters, _ in reader.get_docs(*sample_files)]
+    assert docs["builtin"] == docs["udapi"]
+
+
+@pytest.mark.parametrize("name", sorted(INVALID))
+def test_invalid_input_raises_coref_format_error(write_conllu, name):
+    path = write_conllu(INVALID[name])
+    with pytest.raises(Reader.CorefFormatError):
+        list(read_documents(path))
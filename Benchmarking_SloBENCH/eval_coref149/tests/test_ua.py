@@ -0,0 +1,62 @@
+"""The UA reader (scorer.ua) with kept zeros, scored by the evaluators as by ua-scorer.py."""
+import pytest
+
+from scorer.eval import evaluator
+from scorer.ua.mention import UAMention
+from scorer.ua.reader import UAReader
+
+
+def ua_line(word_id, markable="_"):
+    word = "_" if "." in word_id else "w" + word_id
+    return "\t".join([word_id, word] + ["_"] * 8 + [markable, "_", "_"])
+
+
+def ua_document(*lines):
+    return "\n".join(["# newdoc id = d1"] + [ua_line(*line) for line in lines]) + "\n"
+
+
+# the zeros 2.1 and 3.1 come between the words, the sys mention of the words 3-4 goes over the zero 3.1
+KEY = ua_document(
+    ("1", "(EntityID=1|MarkableID=m1"),
+    ("2", ")"),
+    ("2.1", "(EntityID=1|MarkableID=m2)"),
+    ("3", "(EntityID=2|MarkableID=m3)"),
+    ("3.1", "(EntityID=2|MarkableID=m4)"),
+    ("4",),
+)
+SYS = ua_document(
+    ("1", "(EntityID=1|MarkableID=m1)"),
+    ("2",),
+    ("2.1", "(EntityID=1|MarkableID=m2)"),
+    ("3", "(EntityID=2|MarkableID=m3"),
+    ("3.1", "(EntityID=3|MarkableID=m4)"),
+    ("4", ")"),
+)
+
+
+def score(key_file, sys_file, metrics, **kwargs):
+    reader = UAReader(keep_singletons=True, keep_zeros=True, **kwargs)
+    metrics = [(name, getattr(evaluator, name)) for name in metrics]
+    evaluators = evaluator.get_metrics_evaluators(metrics, beta=1)
+    for _ in reader.iter_coref_infos(key_file, sys_file):
+        evaluator.update_metrics_evaluators(evaluators, metrics, reader.doc_coref_infos, beta=1)
+    return {name: evaluator.get_scores(evaluators[name], False) for name in evaluators}
+
+
+@pytest.mark.parametrize("matching", ["exact", "partial-corefud", "partial-craft"])
+def test_mention_overlap_with_zeros(tmp_path, matching):
+    (tmp_path / "key.ua").write_text(KEY, encoding="utf-8")
+    (tmp_path / "sys.ua").write_text(SYS, encoding="utf-8")
+    scores = score(str(tmp_path / "key.ua"), str(tmp_path / "sys.ua"), ["mention_overlap", "muc"], match=matching)
+    # every key mention overlaps a sys mention by a single word or zero, 4 of the 5 words of both
+    assert scores["mention_overlap"] == pytest.approx((0.8, 0.8, 0.8))
+
+
+def test_zeros_are_ordered_between_the_words():
+    word = UAMention([1], [1], None, "referring")
+    zero = UAMention([(2, 0)], [(2, 0)], None, "referring", is_zero=True)
+    span = UAMention([2], [3], None, "referring")
+    assert not zero.is_contiguous and span.is_contiguous
+    assert sorted([span, zero, word]) == [word, zero, span]
+    assert zero.intersection_size(span) == span.intersection_size(zero) == 0
+    assert not span.contains(zero)
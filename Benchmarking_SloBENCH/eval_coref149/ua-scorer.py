@@ -3,7 +3,8 @@ from scorer.ua.reader import UAReader
 from scorer.corefud.reader import CorefUDReader
 from scorer.conll.reader import CoNLLReader
 from scorer.eval import evaluator
-from scorer.eval.evaluator import evaluate_non_referrings
+from scorer.eval.bootstrap import bootstrap_intervals, format_intervals
+from scorer.eval.doc_counts import DocumentCounts
 
 __author__ = 'ns-moosavi; juntaoy; michnov'
 
@@ -153,6 +154,20 @@ def parse_arguments():
     argparser.add_argument('--np-only', action='store_true', default=False, help='evaluate only NP metnions')
     argparser.add_argument('--remove-nested-mentions', action='store_true', default=False,
                            help='evaluate only flat metnions')
+    argparser.add_argument('-j', '--jobs', type=int, default=1,
+                           help='number of processes used to align and evaluate the documents in parallel')
+    argparser.add_argument('--streaming', action='store_true', default=False,
+                           help='read key and sys document by document and keep only the documents being evaluated in memory; '
+                                'the documents must be in the same order in both files')
+    argparser.add_argument('--conllu-backend', choices=['builtin', 'udapi'], default='builtin',
+                           help='the reader of the corefud format: the built-in streaming parser or udapi')
+    argparser.add_argument('--worst-docs', type=int, default=0, metavar='K',
+                           help='report the K documents with the lowest F1 (averaged over muc, bcub and ceafe if evaluated)')
+    argparser.add_argument('--bootstrap', type=int, default=0, metavar='N',
+                           help='report bootstrap confidence intervals of the metrics over N resamples of the documents')
+    argparser.add_argument('--confidence', type=float, default=0.95,
+                           help='confidence level of the bootstrap intervals')
+    argparser.add_argument('--seed', type=int, default=None, help='random seed of the bootstrap resamples')
     argparser.add_argument('-t','--shared-task',
                            choices=['conll12', 'crac18', 'craft19', 'crac22', 'codicrac22ar', 'codicrac22br',
                                     'codicrac22dd', 'crac23', 'crac24'],
@@ -271,24 +286,49 @@ def evaluate(args):
     elif args['format'] == 'corefud':
         reader = CorefUDReader(**args)
     else:
-        reader == CoNLLReader(**args)
-
-    reader.get_coref_infos(key_file, sys_file)
+        reader = CoNLLReader(**args)
 
     conll = 0
     conll_subparts_num = 0
 
+    # all the coreference metrics are evaluated in a single pass over the documents
+    # the documents come in a single batch, or in the streaming mode, in small batches that are dropped
+    # once they have been evaluated
+    metric_names = [name for name, metric in args['metrics']]
+    coref_metrics = [(name, metric) for name, metric in args['metrics'] if name not in ['non-referring', 'bridging']]
+    coref_evaluators = evaluator.get_metrics_evaluators(coref_metrics, beta=1)
+    # the counts of every document, collected for the report of the worst documents and the bootstrap intervals
+    doc_counts = [] if args.get('worst_docs') or args.get('bootstrap') else None
+    non_referring_counts = (0, 0, 0)
+    bridging_counts = ((0, 0, 0), (0, 0, 0), (0, 0, 0))
+    for _ in reader.iter_coref_infos(key_file, sys_file):
+        evaluator.update_metrics_evaluators(
+            coref_evaluators, coref_metrics,
+            reader.doc_discourse_deixis_infos if args['evaluate_discourse_deixis'] else reader.doc_coref_infos,
+            beta=1,
+            jobs=args.get('jobs', 1),
+            doc_counts=doc_counts)
+        if 'non-referring' in metric_names:
+            non_referring_counts = tuple(
+                total + count for total, count in zip(
+                    non_referring_counts, evaluator.get_non_referring_counts(reader.doc_non_referring_infos)))
+        if 'bridging' in metric_names:
+            bridging_counts = tuple(
+                tuple(total + count for total, count in zip(totals, counts)) for totals, counts in zip(
+                    bridging_counts, evaluator.get_bridging_counts(reader.doc_bridging_infos)))
+    coref_scores = {name: evaluator.get_scores(coref_evaluators[name], args['only_split_antecedent'])
+                    for name in coref_evaluators}
+
     for name, metric in args['metrics']:
         if name == 'non-referring':
-            recall, precision, f1 = evaluate_non_referrings(
-                reader.doc_non_referring_infos)
+            recall, precision, f1 = evaluator.get_non_referring_scores(non_referring_counts)
             print('============================================')
             print('Non-referring markable identification scores:')
             print('Recall: %.2f' % (recall * 100),
                   ' Precision: %.2f' % (precision * 100),
                   ' F1: %.2f' % (f1 * 100))
         elif name == 'bridging':
-            score_ar, score_fbm, score_fbe = evaluator.evaluate_bridgings(reader.doc_bridging_infos)
+            score_ar, score_fbm, score_fbe = evaluator.get_bridging_scores(bridging_counts)
             recall_ar, precision_ar, f1_ar = score_ar
             recall_fbm, precision_fbm, f1_fbm = score_fbm
             recall_fbe, precision_fbe, f1_fbe = score_fbe
@@ -307,11 +347,7 @@ def evaluate(args):
                   ' Precision: %.2f' % (precision_fbe * 100),
                   ' F1: %.2f' % (f1_fbe * 100))
         else:
-            recall, precision, f1 = evaluator.evaluate_documents(
-                reader.doc_discourse_deixis_infos if args['evaluate_discourse_deixis'] else reader.doc_coref_infos,
-                metric,
-                beta=1,
-                only_split_antecedent=args['only_split_antecedent'])
+            recall, precision, f1 = coref_scores[name]
             if name in ["muc", "bcub", "ceafe"]:
                 conll += f1
                 conll_subparts_num += 1
@@ -325,10 +361,22 @@ def evaluate(args):
         conll = (conll / 3) * 100
         print('CoNLL score: %.2f' % conll)
 
+    if doc_counts is not None and coref_metrics:
+        document_counts = DocumentCounts.from_doc_counts(coref_metrics, doc_counts)
+        if args.get('worst_docs'):
+            print('============================================')
+            print(document_counts.format_worst_documents(args['worst_docs']))
+        if args.get('bootstrap') and document_counts.docnames:
+            confidence = args.get('confidence', 0.95)
+            intervals = bootstrap_intervals(document_counts, args['bootstrap'], confidence=confidence,
+                                            seed=args.get('seed'))
+            print('============================================')
+            print(format_intervals({}, intervals, confidence=confidence))
+
 def main():
     args = parse_arguments()
     process_arguments(args)
-    #evaluate(args)
+    evaluate(args)
 
 if __name__ == "__main__":
     main()
@@ -1,11 +1,45 @@
+import argparse
 import importlib
+import os
+import sys
+from functools import partial
 
+from scorer.base.parallel import map_documents
+from scorer.base.reader import Reader
+from scorer.corefud.bundle import file_hash, read_key_documents
 from scorer.corefud.reader import CorefUDReader
 from scorer.eval import evaluator
+from scorer.eval.bootstrap import bootstrap_intervals, format_intervals
+from scorer.eval.doc_counts import DocumentCounts
+from scorer.eval.partial import PartialResult
+from result_cache import SCORER_VERSION, DocumentCountCache, ResultCache, normalize_args
 uascorer = importlib.import_module("ua-scorer")
 
+# precompiled ground truth files, see scorer.corefud.bundle
+KEY_BUNDLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "key_bundles")
 
-def call_scorer(ref_file, pred_file):
+
+# the ground truth documents of the running call_scorer_batch, inherited by the forked workers
+_key_documents = None
+
+
+def call_scorer(ref_file, pred_file, jobs=1, streaming=False, key_bundle_dir=KEY_BUNDLE_DIR,
+				result_cache_dir=None, count_cache_dir=None, return_doc_counts=False):
+	"""Returns the metrics of the prediction file. With return_doc_counts, returns the metrics and
+	the counts of the metrics on every document (scorer.eval.doc_counts.DocumentCounts).
+	"""
+	args = get_scorer_args(ref_file, pred_file, jobs=jobs, streaming=streaming, key_bundle_dir=key_bundle_dir,
+						   count_cache_dir=count_cache_dir)
+	if return_doc_counts:
+		# the counts of the documents are not in the result cache
+		return score(args, return_doc_counts=True)
+	if result_cache_dir:
+		return ResultCache(result_cache_dir).score(score, args)
+	return score(args)
+
+
+def get_scorer_args(ref_file, pred_file, jobs=1, streaming=False, key_bundle_dir=KEY_BUNDLE_DIR,
+					count_cache_dir=None):
 	args = {
 		"key_file": ref_file,
 		"sys_file": pred_file,
@@ -21,22 +55,53 @@ def call_scorer(ref_file, pred_file):
 		"allow_boundary_crossing": False,
 		"np_only": False,
 		"remove_nested_mentions": False,
-		"shared_task": None
+		"shared_task": None,
+		"jobs": jobs,
+		"streaming": streaming,
+		"key_bundle_dir": key_bundle_dir,
+		"count_cache_dir": count_cache_dir
 	}
 	uascorer.process_arguments(args)
-	reader = CorefUDReader(**args)
-	reader.get_coref_infos(args["key_file"], args["sys_file"])
+	return args
+
+
+def score(args, key_documents=None, return_doc_counts=False):
+	reader = CorefUDReader(key_documents=key_documents, **args)
+	count_cache = DocumentCountCache(args["count_cache_dir"], args) if args.get("count_cache_dir") else None
+	doc_counts = [] if return_doc_counts else None
+
+	# the documents are evaluated batch by batch as they are read, see Reader.iter_coref_infos
+	scores, _ = evaluator.evaluate_streamed_metrics(
+		get_coref_infos_batches(reader, args),
+		args["metrics"],
+		beta=1,
+		only_split_antecedent=args['only_split_antecedent'],
+		jobs=args["jobs"],
+		count_cache=count_cache,
+		doc_counts=doc_counts)
+	if count_cache is not None:
+		try:
+			count_cache.evict()
+		except OSError:
+			pass
+	calculated_metrics = get_calculated_metrics(args["metrics"], scores)
+	if return_doc_counts:
+		return calculated_metrics, DocumentCounts.from_doc_counts(args["metrics"], doc_counts)
+	return calculated_metrics
+
+
+def get_coref_infos_batches(reader, args):
+	for _ in reader.iter_coref_infos(args["key_file"], args["sys_file"]):
+		yield reader.doc_discourse_deixis_infos if args['evaluate_discourse_deixis'] else reader.doc_coref_infos
+
 
+def get_calculated_metrics(metrics, scores):
 	conll = 0
 	conll_subparts_num = 0
 
 	calculated_metrics = {}
-	for name, metric in args["metrics"]:
-		recall, precision, f1 = evaluator.evaluate_documents(
-			reader.doc_discourse_deixis_infos if args['evaluate_discourse_deixis'] else reader.doc_coref_infos,
-			metric,
-			beta=1,
-			only_split_antecedent=args['only_split_antecedent'])
+	for name, metric in metrics:
+		recall, precision, f1 = scores[name]
 
 		calculated_metrics[f"Precision({name})"] = precision
 		calculated_metrics[f"Recall({name})"] = recall
@@ -51,3 +116,140 @@ def call_scorer(ref_file, pred_file):
 		calculated_metrics["conll"] = conll
 
 	return calculated_metrics
+
+
+def score_partial(args, shard=None, keep_doc_rows=True, key_documents=None):
+	"""Scores the documents of the shard (index, count), or all of them, returns scorer.eval.partial.PartialResult.
+	With keep_doc_rows, the result keeps the counts of every document, so that merging the results of all the shards
+	gives exactly the metrics of call_scorer.
+	"""
+	reader = CorefUDReader(key_documents=key_documents, shard=shard, **args)
+	doc_counts = [] if keep_doc_rows else None
+	_, evaluators = evaluator.evaluate_streamed_metrics(
+		get_coref_infos_batches(reader, args),
+		args["metrics"],
+		beta=1,
+		jobs=args["jobs"],
+		doc_counts=doc_counts)
+	doc_rows = None
+	if doc_counts is not None:
+		doc_rows = [(reader.doc_numbers[docname], docname, counts) for docname, counts in doc_counts]
+	settings = {
+		"args": normalize_args(args),
+		"scorer_version": SCORER_VERSION,
+		"key_hash": file_hash(args["key_file"]),
+		"sys_hash": file_hash(args["sys_file"])
+	}
+	return PartialResult.from_evaluators(evaluators, beta=1, doc_rows=doc_rows, settings=settings,
+										 shards=[tuple(shard)] if shard else ())
+
+
+def get_partial_metrics(partial_result):
+	"""The metrics (as returned by call_scorer) of the merged partial results."""
+	only_split_antecedent = partial_result.settings["args"]["only_split_antecedent"]
+	return get_calculated_metrics([(name, None) for name in partial_result.counts],
+								  partial_result.get_scores(only_split_antecedent))
+
+
+def call_scorer_batch(ref_file, pred_files, jobs=1, key_bundle_dir=KEY_BUNDLE_DIR, result_cache_dir=None,
+					  count_cache_dir=None, return_doc_counts=False):
+	"""Scores every prediction file against the same ground truth file, which is read only once.
+
+	The prediction files are scored by `jobs` processes. Returns the metrics (as returned by call_scorer)
+	in the order of pred_files. A file that cannot be scored gets {"error": message} instead.
+	With return_doc_counts, (metrics, DocumentCounts) are returned for every file, with None instead of
+	the counts if the file cannot be scored.
+	"""
+	global _key_documents
+	args = get_scorer_args(ref_file, None, key_bundle_dir=key_bundle_dir, count_cache_dir=count_cache_dir)
+	_key_documents = list(read_key_documents(ref_file, matching=args["match"], bundle_dir=key_bundle_dir))
+	try:
+		result_cache = ResultCache(result_cache_dir) if result_cache_dir else None
+		return map_documents(partial(_score_pred_file, args, result_cache, return_doc_counts), pred_files, jobs)
+	finally:
+		_key_documents = None
+
+
+def _score_pred_file(args, result_cache, return_doc_counts, pred_file):
+	# without fork, the ground truth is read again by every worker process
+	try:
+		if return_doc_counts:
+			return score(dict(args, sys_file=pred_file), key_documents=_key_documents, return_doc_counts=True)
+		if result_cache is not None:
+			return result_cache.score(score, dict(args, sys_file=pred_file), key_documents=_key_documents)
+		return score(dict(args, sys_file=pred_file), key_documents=_key_documents)
+	except (Exception, Reader.DataAlignError, Reader.CorefFormatError) as e:
+		return ({"error": str(e)}, None) if return_doc_counts else {"error": str(e)}
+
+
+def get_pred_files(paths):
+	pred_files = []
+	for path in paths:
+		if os.path.isdir(path):
+			pred_files.extend(sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".conllu")))
+		else:
+			pred_files.append(path)
+	return pred_files
+
+
+def write_results_table(pred_files, results, out):
+	columns = []
+	for metrics in results:
+		columns.extend(name for name in metrics if name != "error" and name not in columns)
+	out.write("\t".join(["pred_file"] + columns + ["error"]) + "\n")
+	for pred_file, metrics in zip(pred_files, results):
+		values = ["" if name not in metrics else "%.4f" % (metrics[name] * 100) for name in columns]
+		out.write("\t".join([pred_file] + values + [metrics.get("error", "").replace("\n", " ")]) + "\n")
+
+
+def main():
+	argparser = argparse.ArgumentParser(description="Score many predictions against one CorefUD ground truth file")
+	argparser.add_argument('ref_file', type=str, help='path to the ground truth file')
+	argparser.add_argument('pred_files', type=str, nargs='+',
+						   help='paths to the prediction files, or directories of them (*.conllu)')
+	argparser.add_argument('-j', '--jobs', type=int, default=1,
+						   help='number of processes scoring the prediction files in parallel')
+	argparser.add_argument('-o', '--output', type=str, default=None,
+						   help='path of the results table (tab-separated, scores in %%); printed if not given')
+	argparser.add_argument('--key-bundle-dir', type=str, default=KEY_BUNDLE_DIR,
+						   help='directory of the precompiled ground truth files (see scorer.corefud.bundle)')
+	argparser.add_argument('--result-cache-dir', type=str, default=None,
+						   help='directory to cache the scores in (see result_cache); not cached if not given')
+	argparser.add_argument('--count-cache-dir', type=str, default=None,
+						   help='directory to cache the counts of single documents in (see result_cache); '
+								'not cached if not given')
+	argparser.add_argument('--worst-docs', type=int, default=0, metavar='K',
+						   help='print the K documents with the lowest F1 (CoNLL score metrics) of every prediction file')
+	argparser.add_argument('--bootstrap', type=int, default=0, metavar='N',
+						   help='print bootstrap confidence intervals of the metrics of every prediction file, '
+								'over N resamples of the documents')
+	argparser.add_argument('--confidence', type=float, default=0.95, help='confidence level of the bootstrap intervals')
+	argparser.add_argument('--seed', type=int, default=None, help='random seed of the bootstrap resamples')
+	args = argparser.parse_args()
+
+	pred_files = get_pred_files(args.pred_files)
+	results = call_scorer_batch(args.ref_file, pred_files, jobs=args.jobs, key_bundle_dir=args.key_bundle_dir,
+								result_cache_dir=args.result_cache_dir, count_cache_dir=args.count_cache_dir,
+								return_doc_counts=args.worst_docs > 0 or args.bootstrap > 0)
+	docs_counts = None
+	if args.worst_docs > 0 or args.bootstrap > 0:
+		results, docs_counts = [metrics for metrics, _ in results], [doc_counts for _, doc_counts in results]
+	if args.output:
+		with open(args.output, "w") as out:
+			write_results_table(pred_files, results, out)
+	else:
+		write_results_table(pred_files, results, sys.stdout)
+	if docs_counts is not None:
+		for pred_file, metrics, doc_counts in zip(pred_files, results, docs_counts):
+			if doc_counts is None:
+				continue
+			print(f"\n{pred_file}")
+			if args.worst_docs > 0:
+				print(doc_counts.format_worst_documents(args.worst_docs))
+			if args.bootstrap > 0 and doc_counts.docnames:
+				intervals = bootstrap_intervals(doc_counts, args.bootstrap, confidence=args.confidence, seed=args.seed)
+				print(format_intervals(metrics, intervals, confidence=args.confidence))
+
+
+if __name__ == "__main__":
+	main()
@@ -1,10 +1,17 @@
 class Mention:
+    # the mentions are not modified once they are created (apart from completing them in the constructors
+    # of the subclasses), so that their hash and sort key can be computed only once
+    __slots__ = ('_words', '_wordsset', '_minset', '_is_referring', '_is_split_antecedent', '_split_antecedent_sets',
+                 '_is_zero', '_super_exact', '_hash', '_sort_key', '_is_contiguous')
+    # difference between the indices of two adjacent words, None if the indices are not numbers
+    WORD_STEP = 1
+
     def __init__(self, matching="exact"):
         # here we only include the properties might be used outside the mention class,
         # and assign a default value to make sure no error even if fuction not used by
         # specific format
-        self._words = []  # store all word indies
-        self._wordsset = set()
+        self._words = ()  # store all word indies, sorted
+        self._wordsset = frozenset()
         self._minset = set()
         self._is_referring = True  # for non-referring
         self._is_split_antecedent = False  # for split-antecedent
@@ -12,13 +19,11 @@ class Mention:
         self._is_zero = False
         # in case of the "head" matching, the two mentions are considered to be the same
         # only if their spans as well as their min sets are the same
-        if matching == "head":
-            self._eq_match = self._super_exact_match
-            self._hash_match = self._super_exact_match_hash
         # for the remaining matching types, it is sufficient for the spans to be tha same
-        else:
-            self._eq_match = self._exact_match
-            self._hash_match = self._exact_match_hash
+        self._super_exact = matching == "head"
+        self._hash = None
+        self._sort_key = None
+        self._is_contiguous = None
 
     ############## Properties ###############
 
@@ -50,6 +55,18 @@ class Mention:
     def split_antecedent_sets(self):
         return self._split_antecedent_sets
 
+    # the words form a single span without gaps, so that the mention can be handled as an interval
+    # of the word indices that are multiples of WORD_STEP
+    @property
+    def is_contiguous(self):
+        if self._is_contiguous is None:
+            words = self._words
+            self._is_contiguous = bool(words) and self.WORD_STEP is not None \
+                and len(self._wordsset) == len(words) \
+                and words[-1] - words[0] == self.WORD_STEP * (len(words) - 1) \
+                and all(w % self.WORD_STEP == 0 for w in words)
+        return self._is_contiguous
+
     ############## Operators ###############
 
     def __getitem__(self, i):
@@ -59,47 +76,92 @@ class Mention:
         return len(self._words)
 
     def __eq__(self, other):
-        return self._eq_match(other)
+        if self._super_exact:
+            return self._super_exact_match(other)
+        return self._exact_match(other)
 
     def __ne__(self, other):
         return not self.__eq__(other)
 
     def __lt__(self, other):
+        # ordered by the start, the end and the number of words
         if isinstance(other, self.__class__):
-            if self._words[0] == other._words[0]:
-                if self._words[-1] == other._words[-1]:
-                    return len(self._words) < len(other._words)
-                else:
-                    return self._words[-1] < other._words[-1]
-            else:
-                return self._words[0] < other._words[0]
+            return self._get_sort_key() < other._get_sort_key()
         return NotImplemented
 
     def __le__(self, other):
         return self.__lt__(other) or self.__eq__(other)
 
     def __hash__(self):
-        if self.is_split_antecedent:
-            return hash(frozenset(self.split_antecedent_sets))
-        return self._hash_match()
+        if self._hash is None:
+            if self.is_split_antecedent:
+                self._hash = hash(frozenset(self.split_antecedent_sets))
+            elif self._super_exact:
+                self._hash = self._super_exact_match_hash()
+            else:
+                self._hash = self._exact_match_hash()
+        return self._hash
+
+    def _get_sort_key(self):
+        if self._sort_key is None:
+            self._sort_key = (self.word_position(self._words[0]), self.word_position(self._words[-1]), len(self._words))
+        return self._sort_key
 
     def __str__(self):
         if self.is_split_antecedent:
             return "({:s})".format(",".join([str(cl[0]) for cl in self.split_antecedent_sets]))
         return "({:s})".format(
-            ",".join([str(w) + "*" if self._minset and w in self._minset else str(w) for w in self._words]))
+            ",".join([self._word_str(w) + "*" if self._minset and w in self._minset else self._word_str(w)
+                      for w in self._words]))
+
+    def _word_str(self, w):
+        return str(w)
+
+    # the position of the word index in the order of the document, comparable with the positions
+    # of all the other words (the indices themselves may not be, see UAMention)
+    @staticmethod
+    def word_position(w):
+        return w
 
     def __repr__(self):
         return str(self)
 
+    # a representation of the mention by plain values, which (unlike the hash) does not change between
+    # the processes, e.g. to recognize an unchanged document in a cache of results
+    def fingerprint(self):
+        split_antecedent_sets = sorted(tuple(m.fingerprint() for m in cl) for cl in self._split_antecedent_sets)
+        return (type(self).__name__, self._words, tuple(sorted(self._minset)), self._is_referring,
+                self._is_split_antecedent, tuple(split_antecedent_sets), self._is_zero, self._super_exact)
+
     def intersection(self, other):
         if isinstance(other, self.__class__):
-            if self._words[0] > other._words[-1] or \
-                other._words[0] > self._words[-1]:
+            if self.word_position(self._words[0]) > self.word_position(other._words[-1]) or \
+                self.word_position(other._words[0]) > self.word_position(self._words[-1]):
                 return []
             return self._wordsset.intersection(other._wordsset)
         return NotImplemented
 
+    # the following methods compute the same as the corresponding set operations on the words,
+    # by interval arithmetic if both mentions are contiguous
+
+    def intersection_size(self, other):
+        if self.is_contiguous and other.is_contiguous:
+            start = max(self._words[0], other._words[0])
+            end = min(self._words[-1], other._words[-1])
+            return (end - start) // self.WORD_STEP + 1 if start <= end else 0
+        return len(self.intersection(other))
+
+    # other is a part of self
+    def contains(self, other):
+        if self.is_contiguous and other.is_contiguous:
+            return self._words[0] <= other._words[0] and other._words[-1] <= self._words[-1]
+        return other._wordsset.issubset(self._wordsset)
+
+    def contains_word(self, w):
+        if self.is_contiguous:
+            return self._words[0] <= w <= self._words[-1] and w % self.WORD_STEP == 0
+        return w in self._wordsset
+
     ############## Matching types #################
 
     # both mention span and its min set must be matched exactly
@@ -112,11 +174,7 @@ class Mention:
             return self.split_antecedent_sets == other.split_antecedent_sets
 
         # check if the mention spans are the same
-        # TODO rewrite using _wordsset
-        if len(self._words) != len(other._words):
-            return False
-        words_zip = zip(self._words, other._words)
-        if not all(self_w == other_w for self_w, other_w in words_zip):
+        if self._words != other._words:
             return False
 
         # check if the min spans / heads are the same
@@ -129,10 +187,7 @@ class Mention:
             if self.is_split_antecedent or other.is_split_antecedent:
                 return self.split_antecedent_sets == other.split_antecedent_sets
             else:
-                if len(self._words) != len(other._words):
-                    return False
-                words_zip = zip(self._words, other._words)
-                return all(self_w == other_w for self_w, other_w in words_zip)
+                return self._words == other._words
 
     def match_score(self, other, matching):
         if not isinstance(other, self.__class__):
@@ -150,15 +205,34 @@ class Mention:
             return 1.0
         return 0.0
 
+    # Keys used to find the candidate pairs for match_score without comparing all the mentions:
+    # a key mention can get a nonzero score only with the sys mentions indexed under one of its lookup keys.
+    # None means that the candidates cannot be narrowed down and all the pairs must be scored.
+    # self = sys mention
+    def match_index_keys(self, matching):
+        if matching == "partial-corefud":
+            return self._wordsset
+        if matching == "head":
+            return [frozenset(self._minset)]
+        return None
+
+    # self = key mention
+    def match_lookup_keys(self, matching):
+        if matching == "partial-corefud":
+            # the sys mention must contain all the MIN words, so any of them will do
+            return [next(iter(self._minset))] if self._minset else []
+        if matching == "head":
+            return [frozenset(self._minset)]
+        return None
+
     # Default (with MIN tag) similar to the CorefUD that allow the response to be part of the key, in the
     #             sametime the response must include all the words in MIN(head), if the above condition is
     #             satisfied then a non-zero similarity score based on the proportion of the common words
     #             (num_of_common_words/total_words_in_key) will be returned otherwise 0 will be returned.
     # self = key mention, other = sys mention
     def corefud_partial_match_score(self, other):
-        if self._minset and self._minset.issubset(other._wordsset) and other._wordsset.issubset(
-            self._wordsset):
-            return len(self._wordsset & other._wordsset) * 1.0 / len(self._wordsset)
+        if self._minset and all(other.contains_word(w) for w in self._minset) and self.contains(other):
+            return len(other._wordsset) * 1.0 / len(self._wordsset)
         return 0.0
 
     # CRAFT (with craft tag) same as the CRAFT 2019 CR task that use the first key span as the MIN and any
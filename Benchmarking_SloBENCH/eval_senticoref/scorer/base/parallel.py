@@ -0,0 +1,47 @@
+"""Per-document work spread over a pool of processes.
+
+Documents are independent until their counts are summed up. The results are returned in
+the order of the documents, so that the sums are carried out in the same order, and thus
+give exactly the same scores as a serial run.
+
+Where possible, the worker processes are forked and read the documents from the memory
+inherited from the parent process instead of receiving them pickled. Besides saving the
+pickling, this keeps the documents exactly as they are: a pickled set (such as the
+split_antecedent_sets of a mention) does not have to iterate in its original order.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+# the documents of the running map_documents call, inherited by the forked workers
+_documents = None
+
+
+def _apply(function, i):
+    return function(_documents[i])
+
+
+def map_documents(function, documents, jobs=1):
+    """[function(document) for document in documents], computed by `jobs` processes if jobs > 1.
+
+    `function` and the values it returns must be picklable, the documents only if the
+    fork start method is not available.
+    """
+    global _documents
+    documents = list(documents)
+    if not jobs or jobs <= 1 or len(documents) <= 1:
+        return [function(document) for document in documents]
+
+    # several documents per task, but still enough tasks to balance documents of different sizes
+    chunksize = max(1, len(documents) // (4 * jobs))
+    workers = min(jobs, len(documents))
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(function, documents, chunksize=chunksize))
+
+    _documents = documents
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as executor:
+            return list(executor.map(partial(_apply, function), range(len(documents)), chunksize=chunksize))
+    finally:
+        _documents = None
@@ -1,6 +1,28 @@
 import logging
-import numpy as np
-from scipy.optimize import linear_sum_assignment
+from collections import defaultdict
+from scipy.sparse import coo_matrix
+from scorer.base.assignment import max_score_assignment
+from scorer.base.parallel import map_documents
+
+
+class CorefInfo(tuple):
+    """The coref info of a document, (key_clusters, sys_clusters, key_mention_sys_cluster, sys_mention_key_cluster,
+    mention_alignment_dict), as stored in Reader.doc_coref_infos.
+
+    The reader also records whether the clusters contain any split antecedents (None if it does not know), so that
+    the evaluation skips the alignment of the split antecedents in the documents without them.
+    """
+
+    def __new__(cls, key_clusters, sys_clusters, key_mention_sys_cluster, sys_mention_key_cluster,
+                mention_alignment_dict, has_split_antecedents=None):
+        coref_info = super().__new__(cls, (key_clusters, sys_clusters, key_mention_sys_cluster,
+                                           sys_mention_key_cluster, mention_alignment_dict))
+        coref_info.has_split_antecedents = has_split_antecedents
+        return coref_info
+
+    def __reduce__(self):
+        return CorefInfo, tuple(self) + (self.has_split_antecedents,)
+
 
 class Reader:
     class DataAlignError(BaseException):
@@ -26,6 +48,9 @@ class Reader:
         def __str__(self):
             return self.message
 
+    # the number of documents per process in a batch of the streaming mode
+    STREAMING_DOCS_PER_JOB = 8
+
     def __init__(self,**kwargs):
         self._doc_coref_infos = {}
         self._doc_non_referring_infos={}
@@ -33,6 +58,8 @@ class Reader:
         self._doc_discourse_deixis_infos = {}
 
         self._doc_mention_aligns = {}
+        # the position of the documents in the files
+        self._doc_numbers = {}
 
         self.keep_singletons = kwargs.get("keep_singletons",False)
         self.keep_split_antecedents = kwargs.get("keep_split_antecedents",False)
@@ -45,6 +72,12 @@ class Reader:
         self.allow_boundary_crossing = kwargs.get("allow_boundary_crossing",False)
         self.np_only = kwargs.get('np_only',False)
         self.remove_nested_mentions = kwargs.get('remove_nested_mentions',False)
+        self.jobs = kwargs.get('jobs', 1)
+        # in the streaming mode, only the infos of the documents of the last batch are kept
+        self.streaming = kwargs.get('streaming', False)
+        # (index, count): only every count-th document starting with the index-th one is evaluated,
+        # so that the documents can be split among several runs (see scorer.eval.partial)
+        self.shard = kwargs.get('shard', None)
 
     #the minimum requirement is to implement the coreference part
     @property
@@ -67,9 +100,63 @@ class Reader:
     def doc_mention_aligns(self):
         return self._doc_mention_aligns
 
-    def get_coref_infos(self, key_file, sys_file):
+    @property
+    def doc_numbers(self):
+        return self._doc_numbers
+
+    def get_docs(self, key_file, sys_file, **kwargs):
+        """Yields (docname, key_clusters, sys_clusters, doc_data) for every document, where doc_data
+        is whatever set_doc_infos needs to store the remaining infos of the document.
+        In the streaming mode, the key and sys files are read in parallel, one document after another.
+        """
+        return NotImplemented
+
+    def set_doc_infos(self, docname, key_clusters, sys_clusters, assignments, doc_data):
         return NotImplemented
 
+    def get_coref_infos(self, key_file, sys_file, **kwargs):
+        for _ in self.iter_coref_infos(key_file, sys_file, **kwargs):
+            pass
+
+    def iter_coref_infos(self, key_file, sys_file, **kwargs):
+        """Reads and aligns the documents in batches, storing their infos in the doc_*_infos dicts.
+
+        The names of the documents of a batch are yielded once the batch is stored. In the streaming
+        mode, the infos of the previous batch are dropped before the next batch is stored, so that the
+        memory depends on the size of a batch (a single document, or a few documents per process if
+        jobs > 1) instead of the whole files. Otherwise, all the documents form a single batch.
+        The documents of the other shards (see shard) are read, but neither aligned nor stored.
+        """
+        batch_size = self.jobs * self.STREAMING_DOCS_PER_JOB if self.jobs and self.jobs > 1 else 1
+        batch = []
+        for doc_number, doc in enumerate(self.get_docs(key_file, sys_file, **kwargs)):
+            if self.shard is not None and doc_number % self.shard[1] != self.shard[0]:
+                continue
+            self._doc_numbers[doc[0]] = doc_number
+            batch.append(doc)
+            if self.streaming and len(batch) >= batch_size:
+                yield self.set_batch_infos(batch)
+                batch = []
+        if batch:
+            yield self.set_batch_infos(batch)
+
+    def set_batch_infos(self, batch):
+        if self.streaming:
+            self.clear_doc_infos()
+        # the alignment of the mentions is independent for every document
+        docs_assignments = self.get_docs_mention_assignments(
+            [(key_clusters, sys_clusters) for _, key_clusters, sys_clusters, _ in batch])
+        for (docname, key_clusters, sys_clusters, doc_data), assignments in zip(batch, docs_assignments):
+            self.set_doc_infos(docname, key_clusters, sys_clusters, assignments, doc_data)
+        return [docname for docname, _, _, _ in batch]
+
+    def clear_doc_infos(self):
+        self._doc_coref_infos.clear()
+        self._doc_non_referring_infos.clear()
+        self._doc_bridging_infos.clear()
+        self._doc_discourse_deixis_infos.clear()
+        self._doc_mention_aligns.clear()
+
     def get_mention_to_clusterid_map(self, entities):
         mention_to_clusterid = {}
         for clusterid, cluster in enumerate(entities):
@@ -97,31 +184,66 @@ class Reader:
         # 2 and 3 were done by sorting so that the mentions were sorted with the starts and ends.
         key_mentions = sorted(key_mention_set)
         sys_mentions = sorted(sys_mention_set)
+        # only the pairs found by the index can get a nonzero score, all the others score 0
+        candidates = self.get_match_candidates(key_mentions, sys_mentions, matching)
         if matching == "partial-craft":
-            key_used = {km: False for km in key_mentions}
-            for sm in sys_mentions:
-                for km in key_mentions:
-                    # if not key_used[j] and km.similarity_scores(sm, method='craft') > 0:
+            # sweep the sys mentions in order, each of them is assigned to the first (if not yet used)
+            # key mention it has a nonzero score with
+            sys_candidates = defaultdict(list)
+            for k, s in candidates:
+                sys_candidates[s].append(k)
+            key_used = set()
+            for s, sm in enumerate(sys_mentions):
+                for k in sys_candidates.get(s, []):
+                    km = key_mentions[k]
                     if km.match_score(sm, matching) > 0:
-                        if not key_used[km]:
-                            key_used[km] = True
-                            # print(str(km), str(sm))
+                        if km not in key_used:
+                            key_used.add(km)
                             assigns.append((km, sm))
                         break
         # matching in ["partial-corefud", "head", "zero-dependent"]
         else:
-            similarity = np.zeros((len(key_mentions), len(sys_mentions)))
-            for i, km in enumerate(key_mentions):
-                for j, sm in enumerate(sys_mentions):
-                    similarity[i, j] = km.match_score(sm, matching)
-            # print(similarity)
-            key_ind, sys_ind = linear_sum_assignment(-similarity)
+            similarity = {}
+            for k, s in candidates:
+                score = key_mentions[k].match_score(sys_mentions[s], matching)
+                if score > 0:
+                    similarity[k, s] = score
+            if not similarity:
+                return []
+            key_ind, sys_ind = max_score_assignment(coo_matrix(
+                (list(similarity.values()), tuple(zip(*similarity))), shape=(len(key_mentions), len(sys_mentions))))
             assigns = [(key_mentions[k], sys_mentions[s])
                 for k, s in zip(key_ind, sys_ind)
-                if similarity[k, s] > 0
+                if similarity.get((k, s), 0) > 0
             ]
         return assigns
 
+    def get_match_candidates(self, key_mentions, sys_mentions, matching):
+        """Index pairs (k, s) of the key and sys mentions that may have a nonzero match score.
+
+        The sys mentions are indexed by their match_index_keys and looked up by the match_lookup_keys
+        of the key mentions. The pairs are ordered by k and s. If the mentions do not provide the keys,
+        all the pairs are returned.
+        """
+        index = defaultdict(list)
+        for s, sm in enumerate(sys_mentions):
+            keys = sm.match_index_keys(matching)
+            if keys is None:
+                return [(k, s) for k in range(len(key_mentions)) for s in range(len(sys_mentions))]
+            for key in keys:
+                index[key].append(s)
+
+        candidates = []
+        for k, km in enumerate(key_mentions):
+            keys = km.match_lookup_keys(matching)
+            if keys is None:
+                return [(k, s) for k in range(len(key_mentions)) for s in range(len(sys_mentions))]
+            sys_ind = set()
+            for key in keys:
+                sys_ind.update(index.get(key, []))
+            candidates.extend((k, s) for s in sorted(sys_ind))
+        return candidates
+
     def find_mention_alignment(self, key_mention_set, sys_mention_set):
         key_non_aligned = key_mention_set.copy()
         sys_non_aligned = sys_mention_set.copy()
@@ -180,3 +302,35 @@ class Reader:
         nonexact_mention_align_dict = self.get_nonexact_mention_align_dict(mention_aligns)
 
         return key_mention_to_clusterid, sys_mention_to_clusterid, nonexact_mention_align_dict, mention_aligns
+
+    def _get_doc_mention_assignments(self, doc_clusters):
+        return self.get_mention_assignments(*doc_clusters)
+
+    def get_docs_mention_assignments(self, docs_clusters):
+        """get_mention_assignments for the (key_clusters, sys_clusters) pairs of all the documents.
+
+        The documents are aligned by `self.jobs` processes.
+        """
+        docs_assignments = map_documents(self._get_doc_mention_assignments, docs_clusters, self.jobs)
+        if self.jobs and self.jobs > 1:
+            docs_assignments = [self.get_own_mention_assignments(key_clusters, sys_clusters, assignments)
+                                for (key_clusters, sys_clusters), assignments in zip(docs_clusters, docs_assignments)]
+        return docs_assignments
+
+    def get_own_mention_assignments(self, key_clusters, sys_clusters, assignments):
+        # mentions returned by another process are copies, they are replaced by the (first equal) mentions
+        # of the clusters, as if the assignments had been computed in this process
+        key_mentions, sys_mentions = {}, {}
+        for cl in key_clusters:
+            for m in cl:
+                key_mentions.setdefault(m, m)
+        for cl in sys_clusters:
+            for m in cl:
+                sys_mentions.setdefault(m, m)
+
+        key_mention_to_clusterid, sys_mention_to_clusterid, _, mention_aligns = assignments
+        key_mention_to_clusterid = {key_mentions[m]: cid for m, cid in key_mention_to_clusterid.items()}
+        sys_mention_to_clusterid = {sys_mentions[m]: cid for m, cid in sys_mention_to_clusterid.items()}
+        mention_aligns = [(key_mentions[km], sys_mentions[sm]) for km, sm in mention_aligns]
+        nonexact_mention_align_dict = self.get_nonexact_mention_align_dict(mention_aligns)
+        return key_mention_to_clusterid, sys_mention_to_clusterid, nonexact_mention_align_dict, mention_aligns
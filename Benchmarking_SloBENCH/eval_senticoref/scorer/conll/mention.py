@@ -3,12 +3,14 @@ import logging
 from scorer.base.mention import Mention
 
 class CoNLLMention(Mention):
+    __slots__ = ('_gold_parse',)
+    # words are (sentence, word) pairs
+    WORD_STEP = None
+
     def __init__(self, sent_num, start, end):
         super().__init__()
-        for w in range(start,end+1):
-            self._words.append((sent_num,w))
-        self._words.sort()
-        self._wordsset = set(self._words)
+        self._words = tuple((sent_num, w) for w in range(start, end + 1))
+        self._wordsset = frozenset(self._words)
 
 
         #class specific property
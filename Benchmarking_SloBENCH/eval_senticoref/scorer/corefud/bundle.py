@@ -0,0 +1,187 @@
+"""Precompiled key (ground truth) files in the CorefUD format.
+
+When many submissions are scored against the same key file, the key can be compiled once into a
+bundle: an .npz file with the documents read by scorer.corefud.conllu, stored as flat arrays
+(word positions, heads and head deps of the mentions, cluster and document offsets, and the
+sentences needed to check the alignment with a submission). Loading a bundle skips the parsing
+of the key file.
+
+Bundles are stored in a directory under the SHA-256 hash of the content of the key file, so
+a bundle is only used for exactly the same key file it was compiled from.
+
+    python -m scorer.corefud.bundle key.conllu [-o key_bundles]
+"""
+import argparse
+import hashlib
+import os
+
+import numpy as np
+
+from scorer.corefud.conllu import Document, Sentence, read_documents
+from scorer.corefud.mention import CorefUDMention
+
+BUNDLE_VERSION = 1
+
+# how an optional value (docid, sent_id, newdoc) is stored: the value is None, True, a string or an int
+_NONE, _TRUE, _STR, _INT = 0, 1, 2, 3
+
+
+def file_hash(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def get_bundle_path(bundle_dir, key_file):
+    return os.path.join(bundle_dir, file_hash(key_file) + '.npz')
+
+
+def _pack_strings(strings):
+    # the strings never contain a newline, as they all come from single lines of a CoNLL-U file
+    return np.frombuffer('\n'.join(strings).encode('utf-8'), dtype=np.uint8)
+
+
+def _unpack_strings(array, count):
+    return bytes(array).decode('utf-8').split('\n') if count else []
+
+
+def _pack_value(value):
+    if value is None:
+        return _NONE, ''
+    if value is True:
+        return _TRUE, ''
+    if isinstance(value, int):
+        return _INT, str(value)
+    return _STR, value
+
+
+def _unpack_value(kind, value):
+    if kind == _NONE:
+        return None
+    if kind == _TRUE:
+        return True
+    if kind == _INT:
+        return int(value)
+    return value
+
+
+def compile_bundle(key_file, bundle_dir):
+    """Reads the key file and stores it as a bundle in bundle_dir. Returns the path of the bundle."""
+    arrays = {name: [] for name in ['doc_kinds', 'doc_ids', 'doc_sentences', 'doc_clusters',
+                                    'sent_id_kinds', 'sent_ids', 'newdoc_kinds', 'newdocs', 'sentence_forms',
+                                    'forms', 'cluster_mentions', 'mention_words', 'words', 'heads',
+                                    'mention_deps', 'dep_parents', 'deprels']}
+    offsets = {name: 0 for name in ['doc_sentences', 'doc_clusters', 'sentence_forms', 'cluster_mentions',
+                                    'mention_words', 'mention_deps']}
+    for name in offsets:
+        arrays[name].append(0)
+
+    for doc in read_documents(key_file):
+        kind, docid = _pack_value(doc.docid)
+        arrays['doc_kinds'].append(kind)
+        arrays['doc_ids'].append(docid)
+        for sentence in doc.sentences:
+            kind, sent_id = _pack_value(sentence.sent_id)
+            arrays['sent_id_kinds'].append(kind)
+            arrays['sent_ids'].append(sent_id)
+            kind, newdoc = _pack_value(sentence.newdoc)
+            arrays['newdoc_kinds'].append(kind)
+            arrays['newdocs'].append(newdoc)
+            arrays['forms'].extend(sentence.forms)
+            offsets['sentence_forms'] += len(sentence.forms)
+            arrays['sentence_forms'].append(offsets['sentence_forms'])
+        offsets['doc_sentences'] += len(doc.sentences)
+        arrays['doc_sentences'].append(offsets['doc_sentences'])
+        for cluster in doc.clusters:
+            for mention in cluster:
+                arrays['words'].extend(mention.words)
+                offsets['mention_words'] += len(mention.words)
+                arrays['mention_words'].append(offsets['mention_words'])
+                arrays['heads'].append(next(iter(mention._minset)))
+                for parent, deprel in mention._head_deps:
+                    arrays['dep_parents'].append(parent)
+                    arrays['deprels'].append(deprel)
+                offsets['mention_deps'] += len(mention._head_deps)
+                arrays['mention_deps'].append(offsets['mention_deps'])
+            offsets['cluster_mentions'] += len(cluster)
+            arrays['cluster_mentions'].append(offsets['cluster_mentions'])
+        offsets['doc_clusters'] += len(doc.clusters)
+        arrays['doc_clusters'].append(offsets['doc_clusters'])
+
+    counts = {name: len(arrays[name]) for name in ['doc_ids', 'sent_ids', 'newdocs', 'forms', 'deprels']}
+    for name in counts:
+        arrays[name] = _pack_strings(arrays[name])
+    for name in ['doc_kinds', 'sent_id_kinds', 'newdoc_kinds']:
+        arrays[name] = np.array(arrays[name], dtype=np.uint8)
+    for name in ['doc_sentences', 'doc_clusters', 'sentence_forms', 'cluster_mentions', 'mention_words',
+                 'words', 'heads', 'mention_deps', 'dep_parents']:
+        arrays[name] = np.array(arrays[name], dtype=np.int64)
+    arrays['counts'] = np.array([counts[name] for name in sorted(counts)], dtype=np.int64)
+    arrays['version'] = np.array([BUNDLE_VERSION], dtype=np.int64)
+
+    os.makedirs(bundle_dir, exist_ok=True)
+    path = get_bundle_path(bundle_dir, key_file)
+    # written under a temporary name first, so that an incomplete bundle is never loaded
+    tmp_path = path + '.tmp.npz'
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_bundle(path, matching="head"):
+    """Yields the documents (see scorer.corefud.conllu.Document) stored in a bundle."""
+    with np.load(path) as bundle:
+        arrays = {name: bundle[name] for name in bundle.files}
+    if int(arrays['version'][0]) != BUNDLE_VERSION:
+        raise ValueError(f"Unsupported version of the key bundle {path}")
+    counts = dict(zip(sorted(['doc_ids', 'sent_ids', 'newdocs', 'forms', 'deprels']), arrays['counts'].tolist()))
+    strings = {name: _unpack_strings(arrays[name], counts[name]) for name in counts}
+    lists = {name: arrays[name].tolist() for name in ['doc_kinds', 'sent_id_kinds', 'newdoc_kinds',
+                                                      'doc_sentences', 'doc_clusters', 'sentence_forms',
+                                                      'cluster_mentions', 'mention_words', 'words', 'heads',
+                                                      'mention_deps', 'dep_parents']}
+
+    sent_offsets, form_offsets = lists['doc_sentences'], lists['sentence_forms']
+    cluster_offsets, mention_offsets = lists['doc_clusters'], lists['cluster_mentions']
+    word_offsets, dep_offsets = lists['mention_words'], lists['mention_deps']
+    for d in range(len(lists['doc_kinds'])):
+        sentences = []
+        for s in range(sent_offsets[d], sent_offsets[d + 1]):
+            sentences.append(Sentence(_unpack_value(lists['sent_id_kinds'][s], strings['sent_ids'][s]),
+                                      _unpack_value(lists['newdoc_kinds'][s], strings['newdocs'][s]),
+                                      strings['forms'][form_offsets[s]:form_offsets[s + 1]]))
+        clusters = []
+        for c in range(cluster_offsets[d], cluster_offsets[d + 1]):
+            cluster = []
+            for m in range(mention_offsets[c], mention_offsets[c + 1]):
+                head_deps = tuple(zip(lists['dep_parents'][dep_offsets[m]:dep_offsets[m + 1]],
+                                      strings['deprels'][dep_offsets[m]:dep_offsets[m + 1]]))
+                cluster.append(CorefUDMention.from_positions(lists['words'][word_offsets[m]:word_offsets[m + 1]],
+                                                             lists['heads'][m], head_deps, matching=matching))
+            clusters.append(cluster)
+        yield Document(_unpack_value(lists['doc_kinds'][d], strings['doc_ids'][d]), sentences, clusters)
+
+
+def read_key_documents(key_file, matching="head", bundle_dir=None):
+    """Yields the documents of the key file, from its bundle in bundle_dir if there is one."""
+    if bundle_dir and os.path.isdir(bundle_dir):
+        path = get_bundle_path(bundle_dir, key_file)
+        if os.path.exists(path):
+            return read_bundle(path, matching=matching)
+    return read_documents(key_file, matching=matching)
+
+
+def main():
+    argparser = argparse.ArgumentParser(description="Compile CorefUD key files into bundles for repeated scoring")
+    argparser.add_argument('key_files', nargs='+', help='paths to the key/reference files')
+    argparser.add_argument('-o', '--bundle-dir', default='key_bundles',
+                           help='directory where the bundles are stored')
+    args = argparser.parse_args()
+    for key_file in args.key_files:
+        print(compile_bundle(key_file, args.bundle_dir))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,441 @@
+"""Streaming reader of the coreference annotation in CoNLL-U files (CorefUD format).
+
+Only the columns the scorer needs are parsed: ID, FORM, DEPS and the Entity, SplitAnte and Bridge
+attributes in MISC. No dependency trees are built, and the file is read document by document
+(# newdoc), so that a document can be evaluated as soon as it is read.
+
+The annotation is interpreted in the same way as udapi does it when loading coreference
+(udapi.core.coref.load_coref_from_misc in the strict mode), including the bracketed Entity notation,
+discontinuous mentions ([1/2] subspans), empty nodes and head indices. The words are represented
+by their positions, as defined by CorefUDMention.WordOrd, with the sentences numbered in the same
+way as the udapi bundles. Entity types, other entity attributes and bridging relations are not
+needed for the evaluation and are only checked as much as udapi checks them.
+"""
+import logging
+import re
+
+from scorer.base.reader import Reader
+from scorer.corefud.mention import CorefUDMention
+
+RE_SENT_ID = re.compile(r'^# sent_id\s*=?\s*(\S+)')
+RE_NEWDOC = re.compile(r'^# newdoc(?:\s+id\s*=\s*(.+))?$')
+RE_GLOBAL_ENTITY = re.compile(r'^# global.Entity\s*=\s*(\S+)')
+RE_ENTITY_CHUNKS = re.compile(r'(\([^()]+\)?|[^()]+\))')
+RE_DISCONTINUOUS = re.compile(r'^([^[]+)\[(\d+)/(\d+)\]')
+
+MISC_ATTRS = ('Entity', 'SplitAnte', 'Split', 'Bridge')
+
+ORD_SCALE = CorefUDMention.WordOrd.ORD_SCALE
+SENT_SCALE = CorefUDMention.WordOrd.SENT_SCALE
+
+
+class Sentence:
+    """The parts of a sentence that are compared when checking the alignment of the key and sys files."""
+    __slots__ = ('sent_id', 'newdoc', 'forms')
+
+    def __init__(self, sent_id, newdoc, forms):
+        self.sent_id = sent_id
+        self.newdoc = newdoc
+        self.forms = forms
+
+    def word_str(self, i):
+        return f"<{self.sent_id}#{i + 1}, {self.forms[i]}>"
+
+    def __str__(self):
+        return f"<{self.sent_id}>"
+
+
+class Document:
+    """A document read from a CoNLL-U file: its sentences and its coreference clusters,
+    each of them a list of CorefUDMention. The clusters are ordered by their first mentions.
+    """
+    __slots__ = ('docid', 'sentences', 'clusters')
+
+    def __init__(self, docid, sentences, clusters):
+        self.docid = docid
+        self.sentences = sentences
+        self.clusters = clusters
+
+
+class _Mention:
+    # a mention being read: word positions in the order they were added and the head position
+    __slots__ = ('eid', 'words', 'head', 'doc', 'closed')
+
+    def __init__(self, eid, position, doc):
+        self.eid = eid
+        self.words = [position]
+        self.head = position
+        self.doc = doc
+        self.closed = False
+
+    def sort_words(self):
+        # udapi sorts the mention words by their ords within the sentence
+        self.words.sort(key=lambda w: w % SENT_SCALE)
+        return self.words
+
+    def sort_key(self):
+        return self.words[0], -len(self.words), self.words[-1], self.eid
+
+
+def _parse_misc(misc):
+    attrs = {}
+    if misc == '_':
+        return attrs
+    for item in misc.split('|'):
+        name, _, value = item.partition('=')
+        if name in MISC_ATTRS:
+            attrs[name] = value
+    return attrs
+
+
+def _parse_deps(raw_deps, head):
+    # (parent position, deprel) for every item of the DEPS column of the head
+    if not raw_deps or raw_deps == '_':
+        return ()
+    sent_base = head - head % SENT_SCALE
+    deps = []
+    for item in raw_deps.split('|'):
+        parent, colon, deprel = item.partition(':')
+        try:
+            if not colon:
+                raise ValueError(f"missing : in {item}")
+            deps.append((sent_base + round(float(parent) * ORD_SCALE), deprel))
+        except ValueError as err:
+            raise Reader.CorefFormatError(f"Invalid DEPS {raw_deps} of {CorefUDMention.WordOrd.to_str(head)}: {err}")
+    return tuple(deps)
+
+
+class _Parser:
+    """Reads the documents of a single file, keeping only the state of the mentions that are still open."""
+
+    def __init__(self, matching):
+        self.matching = matching
+        self.global_entity = None
+        self.fields = None
+        self.grp_docs = 0
+        self.grp_prefix = ""
+        self.bundle = 0
+        self.last_bundle_id = None
+        self.doc_count = 0
+        # eids of the entities created so far, the ones created only by a SplitAnte or Bridge reference
+        # must get a mention by the end of the file
+        self.entities = set()
+        self.referenced = set()
+        self.unfinished = {}
+        self.discontinuous = {}
+        # first mention sort key and last document of the entities that have been output
+        self.entity_first = {}
+        self.entity_doc = {}
+
+    def read(self, file_path):
+        doc = None
+        with open(file_path, encoding='utf-8-sig') as f:
+            block = []
+            for line in f:
+                line = line.rstrip('\r\n')
+                if line:
+                    block.append(line)
+                    continue
+                if block:
+                    finished, doc = self.read_block(block, doc)
+                    if finished is not None:
+                        yield self.finish_document(finished)
+                    block = []
+            if block:
+                finished, doc = self.read_block(block, doc)
+                if finished is not None:
+                    yield self.finish_document(finished)
+        if doc is not None:
+            yield self.finish_document(doc)
+        self.finish_file()
+
+    def read_block(self, lines, doc):
+        """Reads a sentence into the document being read. Returns the finished document (if the sentence
+        starts a new one, None otherwise) and the document being read.
+        """
+        sent_id, newdoc = None, None
+        nodes = []
+        forms = []
+        for line in lines:
+            if line[0] == '#':
+                match = RE_SENT_ID.match(line)
+                if match:
+                    sent_id = match.group(1)
+                    continue
+                match = RE_NEWDOC.match(line)
+                if match:
+                    newdoc = match.group(1) or True
+                    continue
+                match = RE_GLOBAL_ENTITY.match(line)
+                if match:
+                    self.set_global_entity(match.group(1))
+                continue
+            columns = line.split('\t')
+            wid = columns[0]
+            if '-' in wid:
+                continue
+            misc = columns[9] if len(columns) > 9 else '_'
+            deps = columns[8] if len(columns) > 8 else '_'
+            try:
+                ord = float(wid) if '.' in wid else int(wid)
+            except ValueError:
+                raise Reader.CorefFormatError(f"Invalid word ID {wid} in sentence {sent_id}")
+            nodes.append((ord, deps, misc))
+            if isinstance(ord, int):
+                forms.append(columns[1] if len(columns) > 1 else '_')
+
+        # udapi removes the only word of an artificial sentence and skips sentences without words
+        if len(forms) == 1 and [n[2] for n in nodes if isinstance(n[0], int)] == ['Empty=Yes']:
+            nodes = [n for n in nodes if not isinstance(n[0], int)]
+            forms = []
+        elif not forms:
+            return None, doc
+
+        # sentences sharing the bundle id (the part of sent_id before /) share the sentence number
+        bundle_id = sent_id.split('/')[0] if sent_id is not None else None
+        if bundle_id is None or bundle_id != self.last_bundle_id:
+            self.bundle += 1
+        if bundle_id is not None:
+            self.last_bundle_id = bundle_id
+
+        finished = None
+        if newdoc or doc is None:
+            if newdoc or self.grp_prefix == "":
+                self.grp_docs += 1
+                self.grp_prefix = f"d{self.grp_docs}."
+            docid = None
+            if newdoc:
+                self.doc_count += 1
+                docid = newdoc if newdoc is not True else self.doc_count
+            finished, doc = doc, _DocumentState(docid)
+        sentence = Sentence(sent_id, newdoc, forms)
+        doc.sentences.append(sentence)
+
+        sent_base = self.bundle * SENT_SCALE
+        positions = []
+        for ord, deps, misc in sorted(nodes, key=lambda n: n[0]):
+            position = sent_base + round(ord * ORD_SCALE)
+            positions.append(position)
+            if deps != '_':
+                doc.deps[position] = deps
+            if misc != '_':
+                attrs = _parse_misc(misc)
+                if attrs:
+                    self.read_coref(attrs, position, positions, sentence, doc)
+        return finished, doc
+
+    def set_global_entity(self, global_entity):
+        if self.global_entity is not None and self.global_entity != global_entity:
+            logging.warning(f"Mismatch in global.Entity: {self.global_entity} != {global_entity}")
+        self.global_entity = global_entity
+        self.fields = global_entity.split('-')
+
+    def node_str(self, sentence, position):
+        return f"<{sentence.sent_id}#{CorefUDMention.WordOrd.to_str(position).split('-', 1)[1]}>"
+
+    def read_coref(self, attrs, position, positions, sentence, doc):
+        entity = attrs.get('Entity')
+        if entity:
+            if self.global_entity is None:
+                raise Reader.CorefFormatError("No global.Entity header found, but Entity= annotations are presents")
+            if 'GRP' not in self.fields and 'eid' not in self.fields:
+                raise Reader.CorefFormatError("No eid in global.Entity = " + self.global_entity)
+            for chunk in RE_ENTITY_CHUNKS.split(entity):
+                if chunk:
+                    self.read_entity_chunk(chunk, position, positions, sentence, doc)
+
+        grp = 'GRP' in self.fields if self.fields else False
+        bridge = attrs.get('Bridge')
+        if bridge:
+            for link in bridge.split(','):
+                try:
+                    trg, src = link.split('<')
+                except ValueError:
+                    raise Reader.CorefFormatError(f"Invalid Bridge {link} at {self.node_str(sentence, position)}")
+                src = src.split(':', 1)[0]
+                if trg == src:
+                    raise Reader.CorefFormatError(f"Bridge cannot self-reference the same entity {trg} "
+                                                  f"at {self.node_str(sentence, position)}")
+                if grp:
+                    src, trg = self.grp_prefix + src, self.grp_prefix + trg
+                if src not in self.entities or src in self.referenced:
+                    raise Reader.CorefFormatError(f"Bridge from an entity {src} without any mention "
+                                                  f"at {self.node_str(sentence, position)}")
+                self.reference(trg)
+
+        split = attrs.get('SplitAnte') or attrs.get('Split')
+        if split:
+            for link in split.split(','):
+                try:
+                    ante, this = link.split('<')
+                except ValueError:
+                    raise Reader.CorefFormatError(f"Invalid SplitAnte {link} at {self.node_str(sentence, position)}")
+                if ante == this:
+                    raise Reader.CorefFormatError("SplitAnte cannot self-reference the same entity: " + this)
+                if grp:
+                    ante, this = self.grp_prefix + ante, self.grp_prefix + this
+                if this not in self.entities:
+                    raise Reader.CorefFormatError(f"SplitAnte of an unknown entity {this} "
+                                                  f"at {self.node_str(sentence, position)}")
+                self.reference(ante)
+
+    def reference(self, eid):
+        if eid not in self.entities:
+            self.entities.add(eid)
+            self.referenced.add(eid)
+
+    def read_entity_chunk(self, chunk, position, positions, sentence, doc):
+        opening, closing = chunk[0] == '(', chunk[-1] == ')'
+        chunk = chunk.strip('()')
+        if not opening and not closing:
+            logging.warning(f"Entity {chunk} at {self.node_str(sentence, position)} has no opening nor closing bracket.")
+        elif not opening:
+            self.close_mention(chunk, position, positions, sentence)
+        else:
+            self.open_mention(chunk, closing, position, sentence, doc)
+
+    def open_mention(self, chunk, closing, position, sentence, doc):
+        eid, head_idx = None, None
+        for name, value in zip(self.fields, chunk.split('-')):
+            if name == 'eid':
+                eid = value
+            elif name == 'GRP':
+                eid = self.grp_prefix + value
+            elif name == 'head':
+                try:
+                    head_idx = int(value)
+                except ValueError as err:
+                    raise Reader.CorefFormatError(f"Non-integer {value} as head index in {chunk} "
+                                                  f"in {self.node_str(sentence, position)}: {err}")
+        if eid is None:
+            raise Reader.CorefFormatError("No eid in " + chunk)
+        subspan_idx, total_subspans = None, '0'
+        if eid[-1] == ']':
+            match = RE_DISCONTINUOUS.match(eid)
+            if not match:
+                raise Reader.CorefFormatError(f"eid={eid} ending with ], but not valid discontinuous mention ID")
+            eid, subspan_idx, total_subspans = match.group(1, 2, 3)
+
+        if eid not in self.entities:
+            if subspan_idx and subspan_idx != '1':
+                raise Reader.CorefFormatError(f"Non-first subspan of a discontinuous mention {eid} at "
+                                              f"{self.node_str(sentence, position)} does not have any previous mention.")
+            self.entities.add(eid)
+        self.referenced.discard(eid)
+
+        if subspan_idx and subspan_idx != '1':
+            opened = [m for m, _ in self.unfinished.get(eid, [])]
+            mention = next((m for m in self.discontinuous.get(eid, []) if m not in opened), None)
+            if mention is None:
+                raise Reader.CorefFormatError(f"Subspan {subspan_idx} of a discontinuous mention {eid} at "
+                                              f"{self.node_str(sentence, position)} does not have any previous subspan.")
+            if mention.doc is not doc:
+                raise Reader.CorefFormatError("Mention cannot cross a document boundary. The following does: "
+                                              + ", ".join(CorefUDMention.WordOrd.to_str(w)
+                                                          for w in mention.words + [position]))
+            mention.words.append(position)
+            if closing and subspan_idx == total_subspans:
+                if self.discontinuous[eid].pop() is not mention:
+                    raise Reader.CorefFormatError(f"{self.node_str(sentence, position)}: closing mention {eid}, "
+                                                  f"but it has an unfinished nested mention")
+                if not head_idx or head_idx > len(mention.words):
+                    raise Reader.CorefFormatError(f"Invalid head_idx={head_idx} for {eid} "
+                                                  f"closed at {self.node_str(sentence, position)}")
+                mention.head = mention.words[head_idx - 1]
+        else:
+            mention = _Mention(eid, position, doc)
+            doc.mentions.append(mention)
+            if subspan_idx:
+                self.discontinuous.setdefault(eid, []).append(mention)
+
+        if closing:
+            mention.closed = True
+        else:
+            mention.closed = False
+            self.unfinished.setdefault(eid, []).append((mention, head_idx))
+
+    def close_mention(self, chunk, position, positions, sentence):
+        if self.fields is not None and 'GRP' in self.fields:
+            if '-' in chunk:
+                raise Reader.CorefFormatError("Unexpected closing eid " + chunk)
+            chunk = self.grp_prefix + chunk
+
+        eid, subspan_idx, total_subspans = chunk, None, None
+        if chunk not in self.unfinished:
+            match = RE_DISCONTINUOUS.match(chunk)
+            if not match:
+                raise Reader.CorefFormatError(f"Mention {chunk} closed at {self.node_str(sentence, position)}, "
+                                              f"but not opened.")
+            eid, subspan_idx, total_subspans = match.group(1, 2, 3)
+        try:
+            mention, head_idx = self.unfinished.setdefault(eid, []).pop()
+        except IndexError:
+            raise Reader.CorefFormatError(f"Mention {chunk} closed at {self.node_str(sentence, position)}, "
+                                          f"but not opened.")
+        last_word = mention.sort_words()[-1]
+        if last_word // SENT_SCALE != position // SENT_SCALE:
+            raise Reader.CorefFormatError(f"Cross-sentence mentions not supported yet: {chunk} "
+                                          f"at {self.node_str(sentence, position)}")
+        for w in positions:
+            if w > last_word:
+                mention.words.append(w)
+                if w == position:
+                    break
+        if head_idx and (subspan_idx is None or subspan_idx == total_subspans):
+            words = mention.sort_words()
+            if head_idx > len(words):
+                raise Reader.CorefFormatError(f"Invalid head_idx={head_idx} for {eid} "
+                                              f"closed at {self.node_str(sentence, position)}")
+            mention.head = words[head_idx - 1]
+        if subspan_idx and subspan_idx == total_subspans:
+            if self.discontinuous[eid].pop() is not mention:
+                raise Reader.CorefFormatError(f"Closing mention {eid} at {self.node_str(sentence, position)}, "
+                                              f"but it has unfinished nested mentions")
+        mention.closed = True
+
+    def finish_document(self, doc):
+        entities = {}
+        for mention in doc.mentions:
+            if mention.closed:
+                entities.setdefault(mention.eid, []).append(mention)
+        for eid, mentions in entities.items():
+            mentions.sort(key=_Mention.sort_key)
+            if eid in self.entity_doc:
+                logging.warning(f"Cluster {eid} spans two documents ({self.entity_doc[eid]}, {doc.docid}). "
+                                f"It will be split.")
+            else:
+                self.entity_first[eid] = mentions[0].sort_key()
+            self.entity_doc[eid] = doc.docid
+
+        clusters = []
+        for eid in sorted(entities, key=self.entity_first.__getitem__):
+            clusters.append([self.get_mention(m, doc) for m in entities[eid]])
+        return Document(doc.docid, doc.sentences, clusters)
+
+    def get_mention(self, mention, doc):
+        head_deps = _parse_deps(doc.deps.get(mention.head), mention.head)
+        return CorefUDMention.from_positions(mention.words, mention.head, head_deps, matching=self.matching)
+
+    def finish_file(self):
+        for eid, mentions in self.unfinished.items():
+            for mention, _ in mentions:
+                logging.warning(f"Mention {eid} opened at {CorefUDMention.WordOrd.to_str(mention.head)}, "
+                                f"but not closed. Deleting.")
+        for eid in self.referenced:
+            raise Reader.CorefFormatError(f"Entity {eid} referenced in SplitAnte or Bridge, but not defined with Entity")
+
+
+class _DocumentState:
+    # a document being read
+    __slots__ = ('docid', 'sentences', 'mentions', 'deps')
+
+    def __init__(self, docid):
+        self.docid = docid
+        self.sentences = []
+        self.mentions = []
+        self.deps = {}
+
+
+def read_documents(file_path, matching="head"):
+    """Yields the documents (see Document) of a CoNLL-U file one by one, in the order of the file."""
+    return _Parser(matching).read(file_path)
@@ -1,16 +1,29 @@
 import logging
-from udapi.core.document import Document
-from udapi.block.read.conllu import Conllu
+from itertools import zip_longest
 from collections import defaultdict, OrderedDict
+from scorer.corefud.bundle import read_key_documents
+from scorer.corefud.conllu import read_documents
 from scorer.corefud.mention import CorefUDMention
-from scorer.base.reader import Reader
+from scorer.base.reader import CorefInfo, Reader
 
 
 
 
 class CorefUDReader(Reader):
 
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # "builtin" reads the files with scorer.corefud.conllu, "udapi" loads them as udapi documents
+        self.conllu_backend = kwargs.get("conllu_backend", "builtin")
+        # directory of the precompiled key files (see scorer.corefud.bundle), used by the built-in reader
+        self.key_bundle_dir = kwargs.get("key_bundle_dir", None)
+        # the key documents already read by the built-in reader, when many sys files are scored against one key
+        self.key_documents = kwargs.get("key_documents", None)
+
     def load_conllu(self, file_path):
+        # udapi is only needed by the udapi backend
+        from udapi.core.document import Document
+        from udapi.block.read.conllu import Conllu
         doc = Document()
         conllu_reader = Conllu(files=[file_path])
         conllu_reader.apply_on_document(doc)
@@ -72,27 +85,48 @@ class CorefUDReader(Reader):
         transformed_clusters = []
         for cluster in clusters.values():
             transformed_cluster = [CorefUDMention(m.words, m.head, matching=self.matching) for m in cluster]
-            # TODO: evaluator tests (TC-A-7.response) require to delete duplicate mention spans
-            transformed_cluster = list(OrderedDict.fromkeys(transformed_cluster))
-            transformed_clusters.append(transformed_cluster)
+            transformed_clusters.append(self.remove_duplicate_mentions(transformed_cluster))
         return transformed_clusters
 
-    def process_clusters(self, clusters):
-        removed_singletons = 0
-        removed_zeros = 0
-        processed_clusters = []
-        for cluster in clusters:
-            if not self.keep_singletons and len(cluster) == 1:
-                removed_singletons += 1
+    def remove_duplicate_mentions(self, cluster):
+        # TODO: evaluator tests (TC-A-7.response) require to delete duplicate mention spans
+        return list(OrderedDict.fromkeys(cluster))
+
+    def check_documents_alignment(self, key_doc, sys_doc):
+        for key_sentence, sys_sentence in zip(key_doc.sentences, sys_doc.sentences):
+            if key_sentence.newdoc != sys_sentence.newdoc:
+                raise self.DataAlignError(key_sentence, sys_sentence, "Newdoc labels")
+            if key_sentence.sent_id != sys_sentence.sent_id:
+                raise self.DataAlignError(key_sentence, sys_sentence, "Sent IDs")
+            # zeros may be positioned differently than in the key, only the forms of the words are compared
+            for i, (key_form, sys_form) in enumerate(zip(key_sentence.forms, sys_sentence.forms)):
+                if key_form != sys_form:
+                    raise self.DataAlignError(key_sentence.word_str(i), sys_sentence.word_str(i), "Words")
+
+    def get_doc_clusters(self, key_file, sys_file):
+        """Reads the key and sys files in parallel, yielding the docname and the key and sys clusters
+        of the documents one by one.
+        """
+        if self.key_documents is not None:
+            key_docs = self.key_documents
+        else:
+            key_docs = read_key_documents(key_file, matching=self.matching, bundle_dir=self.key_bundle_dir)
+        sys_docs = read_documents(sys_file, matching=self.matching)
+        for key_doc, sys_doc in zip_longest(key_docs, sys_docs):
+            if key_doc is None:
+                # the remaining documents of sys are ignored, but they still must be read in a correct format
                 continue
-            if not self.keep_zeros:
-                o_size = len(cluster)
-                cluster = [m for m in cluster if not m.is_zero]
-                removed_zeros+= o_size - len(cluster)
-            processed_clusters.append(cluster)
-        return processed_clusters, removed_singletons, removed_zeros
+            assert sys_doc is not None
+            self.check_documents_alignment(key_doc, sys_doc)
+            assert sys_doc.docid == key_doc.docid
+            # the sentences before the first newdoc do not belong to any document
+            if key_doc.docid is None and not key_doc.clusters and not sys_doc.clusters:
+                continue
+            yield (key_doc.docid,
+                   [self.remove_duplicate_mentions(cluster) for cluster in key_doc.clusters],
+                   [self.remove_duplicate_mentions(cluster) for cluster in sys_doc.clusters])
 
-    def get_coref_infos(self, key_file, sys_file):
+    def get_udapi_doc_clusters(self, key_file, sys_file):
         # loading the documents
         key_data = self.load_conllu(key_file)
         sys_data = self.load_conllu(sys_file)
@@ -107,28 +141,56 @@ class CorefUDReader(Reader):
 
         for docname in key_doc_clusters:
             assert docname in sys_doc_clusters
+            yield (docname,
+                   self.transform_clusters_for_eval(key_doc_clusters[docname]),
+                   self.transform_clusters_for_eval(sys_doc_clusters[docname]))
 
-            key_clusters = self.transform_clusters_for_eval(key_doc_clusters[docname])
-            sys_clusters = self.transform_clusters_for_eval(sys_doc_clusters[docname])
+    def process_clusters(self, clusters):
+        removed_singletons = 0
+        removed_zeros = 0
+        processed_clusters = []
+        for cluster in clusters:
+            if not self.keep_singletons and len(cluster) == 1:
+                removed_singletons += 1
+                continue
+            if not self.keep_zeros:
+                o_size = len(cluster)
+                cluster = [m for m in cluster if not m.is_zero]
+                removed_zeros+= o_size - len(cluster)
+            processed_clusters.append(cluster)
+        return processed_clusters, removed_singletons, removed_zeros
 
+    def get_docs(self, key_file, sys_file):
+        # the built-in reader always reads the files in parallel, udapi loads the whole files
+        if self.conllu_backend == "udapi":
+            doc_clusters = self.get_udapi_doc_clusters(key_file, sys_file)
+        else:
+            doc_clusters = self.get_doc_clusters(key_file, sys_file)
+
+        for docname, key_clusters, sys_clusters in doc_clusters:
             key_clusters, key_removed_singletons, key_removed_zeros = self.process_clusters(key_clusters)
             sys_clusters, sys_removed_singletons, sys_removed_zeros = self.process_clusters(sys_clusters)
-
-            key_mention_to_cluster, sys_mention_to_cluster, mention_alignment_dict, mention_aligns = self.get_mention_assignments(
-                key_clusters, sys_clusters)
-
-            # store the mention alignments so that it can be used for analysis
-            self._doc_mention_aligns[docname] = mention_aligns
-
-            # for an unknown reason, scorer.eval expects the tuple where
-            # key_mention_to_cluster and sys_mention_to_cluster are
-            # in the opposite order than key_cluster and sys_cluster
-            self._doc_coref_infos[docname] = (key_clusters, sys_clusters,
-                                              sys_mention_to_cluster, key_mention_to_cluster, mention_alignment_dict)
-            if not self.keep_singletons:
-                logging.debug(
-                    "Singletons removed: key={:d}, sys={:d}".format(key_removed_singletons, sys_removed_singletons))
-
-            if not self.keep_zeros:
-                logging.debug(
-                    "Zeros removed: key={:d}, sys={:d}".format(key_removed_zeros, sys_removed_zeros))
+            yield (docname, key_clusters, sys_clusters,
+                   (key_removed_singletons, sys_removed_singletons, key_removed_zeros, sys_removed_zeros))
+
+    def set_doc_infos(self, docname, key_clusters, sys_clusters, assignments, removed):
+        key_mention_to_cluster, sys_mention_to_cluster, mention_alignment_dict, mention_aligns = assignments
+        key_removed_singletons, sys_removed_singletons, key_removed_zeros, sys_removed_zeros = removed
+
+        # store the mention alignments so that it can be used for analysis
+        self._doc_mention_aligns[docname] = mention_aligns
+
+        # for an unknown reason, scorer.eval expects the tuple where
+        # key_mention_to_cluster and sys_mention_to_cluster are
+        # in the opposite order than key_cluster and sys_cluster
+        # the corefud format has no split antecedents
+        self._doc_coref_infos[docname] = CorefInfo(key_clusters, sys_clusters, sys_mention_to_cluster,
+                                                   key_mention_to_cluster, mention_alignment_dict,
+                                                   has_split_antecedents=False)
+        if not self.keep_singletons:
+            logging.debug(
+                "Singletons removed: key={:d}, sys={:d}".format(key_removed_singletons, sys_removed_singletons))
+
+        if not self.keep_zeros:
+            logging.debug(
+                "Zeros removed: key={:d}, sys={:d}".format(key_removed_zeros, sys_removed_zeros))
@@ -1,19 +1,21 @@
 from scorer.base.mention import Mention
 
 class UAMention(Mention):
+    __slots__ = ('_start_list', '_end_list', '_min')
+
     def __init__(self, start, end, MIN, is_referring, is_split_antecedent=False, split_antecedent_sets=set(),is_zero=False):
         super().__init__()
 
         if is_zero:
             assert(len(start)==len(end)==1)
             assert(start[0] == end[0])
-            self._words.append(start[0])
+            self._words = (start[0],)
+            # the (word index, zero index) pair of a zero is not a number, it is not handled as an interval
+            self._is_contiguous = False
         else:
-            for s, e in zip(start, end):
-                for w in range(s, e + 1):
-                    self._words.append(w)  # [s,e] both inclusive
-            self._words.sort()
-        self._wordsset = set(self._words)
+            # [s,e] both inclusive
+            self._words = tuple(sorted(w for s, e in zip(start, end) for w in range(s, e + 1)))
+        self._wordsset = frozenset(self._words)
         self._is_referring = is_referring
         self._is_split_antecedent = is_split_antecedent
         self._split_antecedent_sets = split_antecedent_sets
@@ -26,6 +28,19 @@ class UAMention(Mention):
         self._end_list = end
         self._min = MIN
 
+    def _word_str(self, w):
+        # zeros are (word index, zero index) pairs, written as in the files, e.g. 5.0
+        return '{}.{}'.format(*w) if isinstance(w, tuple) else str(w)
+
+    # the zeros of a word index come before the word, between it and the previous word
+    @staticmethod
+    def word_position(w):
+        return w[0] - 1 / (w[1] + 2) if isinstance(w, tuple) else w
+
+    def fingerprint(self):
+        return super().fingerprint() + (tuple(self._start_list), tuple(self._end_list),
+                                        tuple(self._min) if self._min else None)
+
     # CRAFT (with craft tag) same as the CRAFT 2019 CR task that use the first key span as the MIN and any
     #             response that overlapping with the MIN (start>=MIN[0] and end <=MIN[1]) will receive a
     #             non-zero similarity score otherwise a zero will be returned.
@@ -36,5 +51,16 @@ class UAMention(Mention):
         if self._minset:
             for s, e in zip(other._start_list, other._end_list):
                 if s >= self._min[0] and e <= self._min[1]:
-                    return len(self._wordsset & other._wordsset) * 1.0 / len(self._wordsset)
+                    return self.intersection_size(other) * 1.0 / len(self._wordsset)
         return 0.0
+
+    # the sys mentions are indexed by the starts of their spans, which must lie within the key MIN
+    def match_index_keys(self, matching):
+        if matching == "partial-craft":
+            return [] if self.is_zero else self._start_list
+        return super().match_index_keys(matching)
+
+    def match_lookup_keys(self, matching):
+        if matching == "partial-craft":
+            return [] if self.is_zero else self._minset
+        return super().match_lookup_keys(matching)
@@ -0,0 +1,67 @@
+"""Paired significance tests of the difference between two submissions scored against the same ground truth.
+
+The ground truth is read once and both submissions are evaluated once, keeping the counts of the metrics on
+every document; the approximate randomization and the paired bootstrap tests (see scorer.eval.significance)
+then only sum up the counts of the documents.
+
+	python significance_test.py ground_truth.conllu submission_a.conllu submission_b.conllu -n 10000
+"""
+import argparse
+import contextlib
+import io
+import json
+import sys
+
+import evaluate_corefud
+from scorer.eval.significance import format_significance_tests, significance_tests
+
+
+def compare_submissions(ref_file, pred_file_a, pred_file_b, n_samples=10000, seed=None, jobs=1,
+						key_bundle_dir=evaluate_corefud.KEY_BUNDLE_DIR, count_cache_dir=None):
+	"""Returns the metrics (as returned by call_scorer) of both submissions and the results of the significance tests
+	of their differences (a - b) by the name of the metric, see scorer.eval.significance.significance_tests.
+	"""
+	# the message about the evaluated metrics is not printed, only the results are
+	with contextlib.redirect_stdout(io.StringIO()):
+		results = evaluate_corefud.call_scorer_batch(ref_file, [pred_file_a, pred_file_b], jobs=jobs,
+													 key_bundle_dir=key_bundle_dir, result_cache_dir=None,
+													 count_cache_dir=count_cache_dir, return_doc_counts=True)
+	for pred_file, (metrics, _) in zip([pred_file_a, pred_file_b], results):
+		if "error" in metrics:
+			raise ValueError(f"{pred_file} cannot be scored: {metrics['error']}")
+	(metrics_a, doc_counts_a), (metrics_b, doc_counts_b) = results
+	return metrics_a, metrics_b, significance_tests(doc_counts_a, doc_counts_b, n_samples=n_samples, seed=seed)
+
+
+def main():
+	argparser = argparse.ArgumentParser(description="Paired significance tests of the difference between two CorefUD "
+													"submissions")
+	argparser.add_argument('ref_file', type=str, help='path to the ground truth file')
+	argparser.add_argument('pred_file_a', type=str, help='path to the first prediction file')
+	argparser.add_argument('pred_file_b', type=str, help='path to the second prediction file')
+	argparser.add_argument('-n', '--samples', type=int, default=10000, help='number of samples of both tests')
+	argparser.add_argument('--seed', type=int, default=None, help='random seed of the samples')
+	argparser.add_argument('-j', '--jobs', type=int, default=1, help='number of processes scoring the submissions')
+	argparser.add_argument('--key-bundle-dir', type=str, default=evaluate_corefud.KEY_BUNDLE_DIR,
+						   help='directory of the precompiled ground truth files (see scorer.corefud.bundle)')
+	argparser.add_argument('--count-cache-dir', type=str, default=None,
+						   help='directory to cache the counts of single documents in (see result_cache); '
+								'not cached if not given')
+	argparser.add_argument('--json', action='store_true', help='print the metrics and the p-values as JSON')
+	args = argparser.parse_args()
+
+	try:
+		metrics_a, metrics_b, results = compare_submissions(
+			args.ref_file, args.pred_file_a, args.pred_file_b, n_samples=args.samples, seed=args.seed, jobs=args.jobs,
+			key_bundle_dir=args.key_bundle_dir, count_cache_dir=args.count_cache_dir)
+	except ValueError as e:
+		sys.exit(f"Error: {e}")
+	if args.json:
+		json.dump({"metrics_a": metrics_a, "metrics_b": metrics_b, "tests": results}, sys.stdout, indent=2)
+		sys.stdout.write("\n")
+	else:
+		print(format_significance_tests(results))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,31 @@
+import os
+import sys
+import zipfile
+
+import pytest
+
+EVAL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the tests import the scorer package as the scripts of the evaluation directory do
+sys.path.insert(0, EVAL_DIR)
+
+
+@pytest.fixture(scope="session")
+def sample_files(tmp_path_factory):
+    """Paths of the ground truth and the submission of the bundled sample zips."""
+    directory = tmp_path_factory.mktemp("samples")
+    paths = []
+    for name in ("sample_ground_truth.zip", "sample_submission.zip"):
+        with zipfile.ZipFile(os.path.join(EVAL_DIR, name)) as archive:
+            member = archive.namelist()[0]
+            archive.extract(member, str(directory))
+        paths.append(str(directory / member))
+    return paths
+
+
+@pytest.fixture
+def write_conllu(tmp_path):
+    def write(text, name="doc.conllu"):
+        path = tmp_path / name
+        path.write_text(text, encoding="utf-8")
+        return str(path)
+    return write
@@ -0,0 +1,28 @@
+"""The SloBENCH glue code (evaluate.py) on the bundled sample files."""
+import os
+import re
+import shutil
+
+import pytest
+
+import evaluate
+
+
+def test_sample_submission(sample_files):
+    ground_truth, submission = sample_files
+    assert os.path.dirname(ground_truth) == os.path.dirname(submission)
+    metrics = evaluate.evaluate(os.path.dirname(ground_truth), os.path.dirname(submission))
+    assert 0 <= metrics["conll"] <= 1
+
+
+def test_malformed_submission_raises_exception(sample_files, tmp_path):
+    ground_truth, submission = sample_files
+    with open(submission, encoding="utf-8") as f:
+        text = f.read()
+    # the first opened mention is closed instead, without being opened
+    malformed, count = re.subn(r"Entity=\([^\t\n|]*", "Entity=e99)", text, count=1)
+    assert count == 1
+    (tmp_path / "submission.conllu").write_text(malformed, encoding="utf-8")
+
+    with pytest.raises(Exception, match="Exception in metric calculation: Mention e99 closed"):
+        evaluate.evaluate(os.path.dirname(ground_truth), str(tmp_path))
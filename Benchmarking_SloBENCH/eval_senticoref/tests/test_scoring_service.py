@@ -0,0 +1,32 @@
+"""Invalid requests to the scoring service are answered with an error, and the connection stays open."""
+import asyncio
+import json
+
+from scoring_service import ScoringService
+
+
+async def send_requests(service, socket_path, lines):
+    server = await asyncio.start_unix_server(service.handle_connection, path=socket_path)
+    async with server:
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+        responses = []
+        for line in lines:
+            writer.write(line.encode("utf-8") + b"\n")
+            await writer.drain()
+            responses.append(json.loads(await reader.readline()))
+        writer.close()
+        return responses
+
+
+def test_invalid_requests(tmp_path):
+    service = ScoringService(jobs=1)
+    try:
+        responses = asyncio.run(send_requests(service, str(tmp_path / "service.sock"), [
+            "[1, 2]", '"x"', "not json", "{}", '{"ref_file": "key.conllu"}',
+            '{"ref_file": "key.conllu", "pred_text": 1}']))
+    finally:
+        service.close()
+    assert [list(response) for response in responses] == [["error"]] * 6
+    assert responses[0]["error"] == responses[1]["error"] == "Invalid request: expected a JSON object"
+    assert responses[3]["error"] == "Missing ref_file"
+    assert responses[4]["error"] == "Missing pred_file or pred_text"